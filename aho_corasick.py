@@ -0,0 +1,112 @@
+"""
+Aho-Corasick Matcher
+
+Finds which of many patterns (e.g. all job titles of a book) occur in a line, in one scan over the line,
+instead of testing every pattern with 'pattern in line'. The automaton is built once from the pattern list.
+
+- build_automaton builds the automaton: a trie of the patterns with failure links.
+- find_longest returns the longest pattern that occurs in a line. When several patterns of that length occur,
+  the one that comes first in the pattern list is returned, the same as
+  max([pattern for pattern in patterns if pattern in line], key=len).
+
+Example:
+    automaton = build_automaton(job_list)
+    for line in lines:
+        job = find_longest(automaton, line)
+
+Functions:
+    - build_automaton: Builds the automaton from a list of patterns.
+    - find_longest: Returns the longest pattern that occurs in a text.
+"""
+
+from collections import deque
+
+
+def build_automaton(patterns):
+	"""
+	Builds the automaton from a list of patterns. Building takes time linear in the total length of the patterns.
+
+	Args:
+		patterns (list): The patterns (strings). An empty pattern occurs in every text.
+
+	Returns:
+		dict: The automaton, with the keys:
+			"goto": list of dictionaries (one per state) from a character to the next state,
+			"fail": list with the failure link of every state,
+			"best": list with, for every state, the index of the best pattern that ends there (or None),
+			"patterns": the pattern list.
+	"""
+	goto = [{}]
+	fail = [0]
+	best = [None]
+
+	def better(first, second):
+		# The longer pattern, or the earlier one if they are equally long
+		if first is None:
+			return second
+		if second is None:
+			return first
+		if len(patterns[first]) != len(patterns[second]):
+			return first if len(patterns[first]) > len(patterns[second]) else second
+		return min(first, second)
+
+	for index, pattern in enumerate(patterns):
+		state = 0
+		for character in pattern:
+			next_state = goto[state].get(character)
+			if next_state is None:
+				next_state = len(goto)
+				goto[state][character] = next_state
+				goto.append({})
+				fail.append(0)
+				best.append(None)
+			state = next_state
+		best[state] = better(best[state], index)
+
+	# Breadth-first, so the failure link of a state is done before its children
+	queue = deque(goto[0].values())
+	while queue:
+		state = queue.popleft()
+		best[state] = better(best[state], best[fail[state]])
+		for character, child in goto[state].items():
+			link = fail[state]
+			while character not in goto[link] and link != 0:
+				link = fail[link]
+			fail[child] = goto[link].get(character, 0) if state != 0 else 0
+			queue.append(child)
+
+	return {"goto": goto, "fail": fail, "best": best, "patterns": patterns}
+
+
+def find_longest(automaton, text):
+	"""
+	Returns the longest pattern that occurs in a text, in one scan over the text.
+
+	Args:
+		automaton (dict): The automaton as returned by build_automaton.
+		text (str): The text to search.
+
+	Returns:
+		str: The longest pattern that occurs in the text (the first in the pattern list if several are equally long),
+			or None if no pattern occurs.
+	"""
+	goto = automaton["goto"]
+	fail = automaton["fail"]
+	best = automaton["best"]
+	patterns = automaton["patterns"]
+
+	found = best[0]
+	found_length = len(patterns[found]) if found is not None else -1
+	state = 0
+	for character in text:
+		while character not in goto[state] and state != 0:
+			state = fail[state]
+		state = goto[state].get(character, 0)
+		candidate = best[state]
+		if candidate is not None:
+			length = len(patterns[candidate])
+			if length > found_length or (length == found_length and candidate < found):
+				found = candidate
+				found_length = length
+
+	return patterns[found] if found is not None else None
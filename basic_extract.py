@@ -1,48 +1,7 @@
-import json
 import re
 from tqdm import tqdm
 
-
-def load_json(path_to_json):
-	"""
-	Opens a JSON file and returns its content as a dictionary.
-
-	Args:
-		path_to_json (str): The path to the JSON file.
-
-	Returns:
-		dict: Parsed JSON data.
-	"""
-	try:
-		with open(path_to_json, 'r') as f:
-			data = json.load(f)
-		return data
-	except (FileNotFoundError, json.JSONDecodeError) as e:
-		print(f"Error loading JSON file: {e}")
-		return None
-
-
-def get_text(data, first_page, last_page):
-	"""
-	Extracts text content from specified pages in the JSON data.
-
-	Args:
-		data (dict): JSON data containing the content.
-		first_page (int): Starting page number (inclusive).
-		last_page (int): Ending page number (inclusive).
-
-	Returns:
-		list: Text from the specified pages.
-    """
-	first_page_index = first_page -1
-	last_page_index = last_page
-	text_list = []
-
-	for page in data['content'][first_page_index:last_page_index]:
-		text = page['text'].replace('-\n', '')
-		text_list.append(text)
-
-	return text_list
+from pages import iter_text
 
 
 def check_for_person(sentence):
@@ -259,13 +218,12 @@ def process_sentences(sentences):
 year = "1911"
 path_to_json = f"book_text/{year}.json"
 
-data = load_json(path_to_json)
 first_page, last_page = 107, 414
 
-if data:
+if __name__ == "__main__":
 	person_list = []
-	text_list = get_text(data, first_page, last_page)
-	for index, page in tqdm(enumerate(text_list), total=len(text_list), ncols=100, unit='page', desc='Processing Pages'):
+	text_pages = iter_text(path_to_json, first_page, last_page)
+	for index, page in tqdm(enumerate(text_pages), total=last_page - first_page + 1, ncols=100, unit='page', desc='Processing Pages'):
 		print(f'Page: {first_page + index}')
 		text = page.replace('\n\n', '\n')
 		line_list = text.split('\n')
@@ -0,0 +1,228 @@
+"""
+LLM Client Benchmark Script
+
+This script measures the throughput of the client side of the LLM extraction (llm_client.extract_records, as used by
+extract_with_llm.py and split_on_housenumbers.py) for a matrix of concurrency levels and batch sizes. It runs against
+the mock server (mock_llm_server.py), started in this process, so it needs no GPU; with --url it runs against a real
+server instead. For every combination it reports records per second, the number of requests the server received
+and the wall clock time (and with --adaptive the concurrency limit that llm_client.AdaptiveLimiter ended at).
+With --endpoints N it starts N mock servers (or takes a comma separated list of --url) and spreads the requests over
+them with endpoint_pool.EndpointPool, which prints the requests per endpoint at the end of every run.
+
+The records are the register lines of a book (--book), or generated register lines with a fixed seed. The lines of a
+book are prepared with the same normalizer and split as in extract_with_llm.py, but with a simpler line filter than
+its get_page_lines (no combining of broken lines, no length limit), so the records are close to, not the same as,
+the records of an extraction run. The prompts are also a short stand-in for the prompts of the extractors. Both keep
+this script free of the imports of the extractors (llama_index, pandas); the throughput of the client does not
+depend on them, but the token counts of a real server do.
+
+Usage:
+    python benchmark_llm.py [--book book_text/1926.json] [--concurrency 1,8,32,64] [--batch-sizes 1,8]
+    python benchmark_llm.py --latency 1.0 --capacity 32 --error-rate 0.01
+    python benchmark_llm.py --endpoints 3 --concurrency 32,96
+
+Modules:
+    - asyncio: For running the extraction.
+    - threading: For running the mock server next to the benchmark.
+    - time: For measuring wall clock time.
+
+Functions:
+    - generate_records: Generates register lines.
+    - load_records: Returns the register lines of a book.
+    - run_extraction: Extracts the persons of the records, a page at a time, and measures it.
+    - benchmark_matrix: Runs every combination and prints the results.
+"""
+
+import argparse
+import asyncio
+import functools
+import random
+import threading
+import time
+
+import llm_client
+import mock_llm_server
+import prompt_builder
+import router
+from line_normalizer import normalize_register_line
+from register_lexer import split_by_initials_with_context
+
+
+SURNAMES = ['Jansen', 'Vries', 'Bakker', 'Dijk', 'Meer', 'Smit', 'Boer', 'Mulder', 'Bos', 'Vos', 'Ploeg', 'Wal']
+PREFIXES = ['', '', '', ' de', ' v. d.', ' van']
+JOBS = ['bakker', 'koopman', 'werkman', 'smid', 'timmerman', 'wed.', 'kantoorbed.', '']
+STREETS = ['Hoofdstraat', 'Zuiderdiep', 'Verl. Hereweg', 'O. Ebbingestr.', 'Gebr. Bakkerstraat', 'Oosterstraat']
+
+# Short stand-ins for the prompts of the extractors, see the module docstring
+SYSTEM = "You are an archive expert and your task is to extract the name, job title and address from register lines."
+HUMAN_TEMPLATE = """Please extract the relavent information from the given record.
+    Record: {record}
+    """
+
+# Number of records per page, the unit that the extractors hand to extract_records
+PAGE_SIZE = 60
+
+
+def generate_records(count, seed=0):
+	"""
+	Generates register lines, some of them with OCR damage.
+
+	Args:
+		count (int): Number of lines.
+		seed (int): Seed of the random generator.
+
+	Returns:
+		list: The lines.
+	"""
+	rng = random.Random(seed)
+	records = []
+	for _ in range(count):
+		initials = ' '.join(f'{rng.choice("ABCDEGHJKLMPRSTW")}.' for _ in range(rng.randint(1, 3)))
+		job = rng.choice(JOBS)
+		record = f'{rng.choice(SURNAMES)} ({initials}{rng.choice(PREFIXES)}) {job + ", " if job else ""}{rng.choice(STREETS)} {rng.randint(1, 150)}.'
+		if rng.random() < 0.2:
+			# OCR damage: a lost parenthesis or a character read wrongly
+			position = rng.randrange(len(record))
+			record = record[:position] + rng.choice(['', '1', ')', ',']) + record[position + 1:]
+		records.append(record)
+	return records
+
+
+def load_records(path_to_json):
+	"""
+	Returns the register lines of a book: the lines with a '(' and a digit, normalized with normalize_register_line and
+	split with split_by_initials_with_context. extract_with_llm.get_page_lines also combines broken lines and leaves
+	out very long ones, so its records can differ from these.
+
+	Args:
+		path_to_json (str): The path to the JSON file of the book.
+
+	Returns:
+		list: The lines.
+	"""
+	from pages import iter_text, REGISTER
+
+	records = []
+	for page in iter_text(path_to_json, normalizers=REGISTER):
+		for line in page.split('\n'):
+			if '(' in line and any(char.isdigit() for char in line):
+				line = normalize_register_line(line)
+				records.extend(split_by_initials_with_context(line) or [line])
+	return records
+
+
+async def run_extraction(records, base_urls, concurrency, batch_size, structured=False, use_router=False, adaptive=False):
+	"""
+	Extracts the persons of the records, a page of PAGE_SIZE records at a time with llm_client.PAGE_WINDOW pages in
+	progress, like the extractors do.
+
+	Args:
+		records (list): The records.
+		base_urls (list): The OpenAI compatible base URLs of the servers.
+		concurrency (int): Maximum number of requests in flight.
+		batch_size (int): Number of records per request.
+		structured (bool): Use the structured output mode.
+		use_router (bool): Parse the records by rules first.
+		adaptive (bool): Adjust the number of requests in flight to the load, with concurrency as its maximum.
+
+	Returns:
+		tuple: The number of persons, the wall clock time in seconds and the final concurrency limit.
+	"""
+	client = llm_client.make_async_client(base_urls, 'EMPTY')
+	if adaptive:
+		semaphore = llm_client.AdaptiveLimiter(min(llm_client.INITIAL_CONCURRENCY, concurrency), maximum=concurrency)
+	else:
+		semaphore = asyncio.Semaphore(concurrency)
+	prompts = prompt_builder.build_prompts(SYSTEM, HUMAN_TEMPLATE)
+	ask = functools.partial(
+		llm_client.extract_records, client, prompts, semaphore=semaphore, parse=llm_client.parse_objects,
+		batch_size=batch_size, structured=structured
+	)
+
+	async def extract_page(page_records):
+		if use_router:
+			return await router.extract_routed(page_records, ask)
+		return await ask(page_records)
+
+	pages = [records[start:start + PAGE_SIZE] for start in range(0, len(records), PAGE_SIZE)]
+	persons = 0
+	start = time.perf_counter()
+	async for page_persons in llm_client.map_ordered(extract_page, pages, llm_client.PAGE_WINDOW):
+		persons += sum(len(record_persons) for record_persons in page_persons)
+	elapsed = time.perf_counter() - start
+	if len(base_urls) > 1:
+		client.report()
+	await client.close()
+	return persons, elapsed, semaphore.limit if adaptive else concurrency
+
+
+def benchmark_matrix(records, base_urls, concurrency_levels, batch_sizes, servers=(), structured=False, use_router=False, adaptive=False):
+	"""
+	Runs every combination of concurrency and batch size and prints the results.
+
+	Args:
+		records (list): The records.
+		base_urls (list): The OpenAI compatible base URLs of the servers.
+		concurrency_levels (list): The concurrency levels.
+		batch_sizes (list): The batch sizes.
+		servers (list): The mock servers, to count their requests (optional).
+		structured (bool): Use the structured output mode.
+		use_router (bool): Parse the records by rules first.
+		adaptive (bool): Adjust the number of requests in flight to the load (the concurrency is the maximum).
+
+	Returns:
+		list: (concurrency, batch size, records per second) tuples.
+	"""
+	results = []
+	print(f'{"concurrency":>12}{"batch":>8}{"requests":>10}{"persons":>10}{"time":>10}{"records/s":>12}{"limit":>8}')
+	for batch_size in batch_sizes:
+		for concurrency in concurrency_levels:
+			requests_before = sum(server.requests for server in servers)
+			persons, elapsed, limit = asyncio.run(run_extraction(records, base_urls, concurrency, batch_size, structured, use_router, adaptive))
+			requests = f'{sum(server.requests for server in servers) - requests_before}' if servers else '-'
+			rate = len(records) / elapsed if elapsed > 0 else float('inf')
+			print(f'{concurrency:>12}{batch_size:>8}{requests:>10}{persons:>10}{elapsed:>9.2f}s{rate:>12.1f}{limit:>8.1f}')
+			results.append((concurrency, batch_size, rate))
+	return results
+
+
+def _int_list(text):
+	return [int(part) for part in text.split(',') if part.strip()]
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='Benchmarks the LLM client against the mock server.', parents=[mock_llm_server.get_parser()], conflict_handler='resolve')
+	parser.add_argument('--url', help='OpenAI compatible base URL of a running server, instead of the mock server (comma separated for several servers)')
+	parser.add_argument('--endpoints', type=int, default=1, help='number of mock servers to spread the requests over')
+	parser.add_argument('--book', help='JSON file of a book to take the records from, instead of generated records')
+	parser.add_argument('--records', type=int, default=1000, help='number of generated records')
+	parser.add_argument('--concurrency', type=_int_list, default=[1, 8, 32, 64])
+	parser.add_argument('--batch-sizes', type=_int_list, default=[1, 8])
+	parser.add_argument('--structured', action='store_true', help='use the structured output mode')
+	parser.add_argument('--router', action='store_true', help='parse the records by rules first')
+	parser.add_argument('--adaptive', action='store_true', help='adjust the concurrency to the load, up to --concurrency')
+	parser.add_argument('--port', type=int, default=0, help='port of the mock server, 0 for a free port')
+	parser.add_argument('--latency', type=float, default=0.2, help='typical base latency of a request in seconds')
+	options = parser.parse_args()
+
+	records = load_records(options.book) if options.book else generate_records(options.records, options.seed)
+	print(f'{len(records)} records')
+
+	servers = []
+	if options.url:
+		base_urls = [url.strip() for url in options.url.split(',') if url.strip()]
+	else:
+		for index in range(options.endpoints):
+			# Every server gets its own seed, so they do not fail on the same requests
+			server = mock_llm_server.make_server(argparse.Namespace(**{**vars(options), 'seed': options.seed + index}))
+			threading.Thread(target=server.serve_forever, daemon=True).start()
+			servers.append(server)
+		base_urls = [f'http://{options.host}:{server.server_address[1]}/v1/' for server in servers]
+		print(f'{len(servers)} mock server(s): {options.distribution} latency {options.latency}s, capacity {options.capacity}')
+
+	try:
+		benchmark_matrix(records, base_urls, options.concurrency, options.batch_sizes, servers, options.structured, options.router, options.adaptive)
+	finally:
+		for server in servers:
+			server.shutdown()
+			server.server_close()
@@ -0,0 +1,137 @@
+"""
+Line Normalizer Benchmark Script
+
+This script checks the chains of line_normalizer.py against the original helpers of extract_with_llm.py and
+split_on_housenumbers.py (copied below as they were, with a re.sub per step), on every line of a book, and reports
+lines per second for both. It stops with an error if a chain gives a different result for any line.
+
+Usage:
+    python benchmark_normalize.py [path_to_json] [repeat]
+
+Modules:
+    - time: For measuring wall clock time.
+
+Functions:
+    - register_chain: The original chain of helpers of extract_with_llm.py.
+    - housenumber_chain: The original chain of helpers of split_on_housenumbers.py.
+    - check_identical: Checks that a chain gives the same output as the original helpers.
+    - lines_per_second: Measures the throughput of a chain.
+"""
+
+import re
+import sys
+import time
+
+from line_normalizer import remove_phone_numbers, normalize_register_line, normalize_housenumber_line
+from pages import iter_text, REGISTER
+
+
+def _add_spaces(sentence):
+	sentence = re.sub(r'(?<=[.])(?=[^\s])', r' ', sentence)
+	sentence = re.sub(r'\s+', ' ', sentence)
+	return sentence
+
+
+def _dot_initials(string):
+	return re.sub(r'(?<=[A-Z])(?!\.)\b', '.', _add_spaces(string))
+
+
+def _fix_initials_dot(line):
+	return re.sub(r'\b([A-Z])([a-z])\b', r'\1.', line)
+
+
+def _clean_initials_in_parentheses(text):
+	text = re.sub(r'\s*\)\s*', ')', text)
+	text = re.sub(r'(\.\s*)(?=\))', '.', text)
+	text = re.sub(r'\(\s*([A-Z])\.(?=\s)(?!\))', r'(\1.)', text)
+	text = re.sub(r'\(\s*([A-Z]\.\s*)+[A-Z]\.(?=\s|$)(?!\))', r'(\g<0>)', text)
+	text = re.sub(r'\(\s+([A-Z])\.', r'(\1.', text)
+	return text
+
+
+def _remove_false_parenthesis(text):
+	text = re.sub(r'\(\s*\)', '(', text)
+	text = re.sub(r'([A-Z])\.\s*\)(?=\s+[A-Z])', r'\1.', text)
+	return text
+
+
+def _replace_digits_parentheses(text):
+	return re.sub(r'\(.*[134].*\)', lambda match: match.group(0).replace('1', 'J.').replace('3', 'J').replace('4', 'J'), text)
+
+
+def register_chain(line):
+	return _remove_false_parenthesis(_clean_initials_in_parentheses(_dot_initials(_fix_initials_dot(line))))
+
+
+def housenumber_chain(line):
+	line_dotted = _dot_initials(line)
+	line_starts_with_letter = re.sub(r'^[^a-zA-Z]+', '', line_dotted)
+	return _replace_digits_parentheses(line_starts_with_letter)
+
+
+def check_identical(lines, chain, fused_chain):
+	"""
+	Checks that a chain gives the same output as the original helpers for every line.
+
+	Args:
+		lines (list): The input lines.
+		chain (function): The original chain of helpers.
+		fused_chain (function): The chain of line_normalizer.py.
+
+	Returns:
+		int: Number of lines that differ (the first ones are printed).
+	"""
+	differences = 0
+	for line in lines:
+		expected, result = chain(line), fused_chain(line)
+		if expected != result:
+			if differences < 10:
+				print(f'Difference for {line!r}: {expected!r} != {result!r}')
+			differences += 1
+	return differences
+
+
+def lines_per_second(lines, chain, repeat=5):
+	"""
+	Measures the throughput of a chain, as the best of several runs over all lines.
+
+	Args:
+		lines (list): The input lines.
+		chain (function): The chain to measure.
+		repeat (int): Number of runs.
+
+	Returns:
+		float: Lines per second.
+	"""
+	best = float('inf')
+	for _ in range(repeat):
+		start = time.perf_counter()
+		for line in lines:
+			chain(line)
+		best = min(best, time.perf_counter() - start)
+	return len(lines) / best if best > 0 else float('inf')
+
+
+if __name__ == "__main__":
+	path_to_json = sys.argv[1] if len(sys.argv) > 1 else "book_text/1926.json"
+	repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+	lines = [line for page in iter_text(path_to_json, normalizers=REGISTER) for line in page.split('\n') if line.strip()]
+	housenumber_lines = [remove_phone_numbers(line.strip()) for line in lines]
+	if not lines:
+		sys.exit(f'No lines in {path_to_json}')
+	print(f'{len(lines)} lines from {path_to_json}')
+
+	differences = check_identical(lines, register_chain, normalize_register_line)
+	differences += check_identical(housenumber_lines, housenumber_chain, normalize_housenumber_line)
+	if differences:
+		sys.exit(f'{differences} lines differ')
+
+	print(f'{"chain":<24}{"original":>16}{"normalizer":>16}{"speedup":>10}')
+	for name, line_list, chain, fused_chain in (
+		("extract_with_llm", lines, register_chain, normalize_register_line),
+		("split_on_housenumbers", housenumber_lines, housenumber_chain, normalize_housenumber_line)
+	):
+		original = lines_per_second(line_list, chain, repeat)
+		normalizer = lines_per_second(line_list, fused_chain, repeat)
+		print(f'{name:<24}{original:>12.0f} l/s{normalizer:>12.0f} l/s{normalizer / original:>9.2f}x')
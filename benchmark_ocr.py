@@ -0,0 +1,285 @@
+"""
+OCR Benchmark Script
+
+This script measures what the Tesseract engine mode (--oem), the model choice (tessdata_fast vs tessdata_best) and the
+OCR dictionary (user-words and user-patterns, see ocr_dictionary.py) cost and gain us. A fixed sample of pages is OCR'd
+with every combination and for each combination it reports:
+- pages per second (wall clock)
+- CPU seconds per page (of the Tesseract processes, including all their threads)
+- character error rate (CER) against the checked-in ground truth, computed line by line
+
+Ground truth:
+    ground_truth/
+        ├── README.md
+        ├── images/
+        │   └── sample_register_page.png
+        └── sample_register_page.txt
+
+    Every .txt file is the manual transcription of the image with the same name (without extension)
+    in the images directory that is benchmarked. The sample register page is checked in with its image,
+    so the benchmark runs out of the box. Transcriptions of book pages are added next to it, named after
+    their image (see ground_truth/README.md).
+
+Modules:
+    - pytesseract: For performing OCR on images.
+    - difflib: For aligning the lines of the OCR output with the ground truth.
+    - rapidfuzz: For a fast edit distance (optional, falls back to a pure Python implementation).
+    - resource: For measuring the CPU time of the Tesseract processes (not available on Windows).
+    - time: For measuring wall clock time.
+
+Functions:
+    - load_ground_truth: Loads the transcriptions and matches them with the images.
+    - normalize_whitespace: Collapses all whitespace to single spaces before comparing texts.
+    - text_lines: Splits a text into its non-empty, whitespace normalized lines.
+    - edit_distance: Computes the Levenshtein distance between two strings.
+    - character_error_rate: Computes the CER of an OCR result against its ground truth.
+    - benchmark_combination: OCRs the page sample with one combination of engine mode and model.
+    - benchmark_matrix: Runs every combination and prints the results.
+"""
+
+import difflib
+import os
+import re
+import time
+
+import pytesseract
+from PIL import Image
+
+try:
+	import resource
+except ImportError:  # Windows
+	resource = None
+
+try:
+	from rapidfuzz.distance import Levenshtein
+except ImportError:
+	Levenshtein = None
+
+import ocr  # Sets the path to the Tesseract executable
+from ocr_dictionary import build_dictionary
+
+
+def load_ground_truth(path_to_ground_truth, path_to_images_directory):
+	"""
+	Loads the transcriptions and matches them with the images in the images directory.
+
+	Args:
+		path_to_ground_truth (str): Directory with one .txt transcription per image.
+		path_to_images_directory (str): Directory with the images to benchmark.
+
+	Returns:
+		list: Tuples (path to image, ground truth text), sorted by filename.
+	"""
+	images = {os.path.splitext(filename)[0]: filename for filename in os.listdir(path_to_images_directory)}
+	samples = []
+
+	for filename in sorted(os.listdir(path_to_ground_truth)):
+		name, extension = os.path.splitext(filename)
+		if extension != '.txt':
+			continue
+		if name not in images:
+			print(f"Warning: No image found for {filename}")
+			continue
+		with open(os.path.join(path_to_ground_truth, filename), 'r', encoding='utf-8') as f:
+			samples.append((os.path.join(path_to_images_directory, images[name]), f.read()))
+
+	return samples
+
+
+def normalize_whitespace(text):
+	"""
+	Collapses all whitespace (spaces, newlines, form feeds) to single spaces.
+
+	Args:
+		text (str): The input text.
+
+	Returns:
+		str: Text with normalized whitespace.
+	"""
+	return re.sub(r'\s+', ' ', text).strip()
+
+
+def text_lines(text):
+	"""
+	Splits a text into its non-empty lines, with normalized whitespace.
+
+	Args:
+		text (str): The input text.
+
+	Returns:
+		list: The lines.
+	"""
+	return [line for line in map(normalize_whitespace, text.split('\n')) if line]
+
+
+def edit_distance(reference, hypothesis):
+	"""
+	Computes the Levenshtein distance (insertions, deletions and substitutions) between two strings.
+
+	Args:
+		reference (str): The reference string.
+		hypothesis (str): The string to compare with the reference.
+
+	Returns:
+		int: Minimum number of edits to turn hypothesis into reference.
+	"""
+	if Levenshtein is not None:
+		return Levenshtein.distance(reference, hypothesis)
+	if len(reference) < len(hypothesis):
+		reference, hypothesis = hypothesis, reference
+
+	previous_row = list(range(len(hypothesis) + 1))
+	for i, reference_char in enumerate(reference, 1):
+		current_row = [i]
+		for j, hypothesis_char in enumerate(hypothesis, 1):
+			current_row.append(min(
+				previous_row[j] + 1,
+				current_row[j - 1] + 1,
+				previous_row[j - 1] + (reference_char != hypothesis_char)
+			))
+		previous_row = current_row
+
+	return previous_row[-1]
+
+
+def character_error_rate(reference, hypothesis):
+	"""
+	Computes the character error rate of an OCR result against its ground truth.
+
+	The lines of both texts are aligned first (identical lines match, the others are paired in order within a
+	changed block) and the edit distance is summed over the line pairs, so the cost grows with the length of the
+	lines instead of the square of the page. A missing or extra line counts all of its characters.
+
+	Args:
+		reference (str): Ground truth text.
+		hypothesis (str): OCR output.
+
+	Returns:
+		float: Edit distance divided by the length of the ground truth (without line breaks).
+	"""
+	reference_lines = text_lines(reference)
+	hypothesis_lines = text_lines(hypothesis)
+	length = sum(len(line) for line in reference_lines)
+	if not length:
+		return float(bool(hypothesis_lines))
+
+	errors = 0
+	matcher = difflib.SequenceMatcher(None, reference_lines, hypothesis_lines, autojunk=False)
+	for tag, reference_start, reference_end, hypothesis_start, hypothesis_end in matcher.get_opcodes():
+		if tag == 'equal':
+			continue
+		reference_block = reference_lines[reference_start:reference_end]
+		hypothesis_block = hypothesis_lines[hypothesis_start:hypothesis_end]
+		for i in range(max(len(reference_block), len(hypothesis_block))):
+			reference_line = reference_block[i] if i < len(reference_block) else ''
+			hypothesis_line = hypothesis_block[i] if i < len(hypothesis_block) else ''
+			errors += edit_distance(reference_line, hypothesis_line)
+
+	return errors / length
+
+
+def _children_cpu_seconds():
+	if resource is None:
+		return None
+	usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+	return usage.ru_utime + usage.ru_stime
+
+
+def benchmark_combination(samples, oem, tessdata_directory, language="nld", config="3", dictionary=None):
+	"""
+	OCRs the page sample with one combination of engine mode and model.
+
+	Args:
+		samples (list): Tuples (path to image, ground truth text) as returned by load_ground_truth.
+		oem (str): OCR engine mode passed to Tesseract as --oem.
+		tessdata_directory (str): Directory with the traineddata files of the model.
+		language (str): Language code for OCR (default is Dutch "nld").
+		config (str): Page segmentation mode passed to Tesseract as --psm.
+		dictionary (tuple): Paths to the user-words and user-patterns files, or None to OCR without them.
+
+	Returns:
+		dict: "pages_per_second", "cpu_seconds_per_page" (None if it cannot be measured) and "cer"
+			(mean over the pages), or "error" if Tesseract failed.
+	"""
+	user_words, user_patterns = dictionary if dictionary is not None else (None, None)
+	configuration = ocr.make_configuration(config, user_words, user_patterns) + f' --oem {oem} --tessdata-dir "{tessdata_directory}"'
+	images = [(Image.open(path_to_image), ground_truth) for path_to_image, ground_truth in samples]
+
+	cpu_start = _children_cpu_seconds()
+	wall_start = time.perf_counter()
+	try:
+		texts = [pytesseract.image_to_string(image, lang=language, config=configuration) for image, _ in images]
+	except pytesseract.TesseractError as e:
+		return {"error": str(e).strip()}
+	wall_seconds = time.perf_counter() - wall_start
+	cpu_end = _children_cpu_seconds()
+
+	error_rates = [character_error_rate(ground_truth, text) for (_, ground_truth), text in zip(images, texts)]
+
+	return {
+		"pages_per_second": len(images) / wall_seconds,
+		"cpu_seconds_per_page": (cpu_end - cpu_start) / len(images) if cpu_start is not None else None,
+		"cer": sum(error_rates) / len(error_rates)
+	}
+
+
+def benchmark_matrix(path_to_images_directory, path_to_ground_truth, models, oems=("1",), language="nld", config="3", dictionary=None):
+	"""
+	Runs the page sample through every combination of engine mode and model and prints the results.
+
+	Args:
+		path_to_images_directory (str): Directory with the images to benchmark.
+		path_to_ground_truth (str): Directory with one .txt transcription per benchmarked image.
+		models (dict): Model name mapped to its tessdata directory, e.g. {"fast": "tessdata_fast"}.
+		oems (list): OCR engine modes to benchmark. Mode 3 (default) picks the LSTM engine (mode 1) for the
+			tessdata_fast and tessdata_best models, so only modes 0 and 2 (which need a model with the legacy
+			engine) add a comparison.
+		language (str): Language code for OCR (default is Dutch "nld").
+		config (str): Page segmentation mode passed to Tesseract as --psm.
+		dictionary (tuple): Paths to the user-words and user-patterns files. If given, every combination is also
+			run with them. Use an oem that applies them (0 or 2, with a model that has the legacy engine).
+
+	Returns:
+		list: One result dictionary per combination, with the keys "model", "oem" and "dictionary" added.
+	"""
+	samples = load_ground_truth(path_to_ground_truth, path_to_images_directory)
+	if not samples:
+		print(f"No ground truth found in {path_to_ground_truth}")
+		return []
+
+	print(f'Benchmarking {len(samples)} pages')
+	print(f'{"model":<10}{"oem":<6}{"dict":<6}{"pages/sec":>12}{"cpu s/page":>12}{"CER":>10}')
+
+	dictionaries = [None, dictionary] if dictionary is not None else [None]
+	results = []
+	for model, tessdata_directory in models.items():
+		for oem in oems:
+			for used_dictionary in dictionaries:
+				result = benchmark_combination(samples, oem, tessdata_directory, language, config, used_dictionary)
+				with_dictionary = used_dictionary is not None
+				result.update({"model": model, "oem": oem, "dictionary": with_dictionary})
+				results.append(result)
+
+				label = 'yes' if with_dictionary else 'no'
+				if "error" in result:
+					print(f'{model:<10}{oem:<6}{label:<6}  failed: {result["error"]}')
+					continue
+				cpu = f'{result["cpu_seconds_per_page"]:.2f}' if result["cpu_seconds_per_page"] is not None else 'n/a'
+				print(f'{model:<10}{oem:<6}{label:<6}{result["pages_per_second"]:>12.3f}{cpu:>12}{result["cer"]:>10.2%}')
+
+	return results
+
+
+if __name__ == "__main__":
+	models = {
+		"fast": "C:/Program Files/Tesseract-OCR/tessdata_fast",
+		"best": "C:/Program Files/Tesseract-OCR/tessdata_best"
+	}
+	path_to_images_directory = "ground_truth/images"
+	path_to_ground_truth = "ground_truth"
+	benchmark_matrix(path_to_images_directory, path_to_ground_truth, models)
+
+	# The dictionary only applies to the legacy and combined engines, which need the standard tessdata model
+	dictionary = build_dictionary("tessdata_user")
+	legacy_models = {"standard": "C:/Program Files/Tesseract-OCR/tessdata"}
+	benchmark_matrix(path_to_images_directory, path_to_ground_truth, legacy_models, oems=("0", "2"), dictionary=dictionary)
@@ -187,17 +187,18 @@ def process_directory(path_to_directory, threshold=160, crop_fraction=0):
 		#print(f"Processed and saved: {output_file_path}")
        
 
-threshold = 158
-crop_fraction = 0.025
+if __name__ == "__main__":
+	threshold = 158
+	crop_fraction = 0.025
 
-# Process one image
-path_to_image = "data/1854/images/1854_page_0043.jpg"
-#process_image(path_to_image, threshold, crop_fraction)
+	# Process one image
+	path_to_image = "data/1854/images/1854_page_0043.jpg"
+	#process_image(path_to_image, threshold, crop_fraction)
 
-# Process images in one directory
-path_to_directory = "data/1931"
-process_directory(path_to_directory, threshold, crop_fraction)
+	# Process images in one directory
+	path_to_directory = "data/1931"
+	process_directory(path_to_directory, threshold, crop_fraction)
 
-# Process images in all directories
-root_directory = "data"
-#process_images_in_directory(root_directory, threshold, crop_fraction)
\ No newline at end of file
+	# Process images in all directories
+	root_directory = "data"
+	#process_images_in_directory(root_directory, threshold, crop_fraction)
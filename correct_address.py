@@ -1,5 +1,5 @@
 from fuzzywuzzy import process
-import json
+import json_backend
 
 
 def open_json(path_to_json):
@@ -13,10 +13,8 @@ def open_json(path_to_json):
 		dict: Parsed JSON data.
 	"""
 	try:
-		with open(path_to_json, 'r') as f:
-			data = json.load(f)
-		return data
-	except (FileNotFoundError, json.JSONDecodeError) as e:
+		return json_backend.load(path_to_json)
+	except (FileNotFoundError, json_backend.JSONDecodeError) as e:
 		print(f"Error opening or parsing JSON file: {e}")
 		return None
 
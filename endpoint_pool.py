@@ -0,0 +1,187 @@
+"""
+Endpoint Pool
+
+We run a vLLM replica on every GPU machine, but the extractors talk to a single BASEURL, so the year ranges had to
+be split over the replicas by hand. This module spreads the requests of one run over a list of endpoints:
+
+- EndpointPool has the same chat.completions.create as the async OpenAI client, so it can be used wherever
+  llm_client.py takes a client (llm_client.make_async_client returns one for a list of URLs).
+- Least outstanding requests: every request goes to the healthy endpoint with the fewest requests in flight, so
+  a faster replica gets more of the work.
+- Failover: a request that fails with a connection error, a timeout or a 429/5xx status is sent to another endpoint
+  right away (at most once to every endpoint). A connection error marks the endpoint unhealthy at once, other
+  failures after UNHEALTHY_AFTER failures in a row. When all endpoints failed, the error goes to the caller (and
+  the retries with backoff of llm_client.py).
+- Health checks: every HEALTH_INTERVAL seconds a background task asks every endpoint for its models (GET /v1/models),
+  so an endpoint that is down is taken out before a request fails on it, and one that is back is used again.
+
+Example:
+    pool = EndpointPool(['http://gpu1:8000/v1/', 'http://gpu2:8000/v1/'])
+    completion = await pool.chat.completions.create(model=MODEL, messages=messages)
+    pool.report()
+    await pool.close()
+
+Modules:
+    - asyncio: For the health checks.
+    - openai: For the async OpenAI compatible clients of the endpoints.
+
+Classes:
+    - Endpoint: An endpoint with its client and counters.
+    - EndpointPool: Spreads the requests over the endpoints.
+"""
+
+import asyncio
+import logging
+from types import SimpleNamespace
+
+import openai
+from openai import AsyncOpenAI
+
+
+# Seconds between health checks, and the timeout of a check
+HEALTH_INTERVAL = 10.0
+HEALTH_TIMEOUT = 5.0
+# Number of failures in a row after which an endpoint is taken out until it passes a health check
+UNHEALTHY_AFTER = 2
+# Status codes after which the request is sent to another endpoint
+FAILOVER_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+
+class Endpoint:
+	"""
+	An endpoint with its client, the number of requests in flight and its health.
+	"""
+
+	def __init__(self, base_url, api_key, timeout=None):
+		self.base_url = base_url
+		self.client = AsyncOpenAI(base_url=base_url, api_key=api_key, max_retries=0, timeout=timeout)
+		self.outstanding = 0
+		self.requests = 0
+		self.failures = 0
+		self.consecutive_failures = 0
+		self.healthy = True
+
+	def mark_failure(self, connection_error=False):
+		self.failures += 1
+		self.consecutive_failures += 1
+		if self.healthy and (connection_error or self.consecutive_failures >= UNHEALTHY_AFTER):
+			logger.warning(f'Endpoint {self.base_url} is unhealthy')
+			self.healthy = False
+
+	def mark_success(self):
+		self.consecutive_failures = 0
+		if not self.healthy:
+			logger.warning(f'Endpoint {self.base_url} is healthy again')
+			self.healthy = True
+
+
+class EndpointPool:
+	"""
+	Spreads requests over several OpenAI compatible endpoints, with least outstanding requests balancing, failover
+	and health checks. Has the chat.completions.create of the async OpenAI client.
+	"""
+
+	def __init__(self, base_urls, api_key='EMPTY', timeout=None, health_interval=HEALTH_INTERVAL):
+		if not base_urls:
+			raise ValueError('An endpoint pool needs at least one URL')
+		self.endpoints = [Endpoint(base_url, api_key, timeout) for base_url in base_urls]
+		self.health_interval = health_interval
+		self._health_task = None
+		self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+	def _choose(self, tried):
+		candidates = [endpoint for endpoint in self.endpoints if endpoint not in tried]
+		healthy = [endpoint for endpoint in candidates if endpoint.healthy]
+		# When no endpoint is healthy the health checks may be behind, so every endpoint is tried
+		candidates = healthy or candidates
+		if not candidates:
+			return None
+		return min(candidates, key=lambda endpoint: (endpoint.outstanding, endpoint.requests))
+
+	async def create(self, **kwargs):
+		"""
+		Sends a chat completion request to the endpoint with the fewest requests in flight, and to the next one if
+		it fails.
+
+		Args:
+			**kwargs: The arguments of chat.completions.create.
+
+		Returns:
+			ChatCompletion: The completion.
+
+		Raises:
+			openai.OpenAIError: When the request failed on every endpoint, or with an error that is not failed over.
+		"""
+		self._start_health_checks()
+		tried = []
+		while True:
+			endpoint = self._choose(tried)
+			tried.append(endpoint)
+			endpoint.outstanding += 1
+			endpoint.requests += 1
+			try:
+				completion = await endpoint.client.chat.completions.create(**kwargs)
+			except (openai.APIConnectionError, openai.APIStatusError) as error:
+				connection_error = isinstance(error, openai.APIConnectionError) and not isinstance(error, openai.APITimeoutError)
+				status_code = getattr(error, 'status_code', None)
+				if not connection_error and not isinstance(error, openai.APITimeoutError) and status_code not in FAILOVER_STATUS_CODES:
+					raise
+				# A busy endpoint (429) is not unhealthy
+				if status_code != 429:
+					endpoint.mark_failure(connection_error)
+				if self._choose(tried) is None:
+					raise
+				logger.info(f'Request failed on {endpoint.base_url} ({error.__class__.__name__}), trying another endpoint')
+				continue
+			finally:
+				endpoint.outstanding -= 1
+			endpoint.mark_success()
+			return completion
+
+	async def check_health(self):
+		"""
+		Asks every endpoint for its models, and marks it healthy or unhealthy.
+		"""
+		async def check(endpoint):
+			try:
+				await asyncio.wait_for(endpoint.client.models.list(), HEALTH_TIMEOUT)
+			except (openai.OpenAIError, asyncio.TimeoutError):
+				if endpoint.healthy:
+					logger.warning(f'Endpoint {endpoint.base_url} failed its health check')
+				endpoint.healthy = False
+			else:
+				endpoint.mark_success()
+
+		await asyncio.gather(*(check(endpoint) for endpoint in self.endpoints))
+
+	async def _health_checks(self):
+		while True:
+			await self.check_health()
+			await asyncio.sleep(self.health_interval)
+
+	def _start_health_checks(self):
+		if self._health_task is None or self._health_task.done():
+			self._health_task = asyncio.ensure_future(self._health_checks())
+
+	def report(self):
+		"""
+		Prints the number of requests and failures of every endpoint.
+		"""
+		for endpoint in self.endpoints:
+			state = 'healthy' if endpoint.healthy else 'unhealthy'
+			print(f'{endpoint.base_url}: {endpoint.requests} requests, {endpoint.failures} failures ({state})')
+
+	async def close(self):
+		"""
+		Stops the health checks and closes the clients.
+		"""
+		if self._health_task is not None:
+			self._health_task.cancel()
+			try:
+				await self._health_task
+			except asyncio.CancelledError:
+				pass
+		for endpoint in self.endpoints:
+			await endpoint.client.close()
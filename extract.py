@@ -1,22 +1,32 @@
-import json
+import os
 import re
+from itertools import islice
 
-f = open('text/1968.json', 'r')
-data = json.load(f)
-f.close()
+from aho_corasick import build_automaton, find_longest
+import json_backend
+from pages import iter_pages, RAW
 
-job_list = []
 
-register_data = {
-	'year':1968,
-	'register': []
-}
+# Number of pages whose job titles are collected before the automaton is rebuilt, when reading in one pass
+ONLINE_BATCH_PAGES = 16
 
-register = []
 
-for i in data['content']:
-	print(i['page'])
-	text = i['text']
+def get_page_jobs(page):
+	"""
+	Collects the job titles that occur on one page.
+
+	A job is the second (or third) comma separated item of a register line, if it is longer than 3 letters,
+	does not contain digits, does not start with an uppercase letter and consists of fewer than 4 words.
+
+	Args:
+		page (dict): Page object with the key "text".
+
+	Returns:
+		list: Job titles as they occur on the page, not cleaned (see clean_job_list).
+	"""
+	job_list = []
+
+	text = page['text']
 	text = text.replace('-\n', '') # Replace -\n to combine seperated words again
 	text_list = text.split('\n\n') # Split on double newline
 	text_list = [i for i in text_list if i] # Filter out the empty strings
@@ -41,45 +51,229 @@ for i in data['content']:
 					if len(job) > 3 and not any(chr.isdigit() for chr in job) and len(job.split()) < 4: # if more than 3 letters and no uppercase, this is a job
 						job_list.append(job)
 
-job_list = set(job_list)
-job_list = [re.sub(r'^[^a-zA-Z]+', '', string) for string in job_list]
-job_list = sorted(job_list, key=str.lower)
+	return job_list
+
+
+def clean_job_list(job_list):
+	"""
+	Removes duplicates and leading non-letters from job titles and sorts them.
+
+	Args:
+		job_list (iterable): Job titles as returned by get_page_jobs.
+
+	Returns:
+		list: Sorted list of unique job titles.
+	"""
+	job_list = set(job_list)
+	job_list = [re.sub(r'^[^a-zA-Z]+', '', string) for string in job_list]
+	job_list = sorted(job_list, key=str.lower)
+
+	return job_list
+
+
+def get_job_list(pages):
+	"""
+	Collects the job titles that occur in a book.
+
+	Args:
+		pages (iterable): Page objects of the book, e.g. data['content'] or pages.iter_pages(...).
+
+	Returns:
+		list: Sorted list of unique job titles.
+	"""
+	job_list = []
+
+	for i in pages:
+		print(i['page'])
+		job_list.extend(get_page_jobs(i))
+
+	return clean_job_list(job_list)
+
+
+def get_vocabulary_path(path_to_json):
+	"""
+	Returns the path of the cached job titles of a book, e.g. 'text/1968.jobs.txt'.
+
+	Args:
+		path_to_json (str): The path to the JSON file.
+
+	Returns:
+		str: Path to the vocabulary file.
+	"""
+	return os.path.splitext(path_to_json)[0] + '.jobs.txt'
+
+
+def load_job_list(path_to_json, path_to_vocabulary=None):
+	"""
+	Returns the job titles of a book from its vocabulary file, one job title per line. The file is
+	(re)built with get_job_list if it does not exist or is older than the JSON file.
+
+	Args:
+		path_to_json (str): The path to the JSON file.
+		path_to_vocabulary (str): Path to the vocabulary file, by default the one returned by get_vocabulary_path.
+
+	Returns:
+		list: Sorted list of unique job titles.
+	"""
+	if path_to_vocabulary is None:
+		path_to_vocabulary = get_vocabulary_path(path_to_json)
+
+	if os.path.exists(path_to_vocabulary) and os.path.getmtime(path_to_vocabulary) >= os.path.getmtime(path_to_json):
+		with open(path_to_vocabulary, 'r', encoding='utf-8') as f:
+			return f.read().split('\n')[:-1]
+
+	job_list = get_job_list(iter_pages(path_to_json, normalizers=RAW))
+	with open(path_to_vocabulary, 'w', encoding='utf-8') as f:
+		f.write(''.join(job + '\n' for job in job_list))
+	return job_list
+
+
+def extract_person(line, automaton):
+	"""
+	Extracts a person from a line by looking up the known job titles in it.
 
-outfile = open('register/register_1968.json', 'a+')
+	The longest job title found in the line splits it into the name (before the job) and the address (after the job).
 
-for i in data['content']:
-	print(i['page'])
-	text = i['text'].replace('-\n', '')
+	Args:
+		line (str): A line of the register.
+		automaton (dict): Automaton of the job titles, as returned by aho_corasick.build_automaton.
+
+	Returns:
+		dict: Person object, or None if the line has no job title or no house number in its address.
+	"""
+	present_job = find_longest(automaton, line) # Longest job title in the line, the first one in job_list if several are equally long
+	if present_job is None:
+		return None
+
+	start_index = line.find(present_job)
+	end_index = start_index + len(present_job)
+	name = line[:start_index]
+	name = re.sub(r'[^a-zA-Z\. ]', '', name)
+	name = name.strip()
+	address = line[end_index:]
+	address = address.replace(',', '.')
+	address = address.strip('.').strip()
+	address = re.sub(r'[^a-zA-Z\.\- 0-9]', '', address)
+	jobTitle = re.sub(r'[^a-zA-Z\.\- ]', '', present_job)
+
+	person = {
+				'@context': 'https://schema.org',
+				'@type': 'Person'
+			}
+
+	person['address'] = address
+	person['name'] = name
+	person['jobTitle'] = jobTitle
+	if any(chr.isdigit() for chr in address):
+		return person
+	return None
+
+
+def get_lines(page):
+	"""
+	Returns the non-empty lines of a page, with hyphenated words joined.
+
+	Args:
+		page (dict): Page object with the key "text".
+
+	Returns:
+		list: The lines of the page.
+	"""
+	text = page['text'].replace('-\n', '')
 	text_list = text.split('\n')
-	text_list = [i for i in text_list if i] # Filter out the empty strings
-	for line in text_list:
-		present_job = [job for job in job_list if job in line]
-		if len(present_job) >= 1:
-			present_job = max(present_job, key=len)
-			start_index = line.find(present_job)
-			if start_index != -1:
-				end_index = start_index + len(present_job)
-				name = line[:start_index]
-				name = re.sub(r'[^a-zA-Z\. ]', '', name)
-				name = name.strip()
-				address = line[end_index:]
-				address = address.replace(',', '.')
-				address = address.strip('.').strip()
-				address = re.sub(r'[^a-zA-Z\.\- 0-9]', '', address)
-				jobTitle = re.sub(r'[^a-zA-Z\.\- ]', '', present_job)
-
-				person = {
-							'@context': 'https://schema.org',
-							'@type': 'Person'
-						}
-				
-				person['address'] = address
-				person['name'] = name
-				person['jobTitle'] = jobTitle
-				if any(chr.isdigit() for chr in address):
-					register.append(person)
-
-register_data['register'] = register
-json_data = json.dumps(register_data, indent=4)
-outfile.write(json_data)
-outfile.close()
\ No newline at end of file
+	return [i for i in text_list if i] # Filter out the empty strings
+
+
+def extract_register(pages, job_list):
+	"""
+	Extracts the persons from a book by looking up the known job titles in every line.
+	Only persons with a house number in their address are kept.
+
+	Args:
+		pages (iterable): Page objects of the book, e.g. data['content'] or pages.iter_pages(...).
+		job_list (list): Job titles as returned by get_job_list.
+
+	Returns:
+		list: Person objects.
+	"""
+	return list(stream_register(pages, job_list))
+
+
+def stream_register(pages, job_list=None, batch_pages=ONLINE_BATCH_PAGES):
+	"""
+	Extracts the persons from a book in one pass, a batch of pages at a time.
+
+	Without a job list, the job titles are collected while reading: the job titles of a batch of pages are added
+	before its lines are matched, so a line is matched against the job titles of its own batch and all batches
+	before it. The automaton is rebuilt at most once per batch, not for every page that adds a job title. This can
+	miss a job title that only occurs later in the book, in exchange for reading the book once.
+
+	Args:
+		pages (iterable): Page objects of the book, e.g. pages.iter_pages(...).
+		job_list (list): Job titles as returned by get_job_list or load_job_list, None to collect them while reading.
+		batch_pages (int): Number of pages per batch when the job titles are collected while reading.
+
+	Yields:
+		dict: Person objects, in the order of the book.
+	"""
+	if job_list is not None:
+		automaton = build_automaton(job_list)
+		for i in pages:
+			print(i['page'])
+			for line in get_lines(i):
+				person = extract_person(line, automaton)
+				if person is not None:
+					yield person
+		return
+
+	jobs = set()
+	automaton = None
+	iterator = iter(pages)
+	while True:
+		batch = list(islice(iterator, batch_pages))
+		if not batch:
+			return
+		new_jobs = set()
+		for i in batch:
+			new_jobs.update(get_page_jobs(i))
+		new_jobs -= jobs
+		if new_jobs or automaton is None:
+			jobs |= new_jobs
+			automaton = build_automaton(clean_job_list(jobs))
+		for i in batch:
+			print(i['page'])
+			for line in get_lines(i):
+				person = extract_person(line, automaton)
+				if person is not None:
+					yield person
+
+
+def write_jsonl(persons, path_to_jsonl):
+	"""
+	Writes persons to a JSON Lines file (one JSON object per line) as they come, replacing the file.
+
+	Args:
+		persons (iterable): Person objects.
+		path_to_jsonl (str): Path to the output file.
+
+	Returns:
+		int: Number of persons written.
+	"""
+	count = 0
+	with open(path_to_jsonl, 'w', encoding='utf-8') as outfile:
+		for person in persons:
+			outfile.write(json_backend.dumps(person) + '\n')
+			count += 1
+	return count
+
+
+if __name__ == "__main__":
+	path_to_json = 'text/1968.json'
+	# Collect the job titles while reading instead of using the cached vocabulary (text/1968.jobs.txt)
+	online = False
+
+	job_list = None if online else load_job_list(path_to_json)
+
+	# One pass over the pages, the persons are written as they are found
+	count = write_jsonl(stream_register(iter_pages(path_to_json, normalizers=RAW), job_list), 'register/register_1968.jsonl')
+	print(f'Amount of people extracted: {count}')
@@ -1,71 +1,11 @@
-import json
 import re
 
+from line_normalizer import normalize_register_line
+from pages import iter_text, REGISTER
+from register_lexer import split_by_name, split_by_initials_with_context
 
-def load_json(path_to_json):
-	"""
-	Opens a JSON file and returns its content as a dictionary.
-
-	Args:
-		path_to_json (str): The path to the JSON file.
-
-	Returns:
-		dict: Parsed JSON data.
-	"""
-	try:
-		with open(path_to_json, 'r') as f:
-			data = json.load(f)
-		return data
-	except (FileNotFoundError, json.JSONDecodeError) as e:
-		print(f"Error loading JSON file: {e}")
-		return None
-
-
-def get_text(data, first_page, last_page):
-	"""
-	Extracts text content from specified pages in the JSON data.
-
-	Args:
-		data (dict): JSON data containing the content.
-		first_page (int): Starting page number (inclusive).
-		last_page (int): Ending page number (inclusive).
-
-	Returns:
-		list: Text from the specified pages.
-    """
-	first_page_index = first_page -1
-	last_page_index = last_page
-	text_list = []
-
-	for page in data['content'][first_page_index:last_page_index]:
-		text = page['text'].replace('-\n', '')
-		text = text.replace('{', '(')
-		text = text.replace('}', ')')
-		text = text.replace('Mej.', '')
-		text = text.replace('Wed.', '')
-		text_list.append(text)
-
-	return text_list
-
-
-def dot_initials(string):
-	return re.sub(r'(?<=[A-Z])(?!\.)\b', '.', add_spaces(string))
-
-
-def add_spaces(sentence):
-    """
-    Adds spaces after periods if missing.
-
-    Args:
-        sentence (str): The input sentence.
 
-    Returns:
-        str: Formatted sentence with proper spacing.
-    """
-    sentence = re.sub(r'(?<=[.])(?=[^\s])', r' ', sentence)
-    sentence = re.sub(r'\s+', ' ', sentence)
-    
-    return sentence
+STRIP_PATTERN = re.compile(r"[^a-zA-Z0-9\s,.\n'-]")
 
 
 def strip_text(text):
@@ -78,26 +18,7 @@ def strip_text(text):
 	Returns:
 		str: Cleaned text.
 	"""
-	regex = re.compile("[^a-zA-Z0-9\s,.\n'-]")
-	return regex.sub('', text)
-
-
-def fix_initials_dot(line):
-	"""
-    Fixes initials by adding a period after the first capital letter.
-
-    This function searches for pairs of an uppercase letter followed by a lowercase letter 
-    (e.g., "A" followed by "b") in a string and adds a period after the uppercase letter, 
-    effectively converting them into initials (e.g., "A." for "Ab").
-
-    Args:
-        line (str): The input string, which may contain initials or names.
-
-    Returns:
-        str: The string with corrected initials, where a period is added after the first capital letter.
-    """
-	pattern = r'\b([A-Z])([a-z])\b'
-	return re.sub(pattern, r'\1.', line)
+	return STRIP_PATTERN.sub('', text)
 
 
 def find_initials(name):
@@ -219,57 +140,6 @@ def add_parenthesis_to_last_initial(text):
 	return re.sub(pattern_with_no_paren, r'\1.)', text)
 
 
-def clean_initials_in_parentheses(text):
-	"""
-    Cleans up initials inside parentheses by removing extra spaces and fixing formatting issues.
-
-    This function addresses several common formatting problems with initials inside parentheses:
-    - It removes any spaces before a closing parenthesis that appears after initials.
-    - It ensures there is no space between a period and a closing parenthesis in initials.
-    - It properly formats initials inside parentheses by removing unnecessary spaces and adding the closing parenthesis where needed.
-    - It corrects instances where parentheses around initials are poorly formatted.
-
-    Args:
-        text (str): The input text containing initials inside parentheses.
-
-    Returns:
-        str: The cleaned-up text with properly formatted initials inside parentheses.
-    """
-	# Remove spaces before closing parenthesis after initials
-	text = re.sub(r'\s*\)\s*', ')', text)
-
-	# Remove space between period and closing parenthesis in initials
-	text = re.sub(r'(\.\s*)(?=\))', '.', text)
-
-	# Add closing parenthesis only after initials or sequence of initials preceded by '('
-	text = re.sub(r'\(\s*([A-Z])\.(?=\s)(?!\))', r'(\1.)', text)  # For single initials
-	text = re.sub(r'\(\s*([A-Z]\.\s*)+[A-Z]\.(?=\s|$)(?!\))', r'(\g<0>)', text)  # For multiple initials
-
-	# Remove whitespace before an initial if preceded by '('
-	text = re.sub(r'\(\s+([A-Z])\.', r'(\1.', text)
-
-	return text
-
-def remove_false_parenthesis(text):
-	"""
-    Removes false or misplaced parentheses from the input text.
-
-    This function addresses specific cases where parentheses are incorrectly placed:
-    - It removes empty parentheses `()` that are used incorrectly, replacing them with just a single opening parenthesis `(`.
-    - It removes closing parentheses `)` that appear immediately after initials without proper context.
-
-    Args:
-        text (str): The input text containing misplaced or false parentheses.
-
-    Returns:
-        str: The cleaned text with false parentheses removed or corrected.
-    """
-	text = re.sub(r'\(\s*\)', '(', text)  # Remove `)` if only preceded by a `(`
-	text = re.sub(r'([A-Z])\.\s*\)(?=\s+[A-Z])', r'\1.', text)  # Remove `)` between initials
-
-	return text
-
-
 def split_by_initials(text):
 	"""
 	Splits the input text into segments based on surnames and initials within parentheses.
@@ -301,60 +171,6 @@ def split_by_initials(text):
 	return results
 
 
-def split_by_name(text):
-	"""
-    Splits the text by name and the remainder after the name.
-
-    Args:
-        text (str): The input text.
-
-    Returns:
-        tuple: A tuple with two lists: one for names and one for the rest of the text.
-    """
-	pattern = r'([A-Za-zÀ-ÿ]+(?:\s?\([^\)]*\)))\s*(.*?)(?=[A-Za-zÀ-ÿ]+\s?\([^\)]*\)|$)'
-
-    # Find all matches (each match will be a tuple: (name, remainder))
-	matches = re.findall(pattern, text)
-
-	name = [match[0].strip() for match in matches]
-	# Return a list of the remainders without the names
-	remainders = [match[1].strip() for match in matches]
-
-	return name, remainders
-
-
-def split_by_initials_with_context(text):
-	"""
-    Splits the text by surname and initials, while preserving context.
-
-    Args:
-        text (str): The input text.
-
-    Returns:
-        list: List of segments split by surname-initial pairs.
-    """
-    # Define a regex pattern to capture surname-initial pairs
-	pattern = r'([A-Za-zÀ-ÿ]+(?:\s?\([^\)]*\)))[^A-Za-zÀ-ÿ]*'
-    
-    # Find all matches for names (surnames followed by initials)
-	matches = re.finditer(pattern, text)
-    
-    # Store the start and end positions of each match
-	spans = [(match.start(), match.end()) for match in matches]
-
-	# Extract corresponding sentences for each match
-	segments = []
-	for i, (start, end) in enumerate(spans):
-		# Start of current match
-		name = text[start:end]
-		# End at the start of the next match or the end of the text
-		next_start = spans[i + 1][0] if i + 1 < len(spans) else len(text)
-		# Append the text from the current match to the next match
-		segments.append(text[start:next_start].strip())
-
-	return segments
-
-
 def find_prefixes(text):
 	"""
     Finds prefixes such as 'v.', 'dt.', etc., in a name and returns the relevant section.
@@ -385,17 +201,14 @@ def find_prefixes(text):
 year = "1927"
 path_to_json = f"book_text/{year}.json"
 
-# Load the JSON data from the specified path
-data = load_json(path_to_json)
 first_page, last_page = 125, 610
 
-# Proceed if data is loaded successfully
-if data:
-    # Get text from specified pages
-    text_list = get_text(data, first_page, last_page)
+if __name__ == "__main__":
+    # Stream the cleaned text of the specified pages
+    text_pages = iter_text(path_to_json, first_page, last_page, normalizers=REGISTER)
 
     # Process each page
-    for index, page in enumerate(text_list):
+    for index, page in enumerate(text_pages):
         page_lines = []
         print(f'Page: {index + first_page}')
         
@@ -410,17 +223,9 @@ if data:
         # Combine strings with initials and process them
         complete_lines = combine_strings_with_initial(line_list)
 
-        # Further processing: fixing initials and handling lines with digits
-        complete_lines_with_digits = [
-            dot_initials(fix_initials_dot(line)) for line in complete_lines if any(char.isdigit() for char in line)
-        ]
-
-        # Clean up initials and handle false parentheses
-        new_lines = [
-            clean_initials_in_parentheses(line) for line in complete_lines_with_digits
-        ]
+        # Further processing of the lines with digits: fixing initials, cleaning up initials and handling false parentheses
         new_lines = [
-            remove_false_parenthesis(line) for line in new_lines
+            normalize_register_line(line) for line in complete_lines if any(char.isdigit() for char in line)
         ]
 
         # Split the lines based on initials with context
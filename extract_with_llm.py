@@ -5,6 +5,16 @@ from tqdm import tqdm
 from openai import Client,OpenAI
 import json
 import re
+import asyncio
+import functools
+
+import llm_client
+import prompt_builder
+import response_cache
+import router
+from line_normalizer import normalize_register_line
+from register_lexer import split_by_initials_with_context
+from pages import iter_text, REGISTER
 
 def System_Message(jsonschema):
     system_template = """
@@ -47,14 +57,15 @@ def System_Message(jsonschema):
     return evaluated_system_prompt
 
 
-def Human_Message(record):
-
-    template = """jsonschema,
-    Record: {record}
-
+# The record comes last, so everything before it is the same for every request (see prompt_builder.py)
+HUMAN_TEMPLATE = """jsonschema,
     Please extract the relavent information from the given record.
+    Record: {record}
     """
-    prompt = PromptTemplate(template)
+
+
+def Human_Message(record):
+    prompt = PromptTemplate(HUMAN_TEMPLATE)
     
     evaluated_human_prompt = prompt.format(
                         record = record
@@ -63,14 +74,16 @@ def Human_Message(record):
     return evaluated_human_prompt
 
 
-def ask_llama(system, user):
+def ask_llama(system, user, response_format=None):
 	messages = [{"role": "system", "content": system},
 				{"role":"user","content":user}]
+	options = {"response_format": response_format} if response_format is not None else {}
 
 
 	completion = client.chat.completions.create(
 		model=MODEL, 
-		messages=messages
+		messages=messages,
+		**options
 	)
 
 	return completion.choices[0].message.content
@@ -101,70 +114,10 @@ schema = """
     """
 
 
-def load_json(path_to_json):
-	"""
-	Opens a JSON file and returns its content as a dictionary.
-
-	Args:
-		path_to_json (str): The path to the JSON file.
-
-	Returns:
-		dict: Parsed JSON data.
-	"""
-	try:
-		with open(path_to_json, 'r') as f:
-			data = json.load(f)
-		return data
-	except (FileNotFoundError, json.JSONDecodeError) as e:
-		print(f"Error loading JSON file: {e}")
-		return None
+STRIP_PATTERN = re.compile(r"[^a-zA-Z0-9\s,.\n'-]")
 
-
-def get_text(data, first_page, last_page):
-	"""
-	Extracts text content from specified pages in the JSON data.
-
-	Args:
-		data (dict): JSON data containing the content.
-		first_page (int): Starting page number (inclusive).
-		last_page (int): Ending page number (inclusive).
-
-	Returns:
-		list: Text from the specified pages.
-    """
-	first_page_index = first_page -1
-	last_page_index = last_page
-	text_list = []
-
-	for page in data['content'][first_page_index:last_page_index]:
-		text = page['text'].replace('-\n', '')
-		text = text.replace('{', '(')
-		text = text.replace('}', ')')
-		text = text.replace('Mej.', '')
-		text = text.replace('Wed.', '')
-		text_list.append(text)
-
-	return text_list
-
-
-def dot_initials(string):
-	return re.sub(r'(?<=[A-Z])(?!\.)\b', '.', add_spaces(string))
-
-
-def add_spaces(sentence):
-    """
-    Adds spaces after periods if missing.
-
-    Args:
-        sentence (str): The input sentence.
-
-    Returns:
-        str: Formatted sentence with proper spacing.
-    """
-    sentence = re.sub(r'(?<=[.])(?=[^\s])', r' ', sentence)
-    sentence = re.sub(r'\s+', ' ', sentence)
-    
-    return sentence
+# Lines of this length or longer are OCR garbage (e.g. a table read as one line) and are not sent to the model
+MAX_LINE_LENGTH = 1000
 
 
 def strip_text(text):
@@ -177,26 +130,7 @@ def strip_text(text):
 	Returns:
 		str: Cleaned text.
 	"""
-	regex = re.compile("[^a-zA-Z0-9\s,.\n'-]")
-	return regex.sub('', text)
-
-
-def fix_initials_dot(line):
-	"""
-    Fixes initials by adding a period after the first capital letter.
-
-    This function searches for pairs of an uppercase letter followed by a lowercase letter 
-    (e.g., "A" followed by "b") in a string and adds a period after the uppercase letter, 
-    effectively converting them into initials (e.g., "A." for "Ab").
-
-    Args:
-        line (str): The input string, which may contain initials or names.
-
-    Returns:
-        str: The string with corrected initials, where a period is added after the first capital letter.
-    """
-	pattern = r'\b([A-Z])([a-z])\b'
-	return re.sub(pattern, r'\1.', line)
+	return STRIP_PATTERN.sub('', text)
 
 
 def find_initials(name):
@@ -318,57 +252,6 @@ def add_parenthesis_to_last_initial(text):
 	return re.sub(pattern_with_no_paren, r'\1.)', text)
 
 
-def clean_initials_in_parentheses(text):
-	"""
-    Cleans up initials inside parentheses by removing extra spaces and fixing formatting issues.
-
-    This function addresses several common formatting problems with initials inside parentheses:
-    - It removes any spaces before a closing parenthesis that appears after initials.
-    - It ensures there is no space between a period and a closing parenthesis in initials.
-    - It properly formats initials inside parentheses by removing unnecessary spaces and adding the closing parenthesis where needed.
-    - It corrects instances where parentheses around initials are poorly formatted.
-
-    Args:
-        text (str): The input text containing initials inside parentheses.
-
-    Returns:
-        str: The cleaned-up text with properly formatted initials inside parentheses.
-    """
-	# Remove spaces before closing parenthesis after initials
-	text = re.sub(r'\s*\)\s*', ')', text)
-
-	# Remove space between period and closing parenthesis in initials
-	text = re.sub(r'(\.\s*)(?=\))', '.', text)
-
-	# Add closing parenthesis only after initials or sequence of initials preceded by '('
-	text = re.sub(r'\(\s*([A-Z])\.(?=\s)(?!\))', r'(\1.)', text)  # For single initials
-	text = re.sub(r'\(\s*([A-Z]\.\s*)+[A-Z]\.(?=\s|$)(?!\))', r'(\g<0>)', text)  # For multiple initials
-
-	# Remove whitespace before an initial if preceded by '('
-	text = re.sub(r'\(\s+([A-Z])\.', r'(\1.', text)
-
-	return text
-
-def remove_false_parenthesis(text):
-	"""
-    Removes false or misplaced parentheses from the input text.
-
-    This function addresses specific cases where parentheses are incorrectly placed:
-    - It removes empty parentheses `()` that are used incorrectly, replacing them with just a single opening parenthesis `(`.
-    - It removes closing parentheses `)` that appear immediately after initials without proper context.
-
-    Args:
-        text (str): The input text containing misplaced or false parentheses.
-
-    Returns:
-        str: The cleaned text with false parentheses removed or corrected.
-    """
-	text = re.sub(r'\(\s*\)', '(', text)  # Remove `)` if only preceded by a `(`
-	text = re.sub(r'([A-Z])\.\s*\)(?=\s+[A-Z])', r'\1.', text)  # Remove `)` between initials
-
-	return text
-
-
 def split_by_initials(text):
 	"""
 	Splits the input text into segments based on surnames and initials within parentheses.
@@ -400,60 +283,6 @@ def split_by_initials(text):
 	return results
 
 
-def split_by_name(text):
-	"""
-    Splits the text by name and the remainder after the name.
-
-    Args:
-        text (str): The input text.
-
-    Returns:
-        tuple: A tuple with two lists: one for names and one for the rest of the text.
-    """
-	pattern = r'([A-Za-zÀ-ÿ]+(?:\s?\([^\)]*\)))\s*(.*?)(?=[A-Za-zÀ-ÿ]+\s?\([^\)]*\)|$)'
-
-    # Find all matches (each match will be a tuple: (name, remainder))
-	matches = re.findall(pattern, text)
-
-	name = [match[0].strip() for match in matches]
-	# Return a list of the remainders without the names
-	remainders = [match[1].strip() for match in matches]
-
-	return name, remainders
-
-
-def split_by_initials_with_context(text):
-	"""
-    Splits the text by surname and initials, while preserving context.
-
-    Args:
-        text (str): The input text.
-
-    Returns:
-        list: List of segments split by surname-initial pairs.
-    """
-    # Define a regex pattern to capture surname-initial pairs
-	pattern = r'([A-Za-zÀ-ÿ]+(?:\s?\([^\)]*\)))[^A-Za-zÀ-ÿ]*'
-    
-    # Find all matches for names (surnames followed by initials)
-	matches = re.finditer(pattern, text)
-    
-    # Store the start and end positions of each match
-	spans = [(match.start(), match.end()) for match in matches]
-
-	# Extract corresponding sentences for each match
-	segments = []
-	for i, (start, end) in enumerate(spans):
-		# Start of current match
-		name = text[start:end]
-		# End at the start of the next match or the end of the text
-		next_start = spans[i + 1][0] if i + 1 < len(spans) else len(text)
-		# Append the text from the current match to the next match
-		segments.append(text[start:next_start].strip())
-
-	return segments
-
-
 def find_prefixes(text):
 	"""
     Finds prefixes such as 'v.', 'dt.', etc., in a name and returns the relevant section.
@@ -482,73 +311,179 @@ def find_prefixes(text):
 	
 
 
+def get_page_lines(page):
+	"""
+	Splits the cleaned text of a page into the register lines that are sent to the model: lines with initials
+	or digits are combined into entries, normalized and split into one line per person. Lines of MAX_LINE_LENGTH
+	characters or more are left out.
+
+	Args:
+		page (str): The cleaned text of a page.
+
+	Returns:
+		list: The register lines of the page.
+	"""
+	page_lines = []
+
+	# Split the page into lines and filter out unwanted lines
+	line_list = page.replace('\n\n', '\n').split('\n')
+	line_list = [
+		line for line in line_list 
+		if len(''.join(char for char in line if char.isalpha())) > 3 and 
+		('(' in line or ')' in line or any(char.isdigit() for char in line))
+	]
+	
+	# Combine strings with initials and process them
+	complete_lines = combine_strings_with_initial(line_list)
+
+	# Further processing of the lines with digits: fixing initials, cleaning up initials and handling false parentheses
+	new_lines = [
+		normalize_register_line(line) for line in complete_lines if any(char.isdigit() for char in line)
+	]
+
+	# Split the lines based on initials with context
+	split_lines = [split_by_initials_with_context(line) for line in new_lines]
+
+	# Add processed lines to page_lines
+	for i, line in enumerate(split_lines):
+		if line:
+			page_lines.extend(line)  # Add each part of the split line
+		else:
+			page_lines.append(new_lines[i])  # If no split, keep the original line
+
+	return [line for line in page_lines if len(line) < MAX_LINE_LENGTH]
+
+
+def print_page(page_number, page_lines, outputs):
+	"""
+	Prints the lines of a page with the model's response to each line.
+
+	Args:
+		page_number (int): The page number.
+		page_lines (list): The register lines of the page.
+		outputs (list): The responses, one per line.
+	"""
+	print(f'Page: {page_number}')
+	for line, output in zip(page_lines, outputs):
+		print(line)
+		print(output)
+		print('\n')
+	print('\n')  # Print a newline after each page
+
+
+async def extract_pages_async(text_pages, first_page, prompts, cache=None, stats=None):
+	"""
+	Asks the model for all lines of the pages concurrently and prints the pages in order. The lines of several pages
+	are in flight at the same time, bounded by llm_client.CONCURRENCY.
+
+	Args:
+		text_pages (iterable): The cleaned text of the pages.
+		first_page (int): The page number of the first page.
+		prompts (dict): The prompts as returned by prompt_builder.build_prompts.
+		cache (sqlite3.Connection): Connection to the response cache (optional).
+		stats (dict): Counters of the cache and the router, as returned by response_cache.new_stats and
+			router.new_stats (optional).
+	"""
+	# With several endpoints the requests are spread over them, and so many more can be in flight
+	async_client = llm_client.make_async_client(ENDPOINTS, APIKEY)
+	concurrency = llm_client.CONCURRENCY * len(ENDPOINTS)
+	if adaptive_concurrency:
+		semaphore = llm_client.AdaptiveLimiter(maximum=concurrency)
+	else:
+		semaphore = asyncio.Semaphore(concurrency)
+
+	async def extract_page(numbered_page):
+		page_number, page = numbered_page
+		page_lines = get_page_lines(page)
+		ask = functools.partial(
+			llm_client.extract_records, async_client, prompts, semaphore=semaphore, parse=llm_client.parse_objects,
+			batch_size=batch_size, model=MODEL, cache=cache, stats=stats, structured=structured_output
+		)
+		if use_router:
+			# Only the lines that the rules cannot parse are asked to the model
+			persons = await router.extract_routed(page_lines, ask, router_threshold, stats)
+		else:
+			persons = await ask(page_lines)
+		return page_number, page_lines, [json.dumps(line_persons, ensure_ascii=False) for line_persons in persons]
+
+	numbered_pages = enumerate(text_pages, start=first_page)
+	async for page_number, page_lines, outputs in llm_client.map_ordered(extract_page, numbered_pages, llm_client.PAGE_WINDOW):
+		print_page(page_number, page_lines, outputs)
+
+	if adaptive_concurrency:
+		semaphore.report()
+	if len(ENDPOINTS) > 1:
+		async_client.report()
+	await async_client.close()
+
+
 BASEURL = 'http://localhost:8000/v1/'
 APIKEY = 'EMPTY'
 MODEL = "meta-llama/Llama-3.1-8B-Instruct"
+# Servers (e.g. one vLLM replica per machine) that the async mode spreads its requests over
+ENDPOINTS = [BASEURL]
 
 client = OpenAI(base_url=BASEURL,api_key=APIKEY)
 
+# The modes below are off by default, so a plain run behaves like the original sync extractor and its output
+# can be compared with earlier runs. Switch them on one at a time and check the output against a run without them.
+# Send the lines concurrently with the async client (False: one line at a time)
+use_async = False
+# Adjust the number of requests in flight to the load of the server (False: always llm_client.CONCURRENCY)
+adaptive_concurrency = False
+# Number of lines per request in async mode (1: one line per request). Batching is a mode of its own,
+# set it to e.g. llm_client.BATCH_SIZE to switch it on
+batch_size = 1
+# Take the lines that were asked before from the response cache (async mode)
+use_cache = False
+# Constrain the responses to the person schema (llm_client.RECORD_SCHEMA) instead of scraping JSON from free text
+structured_output = False
+# Parse the lines by rules first and ask the model only for the uncertain ones (async mode)
+use_router = False
+router_threshold = router.THRESHOLD
+
 if __name__ == "__main__":
 	year = "1927"
 	path_to_json = f"book_text/{year}.json"
 
-	# Load the JSON data from the specified path
-	data = load_json(path_to_json)
 	first_page, last_page = 125, 610
 
-	# Proceed if data is loaded successfully
-	if data:
-		# Get text from specified pages
-		text_list = get_text(data, first_page, last_page)
-
+	# Stream the cleaned text of the specified pages
+	text_pages = iter_text(path_to_json, first_page, last_page, normalizers=REGISTER)
+
+	# Render the prompts once, every request starts with the same system message and user prefix
+	prompts = prompt_builder.build_prompts(System_Message(jsonschema=schema), HUMAN_TEMPLATE)
+	prompt_builder.report_static_tokens(prompts, ENDPOINTS[0], MODEL)
+
+	if use_async:
+		cache = response_cache.open_cache() if use_cache else None
+		stats = {**response_cache.new_stats(), **router.new_stats()}
+		asyncio.run(extract_pages_async(text_pages, first_page, prompts, cache, stats))
+		if use_router:
+			router.report(stats)
+		if cache is not None:
+			response_cache.report(stats)
+			cache.close()
+	else:
 		# Process each page
-		for index, page in enumerate(text_list):
-			page_lines = []
+		for index, page in enumerate(text_pages):
 			print(f'Page: {index + first_page}')
-			
-			# Split the page into lines and filter out unwanted lines
-			line_list = page.replace('\n\n', '\n').split('\n')
-			line_list = [
-				line for line in line_list 
-				if len(''.join(char for char in line if char.isalpha())) > 3 and 
-				('(' in line or ')' in line or any(char.isdigit() for char in line))
-			]
-			
-			# Combine strings with initials and process them
-			complete_lines = combine_strings_with_initial(line_list)
-
-			# Further processing: fixing initials and handling lines with digits
-			complete_lines_with_digits = [
-				dot_initials(fix_initials_dot(line)) for line in complete_lines if any(char.isdigit() for char in line)
-			]
-
-			# Clean up initials and handle false parentheses
-			new_lines = [
-				clean_initials_in_parentheses(line) for line in complete_lines_with_digits
-			]
-			new_lines = [
-				remove_false_parenthesis(line) for line in new_lines
-			]
-
-			# Split the lines based on initials with context
-			split_lines = [split_by_initials_with_context(line) for line in new_lines]
-
-			# Add processed lines to page_lines
-			for i, line in enumerate(split_lines):
-				if line:
-					page_lines.extend(line)  # Add each part of the split line
-				else:
-					page_lines.append(new_lines[i])  # If no split, keep the original line
 
 			# Process each line to extract names and the corresponding rest of the text
-			for i in page_lines:
-				if len(i) < 1000:
-					print(i)
-					user = Human_Message(i)
-					system = System_Message(jsonschema=schema)
-					output = ask_llama(system, user)
-					print(output)
-					print('\n')
+			for i in get_page_lines(page):
+				print(i)
+				user = prompt_builder.user_message(prompts, i)
+				if not structured_output:
+					output = ask_llama(prompts["system"], user)
+				else:
+					# Ask again if the response does not follow the schema
+					record_format = llm_client.json_schema_format(llm_client.RECORD_SCHEMA, "record")
+					for _ in range(llm_client.STRUCTURED_RETRIES + 1):
+						persons = llm_client.parse_structured(ask_llama(prompts["system"], user, record_format))
+						if persons is not None:
+							break
+					output = json.dumps(persons) if persons is not None else 'No valid response'
+				print(output)
+				print('\n')
 				
 			print('\n')  # Print a newline after each page
-
@@ -0,0 +1,243 @@
+"""
+JSON Backend
+
+Reading and writing the book and register JSON files with the standard json module (and indent=4) takes a noticeable
+share of the runtime of the batch jobs. This module picks the fastest available JSON library and is used everywhere
+a book or register file is read or written.
+
+- JSON_BACKEND is "orjson" or "msgspec" when installed, otherwise "json" (the standard library). It can be set
+  by hand, e.g. to compare backends.
+- Output is compact by default, pretty-printing is done on request (pretty=True). Files are written as UTF-8 bytes.
+- iter_items streams the items of a top-level array (e.g. "content" of a book) without loading the whole file,
+  for very large files.
+
+Example:
+    book = load("book_text/1926.json")
+    dump(book, "book_text/1926.json")
+    dump(register, "register/register_1926.json", pretty=True)
+
+    for page in iter_items("book_text/1926.json", "content"):
+        print(page["page"])
+
+Modules:
+    - orjson / msgspec: Optional fast JSON libraries.
+    - json: Fallback, and for streaming with JSONDecoder.raw_decode.
+
+Functions:
+    - loads: Parses JSON from a string or bytes.
+    - dumps: Serializes an object to a JSON string.
+    - load: Reads a JSON file.
+    - dump: Writes an object to a JSON file.
+    - iter_items: Yields the items of a top-level array of a JSON file one at a time.
+"""
+
+import json
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+try:
+	import msgspec
+except ImportError:
+	msgspec = None
+
+if orjson is not None:
+	JSON_BACKEND = "orjson"
+elif msgspec is not None:
+	JSON_BACKEND = "msgspec"
+else:
+	JSON_BACKEND = "json"
+
+JSONDecodeError = json.JSONDecodeError
+
+# Characters that can continue a number that ends at a chunk boundary
+NUMBER_CHARACTERS = frozenset('0123456789.eE+-')
+
+
+def loads(data):
+	"""
+	Parses JSON from a string or bytes.
+
+	Args:
+		data (str or bytes): The JSON document.
+
+	Returns:
+		object: The parsed JSON data.
+
+	Raises:
+		json.JSONDecodeError: If the document is not valid JSON, for every backend.
+	"""
+	if JSON_BACKEND == "orjson":
+		# orjson.JSONDecodeError is a subclass of json.JSONDecodeError
+		return orjson.loads(data)
+	if JSON_BACKEND == "msgspec":
+		try:
+			return msgspec.json.decode(data)
+		except msgspec.DecodeError as e:
+			raise json.JSONDecodeError(str(e), data if isinstance(data, str) else data.decode('utf-8', 'replace'), 0) from e
+	return json.loads(data)
+
+
+def _dumps_bytes(obj, pretty=False):
+	if JSON_BACKEND == "orjson":
+		# orjson only indents with 2 spaces
+		return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0)
+	if JSON_BACKEND == "msgspec":
+		data = msgspec.json.encode(obj)
+		return msgspec.json.format(data, indent=4) if pretty else data
+	if pretty:
+		return json.dumps(obj, indent=4, ensure_ascii=False).encode('utf-8')
+	return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def dumps(obj, pretty=False):
+	"""
+	Serializes an object to a JSON string.
+
+	Args:
+		obj (object): The data to serialize.
+		pretty (bool): Indent the output, compact output otherwise.
+
+	Returns:
+		str: The JSON document.
+	"""
+	return _dumps_bytes(obj, pretty).decode('utf-8')
+
+
+def load(path_to_json):
+	"""
+	Reads a JSON file.
+
+	Args:
+		path_to_json (str): The path to the JSON file.
+
+	Returns:
+		object: The parsed JSON data.
+
+	Raises:
+		FileNotFoundError: If the file does not exist.
+		json.JSONDecodeError: If the file is not valid JSON.
+	"""
+	with open(path_to_json, 'rb') as f:
+		return loads(f.read())
+
+
+def dump(obj, path_to_json, pretty=False):
+	"""
+	Writes an object to a JSON file (UTF-8), replacing the file.
+
+	Args:
+		obj (object): The data to write.
+		path_to_json (str): The path to the JSON file.
+		pretty (bool): Indent the output, compact output otherwise.
+	"""
+	with open(path_to_json, 'wb') as f:
+		f.write(_dumps_bytes(obj, pretty))
+		f.write(b'\n')
+
+
+class _Reader:
+	"""
+	Buffered text reader for parsing a JSON file piece by piece with JSONDecoder.raw_decode.
+	"""
+
+	def __init__(self, f, chunk_size):
+		self.f = f
+		self.chunk_size = chunk_size
+		self.buffer = ''
+		self.index = 0
+		self.eof = False
+
+	def fill(self):
+		if self.eof:
+			return False
+		chunk = self.f.read(self.chunk_size)
+		if not chunk:
+			self.eof = True
+			return False
+		self.buffer = self.buffer[self.index:] + chunk
+		self.index = 0
+		return True
+
+	def peek(self):
+		"""Returns the next non-whitespace character, without consuming it."""
+		while True:
+			while self.index < len(self.buffer) and self.buffer[self.index] in ' \t\n\r':
+				self.index += 1
+			if self.index < len(self.buffer):
+				return self.buffer[self.index]
+			if not self.fill():
+				raise json.JSONDecodeError('Unexpected end of file', self.buffer, self.index)
+
+	def expect(self, characters):
+		character = self.peek()
+		if character not in characters:
+			raise json.JSONDecodeError(f'Expected one of {characters!r}', self.buffer, self.index)
+		self.index += 1
+		return character
+
+	def value(self, decoder):
+		"""Decodes the next JSON value, reading more of the file until it is complete."""
+		self.peek()
+		while True:
+			try:
+				value, end = decoder.raw_decode(self.buffer, self.index)
+			except json.JSONDecodeError:
+				if not self.fill():
+					raise
+				continue
+			# A number at the end of the buffer may continue in the next chunk, also when the chunk ends right
+			# after a '.', 'e' or sign, which raw_decode leaves out of the number it returns
+			if (not self.eof and not isinstance(value, (dict, list, str))
+					and all(character in NUMBER_CHARACTERS for character in self.buffer[end:])):
+				if self.fill():
+					continue
+			self.index = end
+			return value
+
+
+def iter_items(path_to_json, key="content", header=None, chunk_size=1 << 20):
+	"""
+	Yields the items of a top-level array of a JSON file one at a time, without loading the whole file.
+	Only one item (e.g. one page) is held in memory at a time.
+
+	Args:
+		path_to_json (str): The path to the JSON file.
+		key (str): Key of the array in the top-level object.
+		header (dict): If given, the other top-level values (e.g. "year") are stored in it.
+		chunk_size (int): Number of characters read from the file at a time.
+
+	Yields:
+		object: The items of the array.
+
+	Raises:
+		FileNotFoundError: If the file does not exist.
+		json.JSONDecodeError: If the file is not valid JSON.
+	"""
+	decoder = json.JSONDecoder()
+
+	with open(path_to_json, 'r', encoding='utf-8') as f:
+		reader = _Reader(f, chunk_size)
+		reader.expect('{')
+		if reader.peek() == '}':
+			return
+		while True:
+			name = reader.value(decoder)
+			reader.expect(':')
+			if name == key:
+				reader.expect('[')
+				if reader.peek() == ']':
+					reader.index += 1
+				else:
+					while True:
+						yield reader.value(decoder)
+						if reader.expect(',]') == ']':
+							break
+			else:
+				value = reader.value(decoder)
+				if header is not None:
+					header[name] = value
+			if reader.expect(',}') == '}':
+				return
@@ -0,0 +1,640 @@
+"""
+LLM Client
+
+extract_with_llm.py and split_on_housenumbers.py ask the model one register line at a time and wait for every answer
+before sending the next line, so the vLLM server only ever sees a single request from us, while it could batch
+many. This module sends the requests concurrently with the async OpenAI client:
+
+- A semaphore bounds the number of requests in flight (CONCURRENCY), so the server's batch is kept full without
+  queueing every line of a book at once.
+- ask_all returns the replies in the order of the prompts, whatever order they arrive in.
+- map_ordered runs a coroutine for every item (e.g. every page) with a window of items in progress and yields the
+  results in the order of the items, so pages are written in order while the lines of the next pages are already
+  being asked.
+
+Throughput then scales with the batch capacity of the server instead of with the latency of a single request.
+
+A register record is only 15-150 characters, while the system message with the schema and instructions is much longer,
+so most tokens of a request are overhead. ask_batched packs BATCH_SIZE records into one request:
+
+- Batch_Message numbers the records and asks for a JSON array with one element per record:
+  [{"record": 1, "persons": [...]}, {"record": 2, "persons": [...]}, ...]
+  Batch_System_Message adds the same contract to the system message, which asks for one object per record.
+- parse_batch_reply maps the elements back to the records by their number. Records that are missing from the reply,
+  or whose element is malformed, are asked again one at a time with the normal single record prompt. When the reply
+  is no JSON array at all, every record of the batch is retried.
+
+extract_records is what the extractors call for the records of a page: it takes the records that were asked before
+from the response cache (response_cache.py), asks the others (in batches or one per request) and adds them to it.
+
+The replies of the model are free text in which parse_objects looks for JSON objects with a regex: objects that are
+nested, or not valid JSON, are lost and never asked again. In structured mode (structured=True) the person schema is
+sent as the response_format of the request (a JSON schema, which vLLM enforces with guided decoding), so the reply is
+valid JSON that follows RECORD_SCHEMA ({"persons": [...]}) or BATCH_SCHEMA, and the model generates no text around it.
+A reply that still does not follow the schema (e.g. cut off at the token limit) is asked again.
+
+Requests fail now and then (a timeout, a restarting server) and too many requests in flight overload the server.
+ask_llama_async therefore retries a request that failed with a timeout, a connection error or a 429/5xx status, up
+to MAX_RETRIES times, after an exponential backoff with full jitter (BACKOFF_BASE * 2^attempt seconds at most,
+capped at BACKOFF_MAX, or the Retry-After of the server). Every attempt has a timeout of REQUEST_TIMEOUT seconds.
+Instead of a semaphore it can take an AdaptiveLimiter, which changes the number of requests in flight with AIMD:
+
+- It starts at INITIAL_CONCURRENCY and doubles it every round trip (slow start) until the first sign of overload,
+  after that it adds one request per round trip (additive increase), up to CONCURRENCY.
+- A 429 or 503 response or a timeout multiplies the limit by OVERLOAD_DECREASE, and a smoothed latency of more than
+  LATENCY_TOLERANCE times the lowest smoothed latency seen multiplies it by LATENCY_DECREASE (multiplicative decrease), at
+  most once per round trip so a burst of errors counts once.
+
+Example:
+    client = make_async_client()
+    semaphore = asyncio.Semaphore(CONCURRENCY)  # or AdaptiveLimiter()
+    replies = await ask_all(client, [(system, user) for user in users], semaphore)
+    persons = await ask_batched(client, system, records, semaphore, Human_Message, parse_objects)
+
+Modules:
+    - asyncio: For running the requests concurrently.
+    - random: For the jitter of the backoff.
+    - json: For parsing the replies.
+    - openai: For the async OpenAI compatible client.
+    - endpoint_pool: For spreading the requests over several servers.
+    - prompt_builder: For the user messages of single records.
+    - response_cache: For the answers that were asked before.
+
+Classes:
+    - AdaptiveLimiter: Bounds the number of requests in flight, with a limit that follows the load of the server.
+
+Functions:
+    - make_async_client: Creates an async client for the server.
+    - ask_llama_async: Sends a system and user message to the model and returns its reply.
+    - ask_all: Sends a list of prompts concurrently and returns the replies in order.
+    - map_ordered: Runs a coroutine for every item, a window at a time, and yields the results in order.
+    - parse_objects: Returns the JSON objects in a reply.
+    - json_schema_format: Returns the response_format for a JSON schema.
+    - parse_structured: Returns the persons in a response that follows RECORD_SCHEMA.
+    - Batch_Message: Builds the user message for a batch of numbered records.
+    - Batch_System_Message: Builds the system message for a batch of records.
+    - parse_batch_reply: Maps the reply to a batch back to its records.
+    - ask_batched: Asks the records in batches and retries failed records one at a time.
+    - records_version: Returns the version of the responses for the prompts and the extraction mode.
+    - extract_records: Returns the persons in a list of records, from the response cache or the model.
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import random
+import re
+import time
+
+import openai
+from openai import AsyncOpenAI
+
+import prompt_builder
+import response_cache
+from endpoint_pool import EndpointPool
+
+
+BASEURL = 'http://localhost:8000/v1/'
+APIKEY = 'EMPTY'
+MODEL = "meta-llama/Llama-3.1-8B-Instruct"
+
+# Maximum number of requests in flight, should be about the batch size of the server (vLLM --max-num-seqs)
+CONCURRENCY = 64
+# Adaptive concurrency: the limit starts here, and is never lower than MIN_CONCURRENCY
+INITIAL_CONCURRENCY = 8
+MIN_CONCURRENCY = 1
+OVERLOAD_DECREASE = 0.5
+LATENCY_DECREASE = 0.8
+LATENCY_TOLERANCE = 3.0
+# Retries of a failed request, with exponential backoff in seconds
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+# Timeout of a single attempt in seconds
+REQUEST_TIMEOUT = 120.0
+# Status codes that are retried: rate limited, and server errors
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# Number of pages that are processed at the same time
+PAGE_WINDOW = 8
+# Number of records per request in batch mode
+BATCH_SIZE = 8
+
+# Start of the user message of a batch, the numbered records follow
+BATCH_INSTRUCTIONS = """Please extract the relavent information from every record.
+    Respond **ONLY** with a JSON array with one element per record, in the order of the records:
+    [{"record": <number of the record>, "persons": [<a JSON object for every person in the record>]}]
+
+    Records:
+"""
+# Added to the system message of a batch request. The system message of the extractors asks for a single JSON object
+# per record, this replaces that with the array that BATCH_INSTRUCTIONS asks for, so the two do not contradict
+BATCH_SYSTEM_INSTRUCTIONS = """
+
+    The user message of this request contains several numbered records instead of one. Do not respond with a single
+    JSON object: respond **ONLY** with a JSON array with one element per record, in the order of the records:
+    [{"record": <number of the record>, "persons": [<a JSON object as described above for every person in the record>]}]
+"""
+
+# JSON schemas of the structured output mode: the persons of a record, and the records of a batch
+PERSON_SCHEMA = {
+	"type": "object",
+	"properties": {
+		"name": {"type": "string"},
+		"jobTitle": {"type": "string"},
+		"address": {"type": "string"}
+	},
+	"required": ["name", "jobTitle", "address"],
+	"additionalProperties": False
+}
+RECORD_SCHEMA = {
+	"type": "object",
+	"properties": {"persons": {"type": "array", "items": PERSON_SCHEMA}},
+	"required": ["persons"],
+	"additionalProperties": False
+}
+BATCH_SCHEMA = {
+	"type": "array",
+	"items": {
+		"type": "object",
+		"properties": {"record": {"type": "integer"}, "persons": {"type": "array", "items": PERSON_SCHEMA}},
+		"required": ["record", "persons"],
+		"additionalProperties": False
+	}
+}
+# Number of times a record is asked again when its response does not follow the schema
+STRUCTURED_RETRIES = 2
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveLimiter:
+	"""
+	Bounds the number of requests in flight, like an asyncio.Semaphore ('async with limiter:'), with a limit that
+	is adjusted to the load of the server by ask_llama_async (AIMD, see the module docstring).
+	"""
+
+	def __init__(self, initial=INITIAL_CONCURRENCY, minimum=MIN_CONCURRENCY, maximum=CONCURRENCY):
+		self.limit = float(min(max(initial, minimum), maximum))
+		self.minimum = minimum
+		self.maximum = maximum
+		self.in_flight = 0
+		self.slow_start = True
+		self.lowest_latency = None
+		self.smoothed_latency = None
+		self.last_decrease = 0.0
+		self.retries = 0
+		self.overloads = 0
+		self._condition = asyncio.Condition()
+
+	async def __aenter__(self):
+		async with self._condition:
+			await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+			self.in_flight += 1
+		return self
+
+	async def __aexit__(self, exc_type, exc, traceback):
+		# Also lets waiting requests in when the limit went up
+		async with self._condition:
+			self.in_flight -= 1
+			self._condition.notify_all()
+
+	def _decrease(self, factor):
+		# At most once per round trip, so the requests that were already in flight when it happened count once
+		now = time.monotonic()
+		if now - self.last_decrease < (self.smoothed_latency or 0.0):
+			return
+		self.last_decrease = now
+		self.slow_start = False
+		self.limit = max(self.minimum, self.limit * factor)
+
+	def on_success(self, latency):
+		"""
+		Records the latency of a request that succeeded, and increases the limit unless the latency shows that the
+		server is overloaded.
+
+		Args:
+			latency (float): The latency of the request in seconds.
+		"""
+		self.smoothed_latency = latency if self.smoothed_latency is None else 0.9 * self.smoothed_latency + 0.1 * latency
+		# The lowest smoothed latency drifts up slowly, so it follows a change of the workload (e.g. the batch size)
+		if self.lowest_latency is None:
+			self.lowest_latency = self.smoothed_latency
+		else:
+			self.lowest_latency = min(self.lowest_latency * 1.001, self.smoothed_latency)
+
+		if self.smoothed_latency > LATENCY_TOLERANCE * self.lowest_latency:
+			self._decrease(LATENCY_DECREASE)
+		elif self.slow_start:
+			self.limit = min(self.maximum, self.limit + 1)
+		else:
+			self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+	def on_overload(self):
+		"""
+		Decreases the limit after a 429 or 503 response or a timeout.
+		"""
+		self.overloads += 1
+		self._decrease(OVERLOAD_DECREASE)
+
+	def report(self):
+		"""
+		Prints the limit and the number of retries and overloads.
+		"""
+		print(f'Concurrency: limit {self.limit:.1f}, {self.retries} retries, {self.overloads} overloads')
+
+
+def make_async_client(base_url=BASEURL, api_key=APIKEY):
+	"""
+	Creates an async OpenAI compatible client for the server, or an endpoint_pool.EndpointPool that spreads the
+	requests over several servers. The client does not retry by itself, ask_llama_async does.
+
+	Args:
+		base_url (str or list): The URL of the server, or a list of URLs of servers that run the same model.
+		api_key (str): The API key.
+
+	Returns:
+		AsyncOpenAI or EndpointPool: The client.
+	"""
+	if isinstance(base_url, (list, tuple)):
+		if len(base_url) > 1:
+			return EndpointPool(base_url, api_key, REQUEST_TIMEOUT)
+		base_url = base_url[0]
+	return AsyncOpenAI(base_url=base_url, api_key=api_key, max_retries=0, timeout=REQUEST_TIMEOUT)
+
+
+def _retry_delay(error, attempt):
+	# The Retry-After of the server, or an exponential backoff with full jitter
+	response = getattr(error, 'response', None)
+	if response is not None:
+		try:
+			return min(BACKOFF_MAX, float(response.headers.get('retry-after')))
+		except (TypeError, ValueError):
+			pass
+	return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def _is_retryable(error):
+	if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, asyncio.TimeoutError)):
+		return True
+	return isinstance(error, openai.APIStatusError) and error.status_code in RETRY_STATUS_CODES
+
+
+def _is_overload(error):
+	if isinstance(error, (openai.APITimeoutError, asyncio.TimeoutError)):
+		return True
+	return isinstance(error, openai.APIStatusError) and error.status_code in (429, 503)
+
+
+async def ask_llama_async(client, system, user, semaphore, model=MODEL, response_format=None):
+	"""
+	Sends a system and user message to the model and returns the model's response. Waits for the semaphore first,
+	so no more requests are in flight than it allows. Failed requests are retried with backoff, and an
+	AdaptiveLimiter is told about the latency and overload of the server.
+
+	Args:
+		client (AsyncOpenAI): The client.
+		system (str): The system message providing context or instructions for the model.
+		user (str): The user message containing the query or input for the model.
+		semaphore (asyncio.Semaphore or AdaptiveLimiter): Bounds the number of requests in flight.
+		model (str): The model name.
+		response_format (dict): Format the response has to follow, e.g. from json_schema_format (optional).
+
+	Returns:
+		str: The response generated by the model.
+
+	Raises:
+		openai.OpenAIError: When the request failed with an error that is not retried, or failed MAX_RETRIES + 1 times.
+	"""
+	messages = [{"role": "system", "content": system},
+				{"role": "user", "content": user}]
+	options = {"response_format": response_format} if response_format is not None else {}
+	adaptive = isinstance(semaphore, AdaptiveLimiter)
+
+	for attempt in range(MAX_RETRIES + 1):
+		try:
+			async with semaphore:
+				start = time.monotonic()
+				completion = await asyncio.wait_for(client.chat.completions.create(
+					model=model,
+					messages=messages,
+					timeout=REQUEST_TIMEOUT,
+					**options
+				), REQUEST_TIMEOUT)
+				if adaptive:
+					semaphore.on_success(time.monotonic() - start)
+			return completion.choices[0].message.content
+		except (openai.OpenAIError, asyncio.TimeoutError) as error:
+			if not _is_retryable(error) or attempt == MAX_RETRIES:
+				raise
+			if adaptive:
+				semaphore.retries += 1
+				if _is_overload(error):
+					semaphore.on_overload()
+			delay = _retry_delay(error, attempt)
+			logger.info(f'Request failed ({error.__class__.__name__}), retry {attempt + 1} of {MAX_RETRIES} in {delay:.1f}s')
+			await asyncio.sleep(delay)
+
+
+async def ask_all(client, prompts, semaphore, model=MODEL, response_format=None):
+	"""
+	Sends a list of prompts concurrently and returns the replies in the order of the prompts.
+
+	Args:
+		client (AsyncOpenAI): The client.
+		prompts (list): (system, user) tuples.
+		semaphore (asyncio.Semaphore): Bounds the number of requests in flight.
+		model (str): The model name.
+		response_format (dict): Format the responses have to follow (optional).
+
+	Returns:
+		list: The replies, one per prompt.
+	"""
+	return await asyncio.gather(*(
+		ask_llama_async(client, system, user, semaphore, model, response_format) for system, user in prompts
+	))
+
+
+async def map_ordered(function, items, window=PAGE_WINDOW):
+	"""
+	Runs a coroutine function for every item, with at most `window` items in progress, and yields the results in
+	the order of the items. The items are taken from the iterable only when there is room in the window, so a
+	stream of pages is not read ahead further than needed.
+
+	Args:
+		function (function): Coroutine function that is called with an item.
+		items (iterable): The items.
+		window (int): Maximum number of items in progress.
+
+	Yields:
+		object: The result of the function for every item, in order.
+	"""
+	pending = []
+	iterator = iter(items)
+	exhausted = False
+
+	try:
+		while True:
+			while not exhausted and len(pending) < window:
+				try:
+					item = next(iterator)
+				except StopIteration:
+					exhausted = True
+					break
+				pending.append(asyncio.ensure_future(function(item)))
+
+			if not pending:
+				return
+			yield await pending.pop(0)
+	finally:
+		# Stop the work in progress when the caller stops early or a coroutine fails
+		for task in pending:
+			task.cancel()
+
+
+def parse_objects(output):
+	"""
+	Returns the JSON objects in the response of the model. Objects that are not valid JSON are skipped.
+
+	Args:
+		output (str): The response of the model.
+
+	Returns:
+		list: The parsed objects.
+	"""
+	objects = []
+	for obj in re.findall(r'\{.*?\}', output, re.DOTALL):
+		try:
+			objects.append(json.loads(obj))
+		except json.JSONDecodeError:
+			pass
+	return objects
+
+
+def json_schema_format(schema, name):
+	"""
+	Returns the response_format of a request whose response has to follow a JSON schema. The server constrains the
+	decoding to the schema (guided decoding in vLLM), so the response is valid JSON.
+
+	Args:
+		schema (dict): The JSON schema.
+		name (str): The name of the schema.
+
+	Returns:
+		dict: The response_format.
+	"""
+	return {"type": "json_schema", "json_schema": {"name": name, "schema": schema}}
+
+
+def parse_structured(output):
+	"""
+	Returns the persons in a response that follows RECORD_SCHEMA.
+
+	Args:
+		output (str): The response of the model.
+
+	Returns:
+		list: The persons, or None if the response does not follow the schema.
+	"""
+	try:
+		reply = json.loads(output)
+	except (json.JSONDecodeError, TypeError):
+		return None
+	persons = reply.get("persons") if isinstance(reply, dict) else None
+	if not isinstance(persons, list) or not all(isinstance(person, dict) for person in persons):
+		return None
+	return persons
+
+
+def Batch_Message(records):
+	"""
+	Builds the user message for a batch of records. The records are numbered from 1 and the model is asked for a
+	JSON array with the persons of every record.
+
+	Args:
+		records (list): The records.
+
+	Returns:
+		str: The user message.
+	"""
+	numbered_records = '\n'.join(f'{number}. {record}' for number, record in enumerate(records, start=1))
+	# The instructions come before the records, so they are part of the prefix that the server caches
+	return BATCH_INSTRUCTIONS + numbered_records + '\n'
+
+
+def Batch_System_Message(system):
+	"""
+	Builds the system message for a batch of records: the system message of a single record, which asks for one
+	JSON object, followed by BATCH_SYSTEM_INSTRUCTIONS, which asks for the JSON array of Batch_Message instead.
+
+	Args:
+		system (str): The system message of a single record.
+
+	Returns:
+		str: The system message.
+	"""
+	return system + BATCH_SYSTEM_INSTRUCTIONS
+
+
+def parse_batch_reply(reply, count):
+	"""
+	Maps the reply to a batch back to its records by their number.
+
+	Args:
+		reply (str): The response of the model to Batch_Message.
+		count (int): The number of records in the batch.
+
+	Returns:
+		list: For every record the list of persons, or None if the record is missing from the reply or its element
+			is malformed.
+	"""
+	results = [None] * count
+	start, end = reply.find('['), reply.rfind(']')
+	if start == -1 or end < start:
+		return results
+	try:
+		elements = json.loads(reply[start:end + 1])
+	except json.JSONDecodeError:
+		return results
+	if not isinstance(elements, list):
+		return results
+
+	for element in elements:
+		if not isinstance(element, dict):
+			continue
+		number, persons = element.get("record"), element.get("persons")
+		if isinstance(persons, dict):
+			persons = [persons]
+		if not isinstance(number, int) or not 1 <= number <= count or not isinstance(persons, list):
+			continue
+		if all(isinstance(person, dict) for person in persons):
+			results[number - 1] = persons
+	return results
+
+
+async def ask_batched(client, system, records, semaphore, make_user, parse, batch_size=BATCH_SIZE, model=MODEL, structured=False):
+	"""
+	Asks the model for the persons in a list of records, batch_size records per request. Records that fail in their
+	batch are asked again one at a time.
+
+	Args:
+		client (AsyncOpenAI): The client.
+		system (str): The system message of a single record, batches get Batch_System_Message(system).
+		records (list): The records.
+		semaphore (asyncio.Semaphore): Bounds the number of requests in flight.
+		make_user (function): Builds the user message for a single record (e.g. Human_Message).
+		parse (function): Returns the persons in the response to a single record.
+		batch_size (int): Number of records per request.
+		model (str): The model name.
+		structured (bool): Constrain the responses to BATCH_SCHEMA and RECORD_SCHEMA.
+
+	Returns:
+		list: For every record the list of persons (or what parse returns for it), in the order of the records.
+	"""
+	batch_format = json_schema_format(BATCH_SCHEMA, "batch") if structured else None
+	record_format = json_schema_format(RECORD_SCHEMA, "record") if structured else None
+
+	batches = [records[start:start + batch_size] for start in range(0, len(records), batch_size)]
+	batch_system = Batch_System_Message(system)
+	replies = await ask_all(client, [(batch_system, Batch_Message(batch)) for batch in batches], semaphore, model, batch_format)
+
+	results = []
+	for batch, reply in zip(batches, replies):
+		results.extend(parse_batch_reply(reply, len(batch)))
+
+	failed = [index for index, persons in enumerate(results) if persons is None]
+	if failed:
+		logger.info(f'{len(failed)} of {len(records)} records retried one at a time')
+		single_replies = await ask_all(client, [(system, make_user(records[index])) for index in failed], semaphore, model, record_format)
+		for index, reply in zip(failed, single_replies):
+			results[index] = parse(reply)
+
+	return results
+
+
+def records_version(prompts, batch_size=BATCH_SIZE, structured=False):
+	"""
+	Returns the version of the responses that extract_records gets for a set of prompts and extraction mode, as used
+	in the keys of the response cache.
+
+	Args:
+		prompts (dict): The prompts as returned by prompt_builder.build_prompts.
+		batch_size (int): Number of records per request (1: one record per request).
+		structured (bool): Whether the responses are constrained to the person schema.
+
+	Returns:
+		str: The version.
+	"""
+	batch_instructions = BATCH_SYSTEM_INSTRUCTIONS + BATCH_INSTRUCTIONS if batch_size > 1 else None
+	return response_cache.prompt_version(prompts, batch_instructions, structured)
+
+
+async def extract_records(client, prompts, records, semaphore, parse, batch_size=BATCH_SIZE, model=MODEL, cache=None, stats=None, structured=False):
+	"""
+	Returns the persons in a list of records. Records that are in the response cache are not asked, the same record
+	is asked once, and the answers are added to the cache.
+
+	Args:
+		client (AsyncOpenAI): The client.
+		prompts (dict): The prompts as returned by prompt_builder.build_prompts.
+		records (list): The records.
+		semaphore (asyncio.Semaphore): Bounds the number of requests in flight.
+		parse (function): Returns the persons in the response to a single record.
+		batch_size (int): Number of records per request (1: one record per request).
+		model (str): The model name.
+		cache (sqlite3.Connection): Connection to the response cache (optional).
+		stats (dict): Counters of the cache as returned by response_cache.new_stats (optional). "failures" counts the
+			records without a valid response.
+		structured (bool): Constrain the responses to the person schema and parse them with parse_structured instead
+			of parse. Records whose response does not follow it are asked again, up to STRUCTURED_RETRIES times.
+
+	Returns:
+		list: For every record the list of persons, in the order of the records. A record without a valid response
+			gets an empty list, which is not added to the cache.
+	"""
+	version = records_version(prompts, batch_size, structured)
+	if structured:
+		parse = parse_structured
+	keys = [response_cache.cache_key(model, version, record) for record in records]
+	found = response_cache.lookup(cache, keys) if cache is not None else {}
+	if stats is not None:
+		hits = sum(key in found for key in keys)
+		stats["hits"] += hits
+		stats["misses"] += len(keys) - hits
+
+	# The records to ask, every key once
+	missing = {}
+	for key, record in zip(keys, records):
+		if key not in found and key not in missing:
+			missing[key] = record
+	missing_records = list(missing.values())
+
+	make_user = functools.partial(prompt_builder.user_message, prompts)
+	record_format = json_schema_format(RECORD_SCHEMA, "record") if structured else None
+	if batch_size > 1:
+		answers = await ask_batched(client, prompts["system"], missing_records, semaphore, make_user, parse, batch_size, model, structured)
+	else:
+		user_messages = [(prompts["system"], make_user(record)) for record in missing_records]
+		answers = [parse(reply) for reply in await ask_all(client, user_messages, semaphore, model, record_format)]
+
+	# Only parse_structured returns None, for a response that does not follow the schema
+	for _ in range(STRUCTURED_RETRIES):
+		failed = [index for index, persons in enumerate(answers) if persons is None]
+		if not failed:
+			break
+		user_messages = [(prompts["system"], make_user(missing_records[index])) for index in failed]
+		for index, reply in zip(failed, await ask_all(client, user_messages, semaphore, model, record_format)):
+			answers[index] = parse(reply)
+	# Records without a valid response get no persons in this run, but are not cached, so a later run asks again
+	failed = [index for index, persons in enumerate(answers) if persons is None]
+	if failed:
+		logger.warning(f'No valid response for {len(failed)} records: {[missing_records[index] for index in failed]}')
+	if stats is not None:
+		stats["failures"] += len(failed)
+
+	valid = [(key, record, persons) for (key, record), persons in zip(missing.items(), answers) if persons is not None]
+	if cache is not None and valid:
+		response_cache.store(cache, model, valid)
+	found.update((key, persons if persons is not None else []) for key, persons in zip(missing, answers))
+
+	return [found[key] for key in keys]
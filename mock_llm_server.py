@@ -0,0 +1,276 @@
+"""
+Mock LLM Server
+
+The extractors need a vLLM server on a GPU machine (http://localhost:8000/v1/), which makes it hard to measure the
+client side of the pipeline (concurrency, batching, caching, retries) anywhere else. This module is a small stand-in
+for the OpenAI compatible API of vLLM, built on the standard library, that runs on any machine:
+
+- POST /v1/chat/completions answers with deterministic canned JSON: the record in the user message is parsed by the
+  rule based router (router.py), so the same record always gets the same answer. Batch messages (Batch_Message of
+  llm_client.py) get a JSON array with an element per record, and a response_format with a JSON schema gets a reply
+  that follows RECORD_SCHEMA or BATCH_SCHEMA, like guided decoding.
+- GET /v1/models lists the model, POST /tokenize counts tokens (estimated at 4 characters per token), like vLLM.
+- Latency: every request takes a base latency drawn from a distribution ('constant', 'uniform' or 'lognormal'
+  around --latency seconds) plus --per-record seconds for every record in the request.
+- Batching: the server handles at most --capacity requests at the same time (like --max-num-seqs), the others wait
+  in a queue. A fuller batch decodes slower: the latency is multiplied by 1 + --batch-slowdown * (busy / capacity).
+- Errors: a share of the requests fails with 429 (--rate-limit-rate, when the queue is longer than --queue-limit
+  as well), 503 (--unavailable-rate) or 500 (--error-rate), or gets a reply that is cut off (--malformed-rate).
+
+The random choices come from a generator seeded with --seed, so runs are repeatable.
+
+Usage:
+    python mock_llm_server.py --port 8000 --latency 0.5 --capacity 64 --error-rate 0.01
+
+Modules:
+    - http.server: For the HTTP server, one thread per connection.
+    - router: For the canned answers.
+
+Functions:
+    - sample_latency: Draws the base latency of a request.
+    - extract_records: Returns the records in the user message of a request.
+    - canned_reply: Returns the deterministic reply to a request.
+    - make_server: Creates the server.
+    - get_parser: Returns the parser of the options of the server.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import router
+
+
+MODEL = "meta-llama/Llama-3.1-8B-Instruct"
+CHARACTERS_PER_TOKEN = 4
+
+RECORD_PATTERN = re.compile(r'Record: (.*)')
+BATCH_RECORD_PATTERN = re.compile(r'^(\d+)\. (.*)$', re.MULTILINE)
+
+
+def sample_latency(rng, distribution, latency):
+	"""
+	Draws the base latency of a request.
+
+	Args:
+		rng (random.Random): The random generator.
+		distribution (str): 'constant', 'uniform' (between 0 and twice the latency) or 'lognormal' (with the
+			latency as its median and a long tail).
+		latency (float): The typical latency in seconds.
+
+	Returns:
+		float: The latency in seconds.
+	"""
+	if distribution == 'uniform':
+		return rng.uniform(0, 2 * latency)
+	if distribution == 'lognormal':
+		return latency * rng.lognormvariate(0, 0.5)
+	return latency
+
+
+def extract_records(user):
+	"""
+	Returns the records in the user message of a request.
+
+	Args:
+		user (str): The user message.
+
+	Returns:
+		tuple: The records, and whether the message is a batch of numbered records.
+	"""
+	if 'Records:' in user:
+		return [record for _, record in BATCH_RECORD_PATTERN.findall(user)], True
+	match = RECORD_PATTERN.search(user)
+	return [match.group(1).strip()] if match else [user.strip()], False
+
+
+def _persons(record):
+	person, _ = router.parse_record(record)
+	return [person] if person is not None else [{"name": record, "jobTitle": "", "address": ""}]
+
+
+def canned_reply(user, response_format=None):
+	"""
+	Returns the deterministic reply to a request.
+
+	Args:
+		user (str): The user message.
+		response_format (dict): The response_format of the request (optional).
+
+	Returns:
+		tuple: The reply and the number of records in the request.
+	"""
+	records, batch = extract_records(user)
+	if batch:
+		reply = [{"record": number, "persons": _persons(record)} for number, record in enumerate(records, start=1)]
+	elif response_format is not None and response_format.get("type") == "json_schema":
+		reply = {"persons": _persons(records[0])}
+	else:
+		# Free text answers contain the objects of the persons, like the model without guided decoding
+		return '\n'.join(json.dumps(person, ensure_ascii=False) for person in _persons(records[0])), len(records)
+	return json.dumps(reply, ensure_ascii=False), len(records)
+
+
+class _Handler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+	# The headers and the body are written separately. With Nagle's algorithm the body waits for the ACK of the
+	# headers, which the client delays on a keep-alive connection, and every response takes about 40 ms longer
+	disable_nagle_algorithm = True
+
+	def log_message(self, format, *args):
+		if self.server.options.verbose:
+			super().log_message(format, *args)
+
+	def _send_json(self, status, body, headers=()):
+		data = json.dumps(body).encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(data)))
+		for name, value in headers:
+			self.send_header(name, value)
+		self.end_headers()
+		self.wfile.write(data)
+
+	def _read_json(self):
+		length = int(self.headers.get('Content-Length', 0))
+		return json.loads(self.rfile.read(length) or b'{}')
+
+	def do_GET(self):
+		if self.path.rstrip('/') in ('/v1/models', '/models'):
+			self._send_json(200, {"object": "list", "data": [{"id": self.server.options.model, "object": "model", "owned_by": "mock"}]})
+		elif self.path.rstrip('/') == '/health':
+			self._send_json(200, {})
+		else:
+			self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+	def do_POST(self):
+		try:
+			body = self._read_json()
+		except ValueError:
+			self._send_json(400, {"error": {"message": "Invalid JSON"}})
+			return
+
+		path = self.path.rstrip('/')
+		if path == '/tokenize':
+			text = body.get("prompt") or ''.join(message.get("content", "") for message in body.get("messages", []))
+			count = len(text) // CHARACTERS_PER_TOKEN
+			self._send_json(200, {"count": count, "max_model_len": 8192, "tokens": list(range(count))})
+		elif path in ('/v1/chat/completions', '/chat/completions'):
+			self._chat_completion(body)
+		else:
+			self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+	def _chat_completion(self, body):
+		server = self.server
+		options = server.options
+		messages = body.get("messages", [])
+		user = next((message.get("content", "") for message in reversed(messages) if message.get("role") == "user"), "")
+		reply, records = canned_reply(user, body.get("response_format"))
+
+		with server.lock:
+			server.requests += 1
+			draw = server.rng.random()
+			base_latency = sample_latency(server.rng, options.distribution, options.latency)
+			queue_length = server.waiting
+
+		# Error injection, before the request takes a slot. A rate limit only hits when the queue is long enough.
+		if draw < options.rate_limit_rate:
+			if queue_length >= options.queue_limit:
+				self._send_json(429, {"error": {"message": "Too many requests"}}, [('Retry-After', '1')])
+				return
+		elif draw < options.rate_limit_rate + options.unavailable_rate:
+			self._send_json(503, {"error": {"message": "Service unavailable"}})
+			return
+		elif draw < options.rate_limit_rate + options.unavailable_rate + options.error_rate:
+			self._send_json(500, {"error": {"message": "Internal server error"}})
+			return
+		elif draw < options.rate_limit_rate + options.unavailable_rate + options.error_rate + options.malformed_rate:
+			reply = reply[:len(reply) // 2]
+
+		with server.lock:
+			server.waiting += 1
+		with server.slots:
+			with server.lock:
+				server.waiting -= 1
+				server.busy += 1
+				busy = server.busy
+			latency = (base_latency + options.per_record * records) * (1 + options.batch_slowdown * busy / options.capacity)
+			time.sleep(latency)
+			with server.lock:
+				server.busy -= 1
+
+		prompt_tokens = sum(len(message.get("content", "")) for message in messages) // CHARACTERS_PER_TOKEN
+		completion_tokens = len(reply) // CHARACTERS_PER_TOKEN
+		self._send_json(200, {
+			"id": f"chatcmpl-{uuid.uuid4().hex}",
+			"object": "chat.completion",
+			"created": int(time.time()),
+			"model": body.get("model", options.model),
+			"choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+			"usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+		})
+
+
+def make_server(options):
+	"""
+	Creates the server. It is started with serve_forever (e.g. in a thread) and stopped with shutdown.
+
+	Args:
+		options (argparse.Namespace): The options, as parsed by the parser of this module (see get_parser).
+
+	Returns:
+		ThreadingHTTPServer: The server, with the counter of requests in its 'requests' attribute.
+	"""
+	server = ThreadingHTTPServer((options.host, options.port), _Handler)
+	server.daemon_threads = True
+	server.options = options
+	server.rng = random.Random(options.seed)
+	server.lock = threading.Lock()
+	server.slots = threading.BoundedSemaphore(options.capacity)
+	server.requests = 0
+	server.waiting = 0
+	server.busy = 0
+	return server
+
+
+def get_parser():
+	"""
+	Returns the parser of the options of the server.
+
+	Returns:
+		argparse.ArgumentParser: The parser.
+	"""
+	parser = argparse.ArgumentParser(description='Mock OpenAI compatible LLM server for benchmarks.')
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8000, help='port, 0 for a free port')
+	parser.add_argument('--model', default=MODEL)
+	parser.add_argument('--distribution', choices=['constant', 'uniform', 'lognormal'], default='lognormal')
+	parser.add_argument('--latency', type=float, default=0.5, help='typical base latency of a request in seconds')
+	parser.add_argument('--per-record', type=float, default=0.05, help='extra latency per record of a request in seconds')
+	parser.add_argument('--capacity', type=int, default=64, help='maximum number of requests handled at the same time')
+	parser.add_argument('--batch-slowdown', type=float, default=0.5, help='relative slowdown of a full batch')
+	parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests that fail with 500')
+	parser.add_argument('--unavailable-rate', type=float, default=0.0, help='share of requests that fail with 503')
+	parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='share of requests that fail with 429 when the queue is full')
+	parser.add_argument('--queue-limit', type=int, default=0, help='queue length from which requests can fail with 429')
+	parser.add_argument('--malformed-rate', type=float, default=0.0, help='share of replies that are cut off')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--verbose', action='store_true', help='log every request')
+	return parser
+
+
+if __name__ == "__main__":
+	options = get_parser().parse_args()
+	server = make_server(options)
+	print(f'Mock LLM server on http://{options.host}:{server.server_address[1]}/v1/')
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
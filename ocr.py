@@ -3,15 +3,48 @@ OCR Processing Script
 
 This script processes images within a specified directory, performing OCR (Optical Character Recognition) on each image.
 - The extracted text is saved in a structured JSON file with page numbers and text content.
+  Page numbers are taken from the image filenames ('..._page_0121.jpg'), so they match the PDF.
+  The file is written every few pages (atomically), so an interrupted run can be resumed.
+- Pages can be OCR'd as a whole, or split into text lines that are OCR'd one by one (in parallel) as
+  single text lines, which keeps line boundaries exact for the extractors.
+- Optionally, the mean OCR confidence of every page and its low-confidence lines are recorded, so that
+  reocr.py can re-OCR only the bad regions of a book.
 
 Modules:
     - pytesseract: For performing OCR on images.
     - PIL.Image: For opening and processing image files.
+    - numpy: For the horizontal projection profile used to segment lines.
+    - subprocess: For piping images to Tesseract when OCR_BACKEND is "stdin".
+    - concurrent.futures: For OCRing pages or line crops in parallel (optional, see max_workers).
     - os: For directory and file handling.
-    - json: For storing extracted text in JSON format.
+    - json_backend: For storing extracted text in JSON format.
 
 Functions:
+    - image_to_pnm: Encodes an in-memory image as PGM/PBM bytes.
+    - image_to_string_stdin: Performs OCR by piping an image to tesseract, without temporary files.
+    - parse_tsv: Parses the TSV output of Tesseract into the dictionary of pytesseract.image_to_data.
+    - image_to_data_stdin: Performs OCR by piping an image to tesseract and returns the words with confidences.
+    - image_to_string: Performs OCR on an image with the backend selected by OCR_BACKEND.
+    - image_to_data: Returns the words with confidences of an image, with the backend selected by OCR_BACKEND.
+    - is_timeout: Checks whether a pytesseract error is a timeout.
+    - ocr_page_with_status: Performs OCR on a single image with a timeout and a downsampled fallback.
+    - ocr_downsampled: Performs OCR on a downsampled copy of an image.
+    - parallel_map: Applies a function to every item, serially or on a pool of threads.
+    - make_configuration: Builds the Tesseract options, including the user-words and user-patterns files.
     - ocr_page: Performs OCR on a single image and returns the text.
+    - ocr_page_data: Performs OCR on a single image and returns the text, grouped into lines with confidences.
+    - group_lines: Groups the word-level output of Tesseract into lines.
+    - text_from_lines: Rebuilds the page text from grouped lines.
+    - mean_confidence: Computes the mean word confidence of a list of lines.
+    - find_low_lines: Finds the lines of a page whose confidence is below a threshold.
+    - segment_lines: Splits a binarized page into text lines using its horizontal projection profile.
+    - ocr_lines: Performs OCR on line crops in parallel batches, one line per Tesseract call.
+    - ocr_page_by_lines_data: Performs OCR on a single image line by line and returns the lines with confidences.
+    - ocr_page_by_lines: Performs OCR on a single image line by line and returns the reassembled text.
+    - page_number_from_filename: Parses the page number from an image filename.
+    - list_pages: Lists the page images of a directory, sorted by page number.
+    - merge_content: Merges the pages of several (partial) OCR runs.
+    - dump_atomic: Writes a JSON file atomically.
     - ocr_directory: Performs OCR on all images within a directory, saving results to a JSON file.
 
 Requires:
@@ -21,29 +54,715 @@ Requires:
 
 import pytesseract
 from PIL import Image
+import numpy as np
 import os
-import json
+import re
+import shlex
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
+import json_backend
+
 pytesseract.pytesseract.tesseract_cmd = 'C:/Program Files/Tesseract-OCR/tesseract.exe'
 
-def ocr_page(path_to_image, language="nld", config="3"):
+# OCR backend used by ocr_page, ocr_directory and the line OCR:
+#   "pytesseract": pytesseract writes every image to a temporary file and reads the result back from another one.
+#   "stdin":       the image is piped to `tesseract stdin stdout` as PGM/PBM bytes, no temporary files are written.
+#                  Text (image_to_string) and words with confidences (image_to_data, as TSV) both go this way.
+OCR_BACKEND = "pytesseract"
+
+def parallel_map(function, items, max_workers=1):
+	"""
+	Applies a function to every item, in order, on a pool of max_workers threads, or serially without a pool
+	if max_workers is 1.
+
+	Every Tesseract process starts its own OpenMP threads, so with more than one worker OMP_THREAD_LIMIT is set
+	to 1 (unless it was set already) to keep the processes from oversubscribing the CPU. The processes started
+	by pytesseract inherit it from the environment.
+
+	Parameters:
+	function (callable): Function of one item.
+	items (list): The items.
+	max_workers (int): Number of items that are processed at the same time.
+
+	Yields:
+	The result of every item, in the order of the items.
+	"""
+	if max_workers <= 1:
+		yield from map(function, items)
+		return
+
+	os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+	with ThreadPoolExecutor(max_workers=max_workers) as executor:
+		yield from executor.map(function, items)
+
+
+def make_configuration(config, user_words=None, user_patterns=None):
+	"""
+	Builds the Tesseract command line options.
+
+	Parameters:
+	config (str): Page segmentation mode passed to Tesseract as --psm.
+	user_words (str): Path to a user-words file (see ocr_dictionary.py), or None. Only the legacy and combined
+		engines (--oem 0 and 2) make real use of it, the LSTM engine of tessdata_fast/best largely ignores it.
+	user_patterns (str): Path to a user-patterns file (see ocr_dictionary.py), or None. The same applies.
+
+	Returns:
+	str: Configuration string for pytesseract.
+	"""
+	configuration = "--psm " + config
+	if user_words:
+		configuration += " --user-words " + user_words
+	if user_patterns:
+		configuration += " --user-patterns " + user_patterns
+	return configuration
+
+
+def image_to_pnm(image):
+	"""
+	Encodes an image as PGM (grayscale) or, for boolean arrays, PBM (black and white) bytes.
+
+	Parameters:
+	image (PIL.Image.Image or numpy.ndarray): Image to encode. Color images are converted to grayscale.
+
+	Returns:
+	bytes: The encoded image, header included.
+	"""
+	if isinstance(image, Image.Image):
+		image = image.convert('L')
+	array = np.asarray(image)
+	if array.ndim == 3:
+		array = np.asarray(Image.fromarray(array).convert('L'))
+
+	height, width = array.shape
+	if array.dtype == bool:
+		# In PBM a set bit is black, so ink (False on white paper) is inverted
+		return f'P4\n{width} {height}\n'.encode('ascii') + np.packbits(~array, axis=1).tobytes()
+
+	if array.dtype != np.uint8:
+		array = np.clip(array, 0, 255).astype(np.uint8)
+	return f'P5\n{width} {height}\n255\n'.encode('ascii') + np.ascontiguousarray(array).tobytes()
+
+
+def _run_tesseract_stdin(image, language, configuration, timeout, output=None):
+	# Pipes the image to `tesseract stdin stdout` and returns what Tesseract writes, output is e.g. 'tsv'
+	command = [pytesseract.pytesseract.tesseract_cmd, 'stdin', 'stdout', '-l', language]
+	command += shlex.split(configuration, posix=os.name != 'nt')
+	if output is not None:
+		command.append(output)
+	try:
+		process = subprocess.run(command, input=image_to_pnm(image), capture_output=True, timeout=timeout or None)
+	except subprocess.TimeoutExpired:
+		raise RuntimeError('Tesseract process timeout')
+	except FileNotFoundError:
+		raise pytesseract.TesseractNotFoundError()
+
+	if process.returncode:
+		raise pytesseract.TesseractError(process.returncode, process.stderr.decode('utf-8', errors='replace'))
+
+	return process.stdout.decode('utf-8')
+
+
+def image_to_string_stdin(image, language="nld", configuration="", timeout=0):
+	"""
+	Performs OCR by piping the image to `tesseract stdin stdout`, without writing temporary files.
+
+	Like pytesseract, Tesseract inherits the environment, so it is limited to one thread when parallel_map runs
+	several processes at the same time.
+
+	Parameters:
+	image (PIL.Image.Image or numpy.ndarray): Image to OCR.
+	language (str): Language code for OCR (default is Dutch "nld").
+	configuration (str): Tesseract command line options, see make_configuration.
+	timeout (float): Maximum number of seconds Tesseract may take, 0 for no limit.
+
+	Returns:
+	str: Extracted text from the image.
+
+	Raises:
+	RuntimeError: 'Tesseract process timeout' on timeout, the same error pytesseract raises.
+	pytesseract.TesseractError: If Tesseract fails.
+	"""
+	return _run_tesseract_stdin(image, language, configuration, timeout)
+
+
+def parse_tsv(tsv):
+	"""
+	Parses the TSV output of Tesseract into the dictionary that pytesseract.image_to_data returns with
+	output_type=Output.DICT: one list per column, "text" as strings, "conf" as floats, the others as integers.
+
+	Parameters:
+	tsv (str): TSV output of Tesseract, header included.
+
+	Returns:
+	dict: Column name mapped to the list of its values.
+	"""
+	rows = [row for row in tsv.split('\n') if row]
+	if not rows:
+		return {}
+	header = rows[0].split('\t')
+	data = {column: [] for column in header}
+	for row in rows[1:]:
+		values = row.split('\t', len(header) - 1)
+		values += [''] * (len(header) - len(values))
+		for column, value in zip(header, values):
+			if column == 'text':
+				data[column].append(value)
+			elif column == 'conf':
+				data[column].append(float(value))
+			else:
+				data[column].append(int(value))
+	return data
+
+
+def image_to_data_stdin(image, language="nld", configuration="", timeout=0):
+	"""
+	Performs OCR by piping the image to `tesseract stdin stdout tsv`, without writing temporary files, and returns
+	the words with their positions and confidences.
+
+	Parameters:
+	image (PIL.Image.Image or numpy.ndarray): Image to OCR.
+	language (str): Language code for OCR (default is Dutch "nld").
+	configuration (str): Tesseract command line options, see make_configuration.
+	timeout (float): Maximum number of seconds Tesseract may take, 0 for no limit.
+
+	Returns:
+	dict: The words as returned by parse_tsv.
+
+	Raises:
+	RuntimeError: 'Tesseract process timeout' on timeout, the same error pytesseract raises.
+	pytesseract.TesseractError: If Tesseract fails.
+	"""
+	return parse_tsv(_run_tesseract_stdin(image, language, configuration, timeout, 'tsv'))
+
+
+def image_to_string(image, language="nld", configuration="", timeout=0):
+	"""
+	Performs OCR on an image in memory with the backend selected by OCR_BACKEND.
+
+	Parameters:
+	image (PIL.Image.Image or numpy.ndarray): Image to OCR.
+	language (str): Language code for OCR (default is Dutch "nld").
+	configuration (str): Tesseract command line options, see make_configuration.
+	timeout (float): Maximum number of seconds Tesseract may take, 0 for no limit.
+
+	Returns:
+	str: Extracted text from the image.
+	"""
+	if OCR_BACKEND == "stdin":
+		return image_to_string_stdin(image, language, configuration, timeout)
+	return pytesseract.image_to_string(image, lang=language, config=configuration, timeout=timeout)
+
+
+def image_to_data(image, language="nld", configuration="", timeout=0):
+	"""
+	Performs OCR on an image in memory with the backend selected by OCR_BACKEND and returns the words with their
+	positions and confidences.
+
+	Parameters:
+	image (PIL.Image.Image or numpy.ndarray): Image to OCR.
+	language (str): Language code for OCR (default is Dutch "nld").
+	configuration (str): Tesseract command line options, see make_configuration.
+	timeout (float): Maximum number of seconds Tesseract may take, 0 for no limit.
+
+	Returns:
+	dict: The output of pytesseract.image_to_data with output_type=Output.DICT, or the same from parse_tsv.
+	"""
+	if OCR_BACKEND == "stdin":
+		return image_to_data_stdin(image, language, configuration, timeout)
+	return pytesseract.image_to_data(image, lang=language, config=configuration, output_type=pytesseract.Output.DICT, timeout=timeout)
+
+
+def is_timeout(error):
+	"""
+	Checks whether an error raised by pytesseract is a timeout of the Tesseract process.
+
+	Parameters:
+	error (RuntimeError): Error raised by pytesseract.
+
+	Returns:
+	bool: True if Tesseract was killed because it ran longer than the timeout.
+	"""
+	return str(error) == 'Tesseract process timeout'
+
+
+def ocr_page_with_status(path_to_image, language="nld", config="3", user_words=None, user_patterns=None, timeout=0, fallback_scale=0.5, fallback_config="6"):
+	"""
+	Performs OCR on a single image with a time limit and reports whether the result is degraded.
+
+	If Tesseract does not finish within the timeout, the image is downsampled by fallback_scale and OCR'd again
+	with the simpler page segmentation mode fallback_config (and the same timeout). If that times out as well,
+	an empty text is returned. Either way the page is reported as degraded.
+
+	Parameters:
+	path_to_image (str): Path to the image file.
+	language (str): Language code for OCR (default is Dutch "nld").
+	config (str): Page segmentation mode passed to Tesseract as --psm.
+	user_words (str): Path to a user-words file (see ocr_dictionary.py), or None.
+	user_patterns (str): Path to a user-patterns file (see ocr_dictionary.py), or None.
+	timeout (float): Maximum number of seconds per Tesseract call, 0 for no limit.
+	fallback_scale (float): Scale of the downsampled image used after a timeout.
+	fallback_config (str): Page segmentation mode used after a timeout.
+
+	Returns:
+	tuple: (extracted text, True if the fallback was used)
+	"""
+	image = Image.open(path_to_image)
+	configuration = make_configuration(config, user_words, user_patterns)
+	try:
+		return image_to_string(image, language, configuration, timeout), False
+	except RuntimeError as e:
+		if not is_timeout(e):
+			raise
+
+	print(f"Warning: OCR of {path_to_image} timed out after {timeout}s, retrying downsampled with --psm {fallback_config}")
+	return ocr_downsampled(image, language, fallback_config, user_words, user_patterns, timeout, fallback_scale), True
+
+
+def ocr_downsampled(image, language="nld", config="6", user_words=None, user_patterns=None, timeout=0, scale=0.5):
+	"""
+	Performs OCR on a downsampled copy of an image, the fallback for a page that timed out.
+
+	Parameters:
+	image (str or PIL.Image.Image): Path to the image file or the image itself.
+	language (str): Language code for OCR (default is Dutch "nld").
+	config (str): Page segmentation mode passed to Tesseract as --psm.
+	user_words (str): Path to a user-words file (see ocr_dictionary.py), or None.
+	user_patterns (str): Path to a user-patterns file (see ocr_dictionary.py), or None.
+	timeout (float): Maximum number of seconds Tesseract may take, 0 for no limit.
+	scale (float): Scale of the downsampled image.
+
+	Returns:
+	str: Extracted text, or an empty text if Tesseract timed out again.
+	"""
+	if isinstance(image, str):
+		image = Image.open(image)
+	size = (max(int(image.width * scale), 1), max(int(image.height * scale), 1))
+	small_image = image.resize(size, Image.LANCZOS)
+	configuration = make_configuration(config, user_words, user_patterns)
+	try:
+		return image_to_string(small_image, language, configuration, timeout)
+	except RuntimeError as e:
+		if not is_timeout(e):
+			raise
+		print(f"Warning: OCR of {getattr(image, 'filename', 'an image')} timed out again, page is left empty")
+		return ''
+
+
+def ocr_page(path_to_image, language="nld", config="3", user_words=None, user_patterns=None, timeout=0):
 	"""
 	Performs OCR on a single image and returns the extracted text.
 
 	Parameters:
 	path_to_image (str): Path to the image file.
 	language (str): Language code for OCR (default is Dutch "nld").
+	user_words (str): Path to a user-words file with the known vocabulary (see ocr_dictionary.py), or None.
+	user_patterns (str): Path to a user-patterns file for initials and house numbers, or None.
+	timeout (float): Maximum number of seconds Tesseract may take, 0 for no limit. After a timeout a
+		downsampled image is OCR'd with a simpler page segmentation mode (see ocr_page_with_status).
 
 	Returns:
 	str: Extracted text from the image.
 	"""
-	image = Image.open(path_to_image)
-	configuration = "--psm " + config
-	text = pytesseract.image_to_string(image, lang=language, config=configuration)
+	text, _ = ocr_page_with_status(path_to_image, language, config, user_words, user_patterns, timeout)
 	return text
 
-def ocr_directory(path_to_images_directory, output_directory, language="nld", config="3"):
+def group_lines(data):
+	"""
+	Groups the word-level output of image_to_data into lines.
+
+	Parameters:
+	data (dict): Output of image_to_data (the format of pytesseract.image_to_data with output_type=Output.DICT).
+
+	Returns:
+	list: One dictionary per line, in reading order, with the keys
+		"paragraph" (tuple): (block number, paragraph number) of the line.
+		"words" (list): Recognized words of the line.
+		"confidences" (list): Confidence (0-100) of every word.
+		"box" (list): Bounding box of the line as [left, top, width, height].
+	"""
+	lines = []
+	line_index = {}
+
+	for i, word in enumerate(data['text']):
+		confidence = float(data['conf'][i])
+		if confidence < 0 or not word.strip():
+			continue
+
+		key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+		left, top = data['left'][i], data['top'][i]
+		right, bottom = left + data['width'][i], top + data['height'][i]
+
+		if key not in line_index:
+			line_index[key] = len(lines)
+			lines.append({
+				"paragraph": key[:2],
+				"words": [],
+				"confidences": [],
+				"box": [left, top, right, bottom]
+			})
+
+		line = lines[line_index[key]]
+		line["words"].append(word)
+		line["confidences"].append(confidence)
+		box = line["box"]
+		line["box"] = [min(box[0], left), min(box[1], top), max(box[2], right), max(box[3], bottom)]
+
+	for line in lines:
+		left, top, right, bottom = line["box"]
+		line["box"] = [left, top, right - left, bottom - top]
+
+	return lines
+
+
+def text_from_lines(lines):
+	"""
+	Rebuilds the text of a page from grouped lines, the same way Tesseract lays out its text output:
+	one line per text line and an empty line between paragraphs.
+
+	Parameters:
+	lines (list): Lines as returned by group_lines.
+
+	Returns:
+	str: Text of the page.
+	"""
+	text_lines = []
+	previous_paragraph = None
+
+	for line in lines:
+		if previous_paragraph is not None and line["paragraph"] != previous_paragraph:
+			text_lines.append('')
+		text_lines.append(' '.join(line["words"]))
+		previous_paragraph = line["paragraph"]
+
+	return '\n'.join(text_lines) + '\n'
+
+
+def mean_confidence(lines):
+	"""
+	Computes the mean word confidence of a list of lines.
+
+	Parameters:
+	lines (list): Lines as returned by group_lines.
+
+	Returns:
+	float: Mean confidence (0-100), or 0 if no words were recognized.
+	"""
+	confidences = [confidence for line in lines for confidence in line["confidences"]]
+	if not confidences:
+		return 0.0
+	return sum(confidences) / len(confidences)
+
+
+def find_low_lines(lines, threshold):
+	"""
+	Finds the lines whose mean confidence is below a threshold.
+
+	Parameters:
+	lines (list): Lines as returned by group_lines.
+	threshold (float): Confidence (0-100) below which a line is considered bad.
+
+	Returns:
+	list: One dictionary per bad line with its index in the page text (as split on newlines),
+		its bounding box and its mean confidence.
+	"""
+	low_lines = []
+	text_line_index = 0
+	previous_paragraph = None
+
+	for line in lines:
+		if previous_paragraph is not None and line["paragraph"] != previous_paragraph:
+			text_line_index += 1
+		confidence = mean_confidence([line])
+		if confidence < threshold:
+			low_lines.append({
+				"line": text_line_index,
+				"box": line["box"],
+				"confidence": confidence
+			})
+		text_line_index += 1
+		previous_paragraph = line["paragraph"]
+
+	return low_lines
+
+
+def ocr_page_data(image, language="nld", config="3", user_words=None, user_patterns=None, timeout=0):
+	"""
+	Performs OCR on a single image and returns the recognized lines with their confidences.
+
+	Parameters:
+	image (str, PIL.Image.Image or numpy.ndarray): Path to the image file or the image itself.
+	language (str): Language code for OCR (default is Dutch "nld").
+	config (str): Page segmentation mode passed to Tesseract as --psm.
+	user_words (str): Path to a user-words file (see ocr_dictionary.py), or None.
+	user_patterns (str): Path to a user-patterns file (see ocr_dictionary.py), or None.
+	timeout (float): Maximum number of seconds Tesseract may take, 0 for no limit. A timeout raises RuntimeError.
+
+	Returns:
+	list: Lines as returned by group_lines.
+	"""
+	if isinstance(image, str):
+		image = Image.open(image)
+	configuration = make_configuration(config, user_words, user_patterns)
+	data = image_to_data(image, language, configuration, timeout)
+	return group_lines(data)
+
+
+def segment_lines(image, ink_threshold=128, min_ink=2, min_gap=3, min_height=8, padding=3):
+	"""
+	Splits a binarized page into text lines using its horizontal projection profile.
+
+	Every row of the image is reduced to the number of ink (dark) pixels in it. Consecutive rows with ink form
+	a text line. Runs separated by very small gaps (e.g. the dots on an 'i') are merged, and runs that are too
+	low to be text are dropped as noise.
+
+	Parameters:
+	image (numpy.ndarray): Grayscale or binarized page.
+	ink_threshold (int): Pixel values below this threshold count as ink.
+	min_ink (int): Minimum number of ink pixels for a row to be part of a text line.
+	min_gap (int): Runs separated by fewer empty rows than this are merged into one line.
+	min_height (int): Minimum height of a text line in pixels.
+	padding (int): Number of rows added above and below every line.
+
+	Returns:
+	list: Tuples (top, bottom) with the row range of every text line, from top to bottom.
+	"""
+	profile = (image < ink_threshold).sum(axis=1)
+	is_text = profile >= min_ink
+
+	runs = []
+	start = None
+	for row, text_row in enumerate(is_text):
+		if text_row and start is None:
+			start = row
+		elif not text_row and start is not None:
+			runs.append([start, row])
+			start = None
+	if start is not None:
+		runs.append([start, len(is_text)])
+
+	merged = []
+	for run in runs:
+		if merged and run[0] - merged[-1][1] < min_gap:
+			merged[-1][1] = run[1]
+		else:
+			merged.append(run)
+
+	height = image.shape[0]
+	return [(max(top - padding, 0), min(bottom + padding, height)) for top, bottom in merged if bottom - top >= min_height]
+
+
+def _ocr_line(crop, language, configuration, timeout, record_confidence):
+	# Returns the words and confidences of a line crop, or None if Tesseract timed out
+	try:
+		if record_confidence:
+			data = image_to_data(crop, language, configuration, timeout)
+			lines = group_lines(data)
+			return [word for line in lines for word in line["words"]], [confidence for line in lines for confidence in line["confidences"]]
+		return image_to_string(crop, language, configuration, timeout).split(), []
+	except RuntimeError as e:
+		if not is_timeout(e):
+			raise
+		return None
+
+
+def _ocr_line_batch(crops, language, configuration, timeout, record_confidence):
+	return [_ocr_line(crop, language, configuration, timeout, record_confidence) for crop in crops]
+
+
+def ocr_lines(image, lines, language="nld", config="7", batch_size=8, max_workers=4, user_words=None, user_patterns=None, timeout=0, record_confidence=False):
+	"""
+	Performs OCR on the line crops of a page. The crops are divided into batches that are OCR'd in parallel,
+	every crop with its own Tesseract call.
+
+	Parameters:
+	image (numpy.ndarray): Page image.
+	lines (list): Row ranges as returned by segment_lines.
+	language (str): Language code for OCR (default is Dutch "nld").
+	config (str): Page segmentation mode for a single line (default is "7").
+	batch_size (int): Number of line crops handled by a worker at a time.
+	max_workers (int): Number of batches that are OCR'd in parallel.
+	user_words (str): Path to a user-words file (see ocr_dictionary.py), or None.
+	user_patterns (str): Path to a user-patterns file (see ocr_dictionary.py), or None.
+	timeout (float): Maximum number of seconds per line, 0 for no limit.
+	record_confidence (bool): Also return the confidence of every word (uses image_to_data).
+
+	Returns:
+	list: For every line in the same order as lines a tuple (words, confidences), with empty confidences
+		without record_confidence, or None if the line timed out.
+	"""
+	configuration = make_configuration(config, user_words, user_patterns)
+	crops = [image[top:bottom] for top, bottom in lines]
+	batches = [crops[i:i + batch_size] for i in range(0, len(crops), batch_size)]
+
+	results = parallel_map(lambda batch: _ocr_line_batch(batch, language, configuration, timeout, record_confidence), batches, max_workers)
+	return [result for batch in results for result in batch]
+
+
+def ocr_page_by_lines_data(path_to_image, language="nld", config="7", batch_size=8, max_workers=4, paragraph_gap=1.5, user_words=None, user_patterns=None, timeout=0, record_confidence=False):
+	"""
+	Performs OCR on a single image line by line and returns the recognized lines in the format of group_lines.
+
+	A new paragraph starts wherever the gap to the previous recognized line is larger than paragraph_gap times
+	the median line height, so text_from_lines lays the text out like the output of ocr_page.
+
+	Parameters:
+	path_to_image (str): Path to the image file.
+	language (str): Language code for OCR (default is Dutch "nld").
+	config (str): Page segmentation mode for a single line (default is "7").
+	batch_size (int): Number of line crops handled by a worker at a time.
+	max_workers (int): Number of batches that are OCR'd in parallel.
+	paragraph_gap (float): Gap, relative to the median line height, that separates paragraphs.
+	user_words (str): Path to a user-words file (see ocr_dictionary.py), or None.
+	user_patterns (str): Path to a user-patterns file (see ocr_dictionary.py), or None.
+	timeout (float): Maximum number of seconds per line, 0 for no limit. Lines that time out are left out.
+	record_confidence (bool): Also recognize the confidence of every word.
+
+	Returns:
+	tuple: (lines as returned by group_lines, True if a line timed out)
+	"""
+	image = np.asarray(Image.open(path_to_image).convert('L'))
+	row_ranges = segment_lines(image)
+	if not row_ranges:
+		return [], False
+
+	results = ocr_lines(image, row_ranges, language, config, batch_size, max_workers, user_words, user_patterns, timeout, record_confidence)
+	median_height = float(np.median([bottom - top for top, bottom in row_ranges]))
+
+	lines = []
+	degraded = False
+	paragraph = 0
+	previous_bottom = None
+	for result, (top, bottom) in zip(results, row_ranges):
+		if result is None:
+			print(f"Warning: OCR of a line of {path_to_image} timed out after {timeout}s, leaving it out")
+			degraded = True
+			continue
+		words, confidences = result
+		if not words:
+			continue
+		# The gap is measured to the last line that was kept, not to a skipped empty line
+		if previous_bottom is not None and top - previous_bottom > paragraph_gap * median_height:
+			paragraph += 1
+		lines.append({
+			"paragraph": (0, paragraph),
+			"words": words,
+			"confidences": confidences,
+			"box": [0, top, image.shape[1], bottom - top]
+		})
+		previous_bottom = bottom
+
+	return lines, degraded
+
+
+def ocr_page_by_lines(path_to_image, language="nld", config="7", batch_size=8, max_workers=4, paragraph_gap=1.5, user_words=None, user_patterns=None, timeout=0):
+	"""
+	Performs OCR on a single image line by line and returns the reassembled text.
+
+	An empty line is inserted wherever the gap between two lines is larger than paragraph_gap times the
+	median line height, so the text has the same layout as the output of ocr_page.
+
+	Parameters:
+	path_to_image (str): Path to the image file.
+	language (str): Language code for OCR (default is Dutch "nld").
+	config (str): Page segmentation mode for a single line (default is "7").
+	batch_size (int): Number of line crops handled by a worker at a time.
+	max_workers (int): Number of batches that are OCR'd in parallel.
+	paragraph_gap (float): Gap, relative to the median line height, that separates paragraphs.
+	user_words (str): Path to a user-words file (see ocr_dictionary.py), or None.
+	user_patterns (str): Path to a user-patterns file (see ocr_dictionary.py), or None.
+	timeout (float): Maximum number of seconds per line, 0 for no limit. Lines that time out are left out.
+
+	Returns:
+	str: Extracted text from the image, one text line per line.
+	"""
+	lines, _ = ocr_page_by_lines_data(path_to_image, language, config, batch_size, max_workers, paragraph_gap, user_words, user_patterns, timeout)
+	if not lines:
+		return ''
+	return text_from_lines(lines)
+
+
+def page_number_from_filename(filename):
+	"""
+	Parses the page number from an image filename as written by convert_pdf_to_jpg.py,
+	e.g. 'improved_1926_page_0121.jpg' is page 121.
+
+	Parameters:
+	filename (str): Filename of the page image.
+
+	Returns:
+	int: Page number, or None if the filename does not contain '_page_<number>'.
+	"""
+	match = re.search(r'_page_(\d+)', filename)
+	if match:
+		return int(match.group(1))
+	return None
+
+
+def list_pages(path_to_images_directory):
+	"""
+	Lists the page images in a directory, sorted by the page number in their filename.
+
+	The order does not depend on the order in which the file system lists the directory, so the same
+	filename always gets the same page number, whether a book is OCR'd in one go, in parallel or resumed.
+
+	Parameters:
+	path_to_images_directory (str): Directory path containing image files for OCR.
+
+	Returns:
+	list: Tuples (page number, filename), sorted by page number.
+	"""
+	pages = []
+	for filename in os.listdir(path_to_images_directory):
+		page_number = page_number_from_filename(filename)
+		if page_number is None:
+			print(f"Warning: No page number in {filename}, skipping it")
+			continue
+		pages.append((page_number, filename))
+
+	return sorted(pages)
+
+
+def merge_content(*contents):
+	"""
+	Merges lists of page objects into one list with one object per page, sorted by page number.
+	If a page occurs more than once, the object from the last list wins.
+
+	Parameters:
+	*contents (list): Lists of page objects, e.g. the "content" of partial or earlier OCR runs.
+
+	Returns:
+	list: Page objects sorted by page number.
+	"""
+	pages = {}
+	for content in contents:
+		for page in content:
+			pages[page["page"]] = page
+	return [pages[page_number] for page_number in sorted(pages)]
+
+
+def dump_atomic(data, path_to_json):
+	"""
+	Writes a JSON file atomically: the data is written to a temporary file in the same directory, which then
+	replaces the file. An interrupted write leaves the previous file intact.
+
+	Parameters:
+	data (object): The data to write.
+	path_to_json (str): Path to the JSON file.
+	"""
+	file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path_to_json) or '.', suffix='.tmp')
+	os.close(file_descriptor)
+	try:
+		json_backend.dump(data, temporary_path)
+		os.replace(temporary_path, path_to_json)
+	except BaseException:
+		os.remove(temporary_path)
+		raise
+
+
+def ocr_directory(path_to_images_directory, output_directory, language="nld", config="3", record_confidence=False, line_threshold=60, mode="page", user_words=None, user_patterns=None, timeout=60, max_workers=1, resume=False, line_config="7", checkpoint_every=10):
 	"""
 	Performs OCR on all images within a specified directory, storing results in a JSON file.
 
@@ -51,6 +770,28 @@ def ocr_directory(path_to_images_directory, output_directory, language="nld", co
 	path_to_images_directory (str): Directory path containing image files for OCR.
 	output_directory (str): Directory path for saving the output JSON file.
 	language (str): Language code for OCR (default is Dutch "nld").
+	record_confidence (bool): Also store the mean confidence of every page and the lines whose
+		confidence is below line_threshold, as used by reocr.py.
+	line_threshold (float): Confidence below which a line is recorded as a low-confidence line.
+	mode (str): "page" to OCR every image as a whole with the given config, or "lines" to segment every
+		image into text lines and OCR them one by one with line_config (see ocr_page_by_lines). The dictionary
+		files, the timeout (per line) and record_confidence apply to both modes.
+	user_words (str): Path to a user-words file (see ocr_dictionary.py), or None.
+	user_patterns (str): Path to a user-patterns file (see ocr_dictionary.py), or None.
+	timeout (float): Maximum number of seconds Tesseract may spend on a page, 0 for no limit. Pages that
+		time out are OCR'd again downsampled with a simpler page segmentation mode and marked as degraded,
+		so one pathological page cannot stall a whole book.
+	max_workers (int): Number of Tesseract processes that run at the same time, 1 (default) to OCR serially.
+		In "page" mode the pages are OCR'd in parallel, in "lines" mode the pages are OCR'd one after the other
+		and the lines of a page in parallel, so the pools are never nested.
+	resume (bool): Keep the pages of an existing output file and only OCR the images that are not in it yet,
+		or that are marked as degraded.
+	line_config (str): Page segmentation mode for a single line in "lines" mode (default is "7").
+	checkpoint_every (int): Number of pages after which the output file is written, so a run that is
+		interrupted can be resumed from the last checkpoint.
+
+	Pages are numbered by the page number in their filename (see list_pages), so the output of separate,
+	parallel or resumed runs can be merged page by page (see merge_content).
 
 	Output JSON:
 	{
@@ -58,11 +799,22 @@ def ocr_directory(path_to_images_directory, output_directory, language="nld", co
 		"content": [
 			{
 				"page": (int),
-				"text": (str)
+				"text": (str),
+				"filename": (str),
+				"degraded": true,                  (only if the page or one of its lines timed out)
+				"confidence": (float),             (only with record_confidence)
+				"low_lines": [                     (only with record_confidence)
+					{
+						"line": (int),             index in text.split('\n')
+						"box": [left, top, width, height],
+						"confidence": (float)
+					}
+				]
 			},
 			{
 				"page": (int),
-				"text": (str)
+				"text": (str),
+				"filename": (str)
 			}
 		]
 	}
@@ -86,27 +838,86 @@ def ocr_directory(path_to_images_directory, output_directory, language="nld", co
 		"content": []
 	}
 
-	content = []
+	output_directory_text = os.path.join(output_directory, 'text')
+	output_file_path = os.path.join(output_directory_text, book_year + ".json")
+
+	previous = []
+	if resume and os.path.exists(output_file_path):
+		previous = [page for page in json_backend.iter_items(output_file_path, "content") if "filename" in page]
+	# Degraded pages are OCR'd again, the previous result is kept until the new one replaces it
+	done_filenames = {page["filename"] for page in previous if not page.get("degraded")}
+	if resume:
+		print(f'Resuming: {len(done_filenames)} pages already done, {len(previous) - len(done_filenames)} degraded pages to redo')
 
-	for page_number, filename in tqdm(enumerate(os.listdir(path_to_images_directory)), total=len(os.listdir(path_to_images_directory)), ncols=100, desc="OCRing Images", unit="image"):
+	pages = [(page_number, filename) for page_number, filename in list_pages(path_to_images_directory) if filename not in done_filenames]
+
+	def ocr_file(page_number, filename):
 		path_to_image = os.path.join(path_to_images_directory, filename)
-		text = ocr_page(path_to_image, language, config)
-		page_data = {
-			"page": page_number + 1,
-			"text": text
-		}
-		content.append(page_data)
-	
-	data["content"] = content
-	json_string = json.dumps(data, indent=4)
+		if mode == "lines":
+			lines, degraded = ocr_page_by_lines_data(path_to_image, language, line_config, max_workers=max_workers, user_words=user_words,
+													 user_patterns=user_patterns, timeout=timeout, record_confidence=record_confidence)
+			page_data = {
+				"page": page_number,
+				"text": text_from_lines(lines) if lines else '',
+				"filename": filename
+			}
+			if degraded:
+				page_data["degraded"] = True
+			if record_confidence:
+				page_data["confidence"] = mean_confidence(lines)
+				page_data["low_lines"] = find_low_lines(lines, line_threshold)
+		elif record_confidence:
+			try:
+				lines = ocr_page_data(path_to_image, language, config, user_words, user_patterns, timeout)
+				page_data = {
+					"page": page_number,
+					"text": text_from_lines(lines),
+					"filename": filename,
+					"confidence": mean_confidence(lines),
+					"low_lines": find_low_lines(lines, line_threshold)
+				}
+			except RuntimeError as e:
+				if not is_timeout(e):
+					raise
+				# Straight to the downsampled image, so a page costs at most twice the timeout
+				print(f"Warning: OCR of {path_to_image} timed out after {timeout}s, retrying downsampled")
+				text = ocr_downsampled(path_to_image, language, config, user_words, user_patterns, timeout)
+				page_data = {
+					"page": page_number,
+					"text": text,
+					"filename": filename,
+					"degraded": True,
+					"confidence": 0.0,
+					"low_lines": []
+				}
+		else:
+			text, degraded = ocr_page_with_status(path_to_image, language, config, user_words, user_patterns, timeout)
+			page_data = {
+				"page": page_number,
+				"text": text,
+				"filename": filename
+			}
+			if degraded:
+				page_data["degraded"] = True
+		return page_data
 
-	output_directory_text = os.path.join(output_directory, 'text')
 	os.makedirs(output_directory_text, exist_ok=True)
-	output_filename = book_year + ".json"
-	output_file_path = os.path.join(output_directory_text, output_filename)
-	outfile = open(output_file_path, 'a+')
-	outfile.write(json_string + '\n')
-	outfile.close()
+	page_workers = 1 if mode == "lines" else max_workers
+	results = parallel_map(lambda page: ocr_file(*page), pages, page_workers)
+	completed = []
+	for page_data in tqdm(results, total=len(pages), ncols=100, desc="OCRing Images", unit="image"):
+		completed.append(page_data)
+		if len(completed) % checkpoint_every == 0:
+			data["content"] = merge_content(previous, completed)
+			dump_atomic(data, output_file_path)
+
+	content = merge_content(previous, completed)
+	degraded_pages = [page["page"] for page in content if page.get("degraded")]
+	if degraded_pages:
+		print(f'Degraded pages (timed out, redone on resume): {degraded_pages}')
+
+	data["content"] = content
+	dump_atomic(data, output_file_path)
 
 # Set the configuration for Tesseract
 '''
@@ -126,13 +937,14 @@ Page segmentation modes:
  12    Sparse text with OSD.
  13    Raw line. Treat the image as a single text line, bypassing hacks that are Tesseract-specific.
 '''
-config = "3"
+if __name__ == "__main__":
+	config = "3"
 
-# OCR a specific page and print the text
-path_to_image = "data/1911/images_improved/improved_1911_page_0106.jpg"
-#print(ocr_page(path_to_image, config=config))
+	# OCR a specific page and print the text
+	path_to_image = "data/1911/images_improved/improved_1911_page_0106.jpg"
+	#print(ocr_page(path_to_image, config=config))
 
-# OCR all images in a directory
-path_to_images_directory = "data/1922/images_improved"
-output_directory = "data/1922"
-ocr_directory(path_to_images_directory, output_directory, config=config)
\ No newline at end of file
+	# OCR all images in a directory
+	path_to_images_directory = "data/1922/images_improved"
+	output_directory = "data/1922"
+	ocr_directory(path_to_images_directory, output_directory, config=config)
@@ -0,0 +1,129 @@
+"""
+OCR Dictionary Script
+
+This script builds the user-words and user-patterns files that constrain Tesseract to the vocabulary of the address books:
+- The street names from streets.txt, including the abbreviated forms used in the books (e.g. 'Ebbingestr.').
+- The job titles found in already OCR'd books (see extract.get_job_list).
+- Name prefixes, initials and house numbers, as patterns.
+
+The files are passed to ocr_page/ocr_directory through the user_words and user_patterns parameters,
+which leaves fewer OCR errors for the fuzzy correction in correct_address.py.
+
+Engine modes: the files only have a real effect with the legacy engine, --oem 0, or the combined engine,
+--oem 2. Both need traineddata that contains the legacy model, i.e. the standard tessdata files, not
+tessdata_fast or tessdata_best. The LSTM engine (--oem 1, which --oem 3 picks for the fast and best models)
+largely ignores user words and patterns. benchmark_ocr.py measures the dictionary with and without the files
+on a legacy model (see its __main__).
+
+Modules:
+    - os: For directory and file handling.
+
+Functions:
+    - get_street_words: Returns the words of the street names, including abbreviated forms.
+    - get_job_words: Returns the words of the job titles found in OCR'd books.
+    - get_user_patterns: Returns the Tesseract patterns for initials and house numbers.
+    - build_dictionary: Writes the user-words and user-patterns files.
+"""
+
+import os
+
+from extract import get_job_list
+from pages import iter_pages, RAW
+
+
+PREFIXES = ['van', 'de', 'der', 'den', 'ter', 'ten', 'vander', 'v.', 'd.', 'Van', 'De']
+
+
+def get_street_words(path_to_streets='streets.txt'):
+	"""
+	Returns the words of the street names, including the abbreviated forms used in the books,
+	e.g. 'Ebbingestraat' also gives 'Ebbingestr.'.
+
+	Args:
+		path_to_streets (str): Path to the file with one street name per line.
+
+	Returns:
+		set: Words occurring in the street names.
+	"""
+	with open(path_to_streets, 'r', encoding='utf-8') as f:
+		street_list = f.read().splitlines()
+
+	words = set()
+	for street in street_list:
+		for word in street.split():
+			if not any(char.isalpha() for char in word):
+				continue
+			words.add(word)
+			if word.endswith('straat'):
+				words.add(word[:-len('straat')] + 'str.')
+
+	return words
+
+
+def get_job_words(paths_to_json):
+	"""
+	Returns the words of the job titles found in already OCR'd books.
+
+	Args:
+		paths_to_json (list): Paths to OCR JSON files.
+
+	Returns:
+		set: Words occurring in the job titles.
+	"""
+	words = set()
+	for path_to_json in paths_to_json:
+		for job in get_job_list(iter_pages(path_to_json, normalizers=RAW)):
+			for word in job.split():
+				if len(word) > 1:
+					words.add(word)
+
+	return words
+
+
+def get_user_patterns():
+	"""
+	Returns the Tesseract patterns for the fixed structures in a register line.
+
+	In a pattern \\A is an uppercase letter, \\a a lowercase letter, \\d a digit and \\* means the previous
+	character class can be repeated.
+
+	Returns:
+		list: Patterns for initials (e.g. '(A.B.)') and house numbers (e.g. '12', '46b,').
+	"""
+	initials = ['\\A.', '(\\A.', '\\A.)', '(\\A.)', '(\\A.\\A.)', '(\\A.\\A.\\A.)', '\\A.\\A.', '\\A.\\A.)']
+	housenumbers = ['\\d\\*', '\\d\\*.', '\\d\\*,', '\\d\\*\\a', '\\d\\*\\a.', '\\d\\*\\a,']
+	return initials + housenumbers
+
+
+def build_dictionary(output_directory, path_to_streets='streets.txt', paths_to_json=(), language="nld"):
+	"""
+	Writes the user-words and user-patterns files for Tesseract.
+
+	Args:
+		output_directory (str): Directory in which the files are written.
+		path_to_streets (str): Path to the file with one street name per line.
+		paths_to_json (list): OCR JSON files of books from which job titles are taken.
+		language (str): Language code, used as the prefix of the file names.
+
+	Returns:
+		tuple: Paths to the user-words and the user-patterns file.
+	"""
+	words = get_street_words(path_to_streets) | get_job_words(paths_to_json) | set(PREFIXES)
+
+	os.makedirs(output_directory, exist_ok=True)
+	path_to_words = os.path.join(output_directory, f'{language}.user-words')
+	path_to_patterns = os.path.join(output_directory, f'{language}.user-patterns')
+
+	with open(path_to_words, 'w', encoding='utf-8') as f:
+		f.write('\n'.join(sorted(words)) + '\n')
+
+	with open(path_to_patterns, 'w', encoding='utf-8') as f:
+		f.write('\n'.join(get_user_patterns()) + '\n')
+
+	return path_to_words, path_to_patterns
+
+
+if __name__ == "__main__":
+	paths_to_json = ["book_text/1926.json", "book_text/1927.json"]
+	path_to_words, path_to_patterns = build_dictionary("tessdata_user", paths_to_json=paths_to_json)
+	print(f'Written {path_to_words} and {path_to_patterns}')
@@ -0,0 +1,192 @@
+"""
+Page Store
+
+The extractors only need a range of pages of a book, but json.load has to parse the complete book_text/<year>.json
+to get them. This module keeps an SQLite copy of every book next to its JSON file, with one row per page, so a page
+range is read without loading the rest of the book.
+
+- The store is built automatically the first time a book is read, and rebuilt when the JSON file changes
+  (its modification time or size differs from the one recorded in the store) or the store has no such record.
+- Pages are addressed by their position in "content" (1-based), the same way get_text slices the JSON data,
+  so existing page ranges keep working.
+
+Example:
+    book_text/
+        ├── 1926.json
+        └── 1926.pages.db
+
+Modules:
+    - sqlite3: For storing and querying the pages.
+    - json_backend: For streaming the OCR output once when the store is built.
+
+Functions:
+    - get_store_path: Returns the path of the store that belongs to a JSON file.
+    - build_page_store: Builds the store from a JSON file.
+    - open_page_store: Opens the store of a JSON file, (re)building it when needed.
+    - get_pages: Returns the page objects of a page range.
+    - get_text: Returns the text of a page range.
+"""
+
+import os
+import sqlite3
+import tempfile
+
+import json_backend
+
+
+def get_store_path(path_to_json):
+	"""
+	Returns the path of the store that belongs to a JSON file, e.g. 'book_text/1926.pages.db'.
+
+	Args:
+		path_to_json (str): The path to the JSON file.
+
+	Returns:
+		str: Path to the SQLite file.
+	"""
+	return os.path.splitext(path_to_json)[0] + '.pages.db'
+
+
+def _source_signature(path_to_json):
+	stat = os.stat(path_to_json)
+	return str(stat.st_mtime_ns), str(stat.st_size)
+
+
+def build_page_store(path_to_json, path_to_db=None):
+	"""
+	Builds the store from a JSON file, replacing an existing store.
+
+	Args:
+		path_to_json (str): The path to the JSON file.
+		path_to_db (str): Path to the SQLite file, by default the one returned by get_store_path.
+
+	Returns:
+		str: Path to the SQLite file, or None if the JSON file could not be read.
+	"""
+	if path_to_db is None:
+		path_to_db = get_store_path(path_to_json)
+
+	if not os.path.exists(path_to_json):
+		print(f"Error loading JSON file: {path_to_json} does not exist")
+		return None
+
+	mtime, size = _source_signature(path_to_json)
+	# A temporary file of its own, so concurrent builds of the same store do not write to the same file
+	file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path_to_db) or '.', suffix='.tmp')
+	os.close(file_descriptor)
+
+	# The pages are streamed from the JSON file, so the complete book is never held in memory
+	header = {}
+	connection = sqlite3.connect(temporary_path)
+	try:
+		with connection:
+			connection.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+			connection.execute('CREATE TABLE pages (position INTEGER PRIMARY KEY, page INTEGER, filename TEXT, text TEXT NOT NULL)')
+			connection.executemany('INSERT INTO pages VALUES (?, ?, ?, ?)', (
+				(position, page.get('page'), page.get('filename'), page['text'])
+				for position, page in enumerate(json_backend.iter_items(path_to_json, 'content', header), 1)
+			))
+			connection.executemany('INSERT INTO meta VALUES (?, ?)', [
+				('year', str(header.get('year'))),
+				('source_mtime', mtime),
+				('source_size', size)
+			])
+	except json_backend.JSONDecodeError as e:
+		connection.close()
+		os.remove(temporary_path)
+		print(f"Error loading JSON file: {e}")
+		return None
+	except BaseException:
+		connection.close()
+		os.remove(temporary_path)
+		raise
+	connection.close()
+
+	os.replace(temporary_path, path_to_db)
+	return path_to_db
+
+
+def open_page_store(path_to_json):
+	"""
+	Opens the store of a JSON file. The store is built if it does not exist yet, and rebuilt if the JSON file
+	has changed since it was built.
+
+	Args:
+		path_to_json (str): The path to the JSON file.
+
+	Returns:
+		sqlite3.Connection: Connection to the store, or None if the JSON file could not be read.
+	"""
+	path_to_db = get_store_path(path_to_json)
+
+	if not os.path.exists(path_to_json):
+		if not os.path.exists(path_to_db):
+			print(f"Error loading JSON file: {path_to_json} does not exist")
+			return None
+		return sqlite3.connect(path_to_db)
+
+	if os.path.exists(path_to_db):
+		connection = sqlite3.connect(path_to_db)
+		try:
+			meta = dict(connection.execute('SELECT key, value FROM meta'))
+		except sqlite3.DatabaseError:
+			# No meta table (an incomplete or foreign file) or no database at all: the store is stale
+			meta = {}
+		if (meta.get('source_mtime'), meta.get('source_size')) == _source_signature(path_to_json):
+			return connection
+		connection.close()
+
+	if build_page_store(path_to_json, path_to_db) is None:
+		return None
+	return sqlite3.connect(path_to_db)
+
+
+def get_pages(path_to_json, first_page=1, last_page=None):
+	"""
+	Returns the page objects of a page range, without loading the rest of the book.
+
+	Args:
+		path_to_json (str): The path to the JSON file.
+		first_page (int): Starting page number (inclusive).
+		last_page (int): Ending page number (inclusive), None for the last page of the book.
+
+	Returns:
+		list: Page objects with the keys "page", "text" and "filename", or None if the book could not be read.
+	"""
+	connection = open_page_store(path_to_json)
+	if connection is None:
+		return None
+
+	rows = connection.execute(
+		'SELECT page, filename, text FROM pages WHERE position >= ? AND (? IS NULL OR position <= ?) ORDER BY position',
+		(first_page, last_page, last_page)
+	).fetchall()
+	connection.close()
+
+	return [{"page": page, "text": text, "filename": filename} for page, filename, text in rows]
+
+
+def get_text(path_to_json, first_page, last_page):
+	"""
+	Returns the text of a page range, without loading the rest of the book.
+
+	Args:
+		path_to_json (str): The path to the JSON file.
+		first_page (int): Starting page number (inclusive).
+		last_page (int): Ending page number (inclusive).
+
+	Returns:
+		list: Text from the specified pages, or None if the book could not be read.
+	"""
+	pages = get_pages(path_to_json, first_page, last_page)
+	if pages is None:
+		return None
+	return [page["text"] for page in pages]
+
+
+if __name__ == "__main__":
+	year = "1926"
+	path_to_json = f"book_text/{year}.json"
+	text_list = get_text(path_to_json, 121, 131)
+	if text_list:
+		print(f'Read {len(text_list)} pages from {get_store_path(path_to_json)}')
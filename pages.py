@@ -0,0 +1,171 @@
+"""
+Page Access
+
+One place to read the OCR'd text of a book, shared by all extractors. Pages are read lazily from the page store
+(see page_store.py) and cleaned by a chain of normalizers, so an extractor only holds the page it is working on.
+
+Normalizers are plain functions that take and return the text of a page. A chain is a tuple of normalizers that are
+applied in order. The chains used by the extractors are defined below; a new chain is just a new tuple:
+
+    for page in iter_pages("book_text/1926.json", 121, 131, normalizers=(join_hyphenated, fix_braces)):
+        print(page["page"], page["text"])
+
+Normalized text is cached per (text, chain), so reading the same pages again (e.g. a second pass over a book)
+does not repeat the cleanup.
+
+Functions:
+    - join_hyphenated: Joins words that are hyphenated at the end of a line.
+    - fix_braces: Replaces curly braces, which OCR often reads instead of parentheses.
+    - remove_titles: Removes the titles 'Mej.' and 'Wed.'.
+    - collapse_blank_lines: Replaces empty lines by a single newline.
+    - join_lines: Joins all lines of a page into one line.
+    - normalize: Applies a chain of normalizers to a text.
+    - iter_pages: Yields the (normalized) page objects of a page range.
+    - iter_text: Yields the (normalized) text of the pages in a page range.
+"""
+
+from functools import lru_cache
+
+from page_store import open_page_store
+
+
+def join_hyphenated(text):
+	"""
+	Joins words that are hyphenated at the end of a line.
+
+	Args:
+		text (str): The input text.
+
+	Returns:
+		str: Text without line-end hyphenation.
+	"""
+	return text.replace('-\n', '')
+
+
+def fix_braces(text):
+	"""
+	Replaces curly braces by parentheses, which OCR often reads as braces.
+
+	Args:
+		text (str): The input text.
+
+	Returns:
+		str: Text with parentheses instead of braces.
+	"""
+	return text.replace('{', '(').replace('}', ')')
+
+
+def remove_titles(text):
+	"""
+	Removes the titles 'Mej.' and 'Wed.' that precede some names.
+
+	Args:
+		text (str): The input text.
+
+	Returns:
+		str: Text without the titles.
+	"""
+	return text.replace('Mej.', '').replace('Wed.', '')
+
+
+def collapse_blank_lines(text):
+	"""
+	Replaces empty lines (double newlines) by a single newline.
+
+	Args:
+		text (str): The input text.
+
+	Returns:
+		str: Text without empty lines.
+	"""
+	return text.replace('\n\n', '\n')
+
+
+def join_lines(text):
+	"""
+	Joins all lines of a page into one line.
+
+	Args:
+		text (str): The input text.
+
+	Returns:
+		str: Text without newlines.
+	"""
+	return text.replace('\n', '')
+
+
+# Raw OCR text
+RAW = ()
+# basic_extract.py, basic_extract_test.py
+HYPHENATION = (join_hyphenated,)
+# extract_good_lines.py, extract_with_llm.py
+REGISTER = (join_hyphenated, fix_braces, remove_titles)
+# split_on_housenumbers.py
+SINGLE_LINE = (collapse_blank_lines, join_hyphenated, join_lines)
+
+
+@lru_cache(maxsize=2048)
+def normalize(text, normalizers=HYPHENATION):
+	"""
+	Applies a chain of normalizers to a text. Results are cached.
+
+	Args:
+		text (str): The input text.
+		normalizers (tuple): Normalizers that are applied in order.
+
+	Returns:
+		str: The normalized text.
+	"""
+	for normalizer in normalizers:
+		text = normalizer(text)
+	return text
+
+
+def iter_pages(path_to_json, first_page=1, last_page=None, normalizers=HYPHENATION):
+	"""
+	Yields the page objects of a page range, one at a time, with their text normalized.
+
+	Args:
+		path_to_json (str): The path to the JSON file.
+		first_page (int): Starting page number (inclusive), as a position in the book.
+		last_page (int): Ending page number (inclusive), None for the last page of the book.
+		normalizers (tuple): Normalizers applied to the text of every page.
+
+	Yields:
+		dict: Page object with the keys "position", "page", "filename" and "text".
+	"""
+	connection = open_page_store(path_to_json)
+	if connection is None:
+		return
+
+	try:
+		cursor = connection.execute(
+			'SELECT position, page, filename, text FROM pages WHERE position >= ? AND (? IS NULL OR position <= ?) ORDER BY position',
+			(first_page, last_page, last_page)
+		)
+		for position, page, filename, text in cursor:
+			yield {
+				"position": position,
+				"page": page,
+				"filename": filename,
+				"text": normalize(text, tuple(normalizers))
+			}
+	finally:
+		connection.close()
+
+
+def iter_text(path_to_json, first_page=1, last_page=None, normalizers=HYPHENATION):
+	"""
+	Yields the text of the pages in a page range, one page at a time.
+
+	Args:
+		path_to_json (str): The path to the JSON file.
+		first_page (int): Starting page number (inclusive), as a position in the book.
+		last_page (int): Ending page number (inclusive), None for the last page of the book.
+		normalizers (tuple): Normalizers applied to the text of every page.
+
+	Yields:
+		str: Normalized text of a page.
+	"""
+	for page in iter_pages(path_to_json, first_page, last_page, normalizers):
+		yield page["text"]
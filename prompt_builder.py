@@ -0,0 +1,134 @@
+"""
+Prompt Builder
+
+The extractors used to render the system message (the instructions with the JSON schema) and a new PromptTemplate
+for every register line, although only the record changes between requests. This module renders the prompts once
+per run and keeps the part that is the same for every request in front:
+
+- build_prompts takes the rendered system message and the template of the user message, and splits the template
+  around the record into a static prefix and suffix. The record is the only part that differs between requests.
+- user_message puts a record between the prefix and suffix, without parsing a template again.
+- Every request starts with the same system message object and user prefix, so the token prefix is byte-identical
+  across requests and the automatic prefix caching of vLLM (--enable-prefix-caching) reuses it for every request.
+  The user templates put the record last, after their instructions, so the shared prefix is as long as possible.
+- count_static_tokens reports the number of prompt tokens of the static part (the system message and user prefix),
+  from the /tokenize endpoint of vLLM, or estimated at CHARACTERS_PER_TOKEN if the server does not have it.
+
+Example:
+    prompts = build_prompts(System_Message(jsonschema=schema), HUMAN_TEMPLATE)
+    report_static_tokens(prompts, BASEURL, MODEL)
+    for record in records:
+        ask_llama(prompts["system"], user_message(prompts, record))
+
+Modules:
+    - json: For the request and response of the /tokenize endpoint.
+    - urllib: For calling the /tokenize endpoint of the server.
+
+Functions:
+    - build_prompts: Splits the prompts into their static parts, once per run.
+    - user_message: Builds the user message for a record.
+    - server_root: Returns the root URL of the server from its OpenAI compatible base URL.
+    - count_static_tokens: Returns the number of tokens of the static part of the prompts.
+    - report_static_tokens: Prints the number of tokens of the static part of the prompts.
+"""
+
+import json
+import urllib.error
+import urllib.request
+
+
+# Rough number of characters per token, to estimate the token count without a tokenizer
+CHARACTERS_PER_TOKEN = 4
+
+
+def build_prompts(system, user_template, field="record"):
+	"""
+	Splits the prompts into the parts that are the same for every request.
+
+	Args:
+		system (str): The rendered system message.
+		user_template (str): The template of the user message, with the record as {field}.
+		field (str): The name of the record field in the template.
+
+	Returns:
+		dict: The prompts, with the keys "system", "user_prefix" and "user_suffix".
+	"""
+	placeholder = "{" + field + "}"
+	if user_template.count(placeholder) != 1:
+		raise ValueError(f"The user template must contain {placeholder} exactly once")
+	user_prefix, user_suffix = user_template.split(placeholder)
+	return {"system": system, "user_prefix": user_prefix, "user_suffix": user_suffix}
+
+
+def user_message(prompts, record):
+	"""
+	Builds the user message for a record.
+
+	Args:
+		prompts (dict): The prompts as returned by build_prompts.
+		record (str): The record.
+
+	Returns:
+		str: The user message.
+	"""
+	return prompts["user_prefix"] + record + prompts["user_suffix"]
+
+
+def server_root(base_url):
+	"""
+	Returns the root URL of the server, e.g. 'http://localhost:8000' for 'http://localhost:8000/v1/'.
+
+	Args:
+		base_url (str): The OpenAI compatible base URL.
+
+	Returns:
+		str: The root URL.
+	"""
+	root = base_url.rstrip('/')
+	return root[:-len('/v1')] if root.endswith('/v1') else root
+
+
+def count_static_tokens(prompts, base_url, model, timeout=10):
+	"""
+	Returns the number of prompt tokens of the static part of the prompts: the system message and the user prefix,
+	with the chat template of the model applied by the server. Falls back to an estimate when the server has no
+	/tokenize endpoint (it is vLLM specific) or cannot be reached.
+
+	Args:
+		prompts (dict): The prompts as returned by build_prompts.
+		base_url (str): The OpenAI compatible base URL of the server.
+		model (str): The model name.
+		timeout (float): Timeout of the request in seconds.
+
+	Returns:
+		tuple: The number of tokens and whether it was counted by the server (False if it is an estimate).
+	"""
+	messages = [{"role": "system", "content": prompts["system"]},
+				{"role": "user", "content": prompts["user_prefix"]}]
+	body = json.dumps({"model": model, "messages": messages, "add_generation_prompt": False}).encode('utf-8')
+	request = urllib.request.Request(server_root(base_url) + '/tokenize', data=body, headers={"Content-Type": "application/json"})
+
+	try:
+		with urllib.request.urlopen(request, timeout=timeout) as response:
+			return int(json.loads(response.read())["count"]), True
+	except (urllib.error.URLError, OSError, ValueError, KeyError):
+		static_text = prompts["system"] + prompts["user_prefix"]
+		return len(static_text) // CHARACTERS_PER_TOKEN, False
+
+
+def report_static_tokens(prompts, base_url, model):
+	"""
+	Prints the number of prompt tokens of the static part of the prompts, which the server caches after the first
+	request.
+
+	Args:
+		prompts (dict): The prompts as returned by build_prompts.
+		base_url (str): The OpenAI compatible base URL of the server.
+		model (str): The model name.
+
+	Returns:
+		int: The number of tokens.
+	"""
+	count, exact = count_static_tokens(prompts, base_url, model)
+	print(f'Static prompt prefix: {count} tokens{"" if exact else " (estimated)"}')
+	return count
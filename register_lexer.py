@@ -0,0 +1,249 @@
+"""
+Register Lexer
+
+Some of the regexes used to split register lines backtrack on long garbage lines from OCR noise (a long run of
+letters, or many '(' without a ')'), which takes quadratic time or worse in the length of the line. This module
+reads a line once, left to right, and builds the split helpers on the result, so they take O(n) time per line:
+
+- scan splits a line into raw tokens: words (runs of letters), numbers, whitespace, '(' and ')' and other characters.
+  The scanner pattern has one alternative per kind that cannot fail halfway, so every character is read once.
+- tokenize labels the words and numbers of a register line by their role, e.g. for
+  'Jansen (A. v.) bakker, Hoofdstraat 12a.':
+      SURNAME 'Jansen', INITIALS 'A', PREFIX 'v', JOB 'bakker', STREET 'Hoofdstraat', HOUSENUMBER '12a'
+- parse_line collects the labelled tokens into a person dictionary.
+- split_by_name and split_by_initials_with_context give the same result as the regexes they replace in
+  extract_with_llm.py and extract_good_lines.py (split_by_name for lines without newlines, as the extractors
+  use it). They find the names from the words of the line (the same runs of letters as the word tokens) and the
+  first ')' after them, instead of backtracking.
+
+Functions:
+    - scan: Splits a line into raw tokens.
+    - tokenize: Labels the tokens of a register line.
+    - parse_line: Returns the surname, initials, prefix, job, street and house number of a register line.
+    - split_by_initials_with_context: Splits a line into segments that start with a surname and initials.
+    - split_by_name: Splits a line into names (surname and initials) and the text after each name.
+"""
+
+import re
+from collections import namedtuple
+
+
+# Letters as used by the original regexes ([A-Za-zÀ-ÿ])
+LETTERS = 'A-Za-zÀ-ÿ'
+
+SCANNER = re.compile(
+	rf'(?P<word>[{LETTERS}]+)'
+	r'|(?P<number>\d+)'
+	r'|(?P<space>\s+)'
+	r'|(?P<open>\()'
+	r'|(?P<close>\))'
+	r'|(?P<other>.)',
+	re.DOTALL
+)
+
+# Raw token kinds
+WORD, NUMBER, SPACE, OPEN, CLOSE, OTHER = 'word', 'number', 'space', 'open', 'close', 'other'
+# Labels of tokenize
+SURNAME, INITIALS, PREFIX, JOB, STREET, HOUSENUMBER = 'surname', 'initials', 'prefix', 'job', 'street', 'housenumber'
+
+PREFIX_WORDS = {'van', 'de', 'der', 'den', 'ter', 'ten', 'vander', 'v', 'd', 't', 'vd', 'dt'}
+
+WORD_PATTERN = re.compile(rf'[{LETTERS}]+')
+WHITESPACE_PATTERN = re.compile(r'\s*')
+
+Token = namedtuple('Token', ['kind', 'text', 'start', 'end'])
+
+
+def scan(line):
+	"""
+	Splits a line into raw tokens, in one pass.
+
+	Args:
+		line (str): The input line.
+
+	Returns:
+		list: Tokens (kind, text, start, end), where kind is 'word', 'number', 'space', 'open', 'close' or 'other'.
+	"""
+	return [Token(match.lastgroup, match.group(), match.start(), match.end()) for match in SCANNER.finditer(line)]
+
+
+def tokenize(line):
+	"""
+	Labels the words and numbers of a register line by their role. The line is read as
+	'<surname> (<initials> <prefix>) <job words>, <street> <house number> ...':
+
+	- Words before the first '(' are the surname (or a prefix, like 'van').
+	- Capitals between '(' and ')' are initials, lowercase words are a prefix.
+	- Lowercase words after the initials are job words, until a comma or a capitalized word.
+	- Then the words are the street, until the house number (a number, optionally followed by one letter).
+	- Tokens after the house number and punctuation are labelled 'other'.
+
+	Args:
+		line (str): A register line.
+
+	Returns:
+		list: Tokens (kind, text, start, end), where kind is one of SURNAME, INITIALS, PREFIX, JOB, STREET,
+			HOUSENUMBER or OTHER.
+	"""
+	tokens = []
+	raw = scan(line)
+	state = SURNAME
+	in_group = False
+
+	for index, token in enumerate(raw):
+		kind = token.kind
+		if kind == SPACE:
+			continue
+		if kind == OPEN:
+			in_group = True
+			if state in (SURNAME, JOB):
+				state = INITIALS
+			continue
+		if kind == CLOSE:
+			in_group = False
+			if state == INITIALS:
+				state = JOB
+			continue
+
+		label = OTHER
+		if kind == WORD:
+			lower = token.text.lower()
+			if in_group and state == INITIALS:
+				label = INITIALS if token.text[0].isupper() else PREFIX
+			elif state == SURNAME:
+				label = PREFIX if lower in PREFIX_WORDS else SURNAME
+			elif state == JOB:
+				if token.text[0].isupper():
+					state = label = STREET
+				else:
+					label = JOB
+			elif state == STREET:
+				label = STREET
+			elif state == HOUSENUMBER and len(token.text) == 1 and token.start == raw[index - 1].end and raw[index - 1].kind == NUMBER:
+				# Letter of a house number like '12a'
+				tokens[-1] = Token(HOUSENUMBER, tokens[-1].text + token.text, tokens[-1].start, token.end)
+				state = OTHER
+				continue
+		elif kind == NUMBER and state in (JOB, STREET):
+			state = label = HOUSENUMBER
+		elif kind == OTHER and token.text == ',' and state == JOB:
+			state = STREET
+
+		if state == HOUSENUMBER and label != HOUSENUMBER:
+			state = OTHER
+		tokens.append(Token(label, token.text, token.start, token.end))
+
+	return tokens
+
+
+def parse_line(line):
+	"""
+	Returns the parts of a register line, e.g. 'Jansen (A. B.) bakker, Hoofdstraat 12.' gives
+	{"surname": "Jansen", "initials": "A. B.", "prefix": "", "job": "bakker", "street": "Hoofdstraat", "housenumber": "12"}.
+
+	Args:
+		line (str): A register line.
+
+	Returns:
+		dict: The surname, initials, prefix, job, street and house number (empty strings for missing parts).
+	"""
+	parts = {SURNAME: [], INITIALS: [], PREFIX: [], JOB: [], STREET: [], HOUSENUMBER: []}
+	for token in tokenize(line):
+		if token.kind in parts:
+			parts[token.kind].append(token.text)
+
+	return {
+		"surname": ' '.join(parts[SURNAME]),
+		"initials": ' '.join(initial + '.' for initial in parts[INITIALS]),
+		"prefix": ' '.join(parts[PREFIX]),
+		"job": ' '.join(parts[JOB]),
+		"street": ' '.join(parts[STREET]),
+		"housenumber": ' '.join(parts[HOUSENUMBER])
+	}
+
+
+def _find_names(text):
+	"""
+	Finds the words that are followed by (at most one whitespace character and) a closed parenthesis group,
+	where the pattern '[A-Za-zÀ-ÿ]+\\s?\\([^\\)]*\\)' matches. Every word and every ')' is looked at once.
+
+	Args:
+		text (str): The input text.
+
+	Returns:
+		list: (start of the word, end of the ')' that closes the name) tuples, in order.
+	"""
+	names = []
+	close = -1
+	for match in WORD_PATTERN.finditer(text):
+		end = match.end()
+		if text.startswith('(', end):
+			open_position = end
+		elif text[end:end + 1].isspace() and text.startswith('(', end + 1):
+			open_position = end + 1
+		else:
+			continue
+		# The first ')' after the '(', reusing the previous one if it is still ahead
+		if close <= open_position:
+			close = text.find(')', open_position)
+			if close == -1:
+				break
+		names.append((match.start(), close + 1))
+	return names
+
+
+def split_by_initials_with_context(text):
+	"""
+	Splits the text by surname and initials, while preserving context. Every segment starts with a surname
+	followed by a parenthesis group and runs to the next one.
+
+	Args:
+		text (str): The input text.
+
+	Returns:
+		list: List of segments split by surname-initial pairs.
+	"""
+	spans = []
+	end = 0
+	for start, name_end in _find_names(text):
+		if start < end:
+			# Inside the previous name
+			continue
+		spans.append(start)
+		# The name runs to the first letter after its ')'
+		next_word = WORD_PATTERN.search(text, name_end)
+		end = next_word.start() if next_word else len(text)
+
+	return [text[start:next_start].strip() for start, next_start in zip(spans, spans[1:] + [len(text)])]
+
+
+def split_by_name(text):
+	"""
+	Splits the text by name and the remainder after the name. A name is a surname followed by a parenthesis group,
+	the remainder runs to the next name.
+
+	Args:
+		text (str): The input text, a single line.
+
+	Returns:
+		tuple: A tuple with two lists: one for names and one for the rest of the text.
+	"""
+	names = _find_names(text)
+	name_list = []
+	remainders = []
+
+	index = 0
+	while index < len(names):
+		start, name_end = names[index]
+		remainder_start = WHITESPACE_PATTERN.match(text, name_end).end()
+
+		# The remainder runs to the next name that starts at or after its start
+		index += 1
+		while index < len(names) and names[index][0] < remainder_start:
+			index += 1
+		remainder_end = names[index][0] if index < len(names) else len(text)
+
+		name_list.append(text[start:name_end].strip())
+		remainders.append(text[remainder_start:remainder_end].strip())
+
+	return name_list, remainders
@@ -0,0 +1,230 @@
+"""
+Selective Re-OCR Script
+
+This script runs a second OCR pass over a book that was OCR'd with ocr_directory(..., record_confidence=True).
+Only the regions that Tesseract was unsure about are OCR'd again:
+- Pages whose mean confidence is below a threshold are re-OCR'd as a whole.
+- Lines whose mean confidence is below a threshold (on otherwise good pages) are cropped and re-OCR'd as a single line.
+
+Every region is tried with alternative page segmentation modes and binarization thresholds, in parallel,
+and the result with the highest mean confidence is kept. The JSON file is updated in place.
+
+Modules:
+    - cv2: For reading and re-binarizing the original images.
+    - ocr: For the OCR itself, and parallel_map for re-OCRing pages in parallel (Tesseract runs in its own process).
+    - json_backend: For reading and writing the OCR output.
+
+Functions:
+    - load_variants: Yields the image variants (improved image and re-binarized originals) of a page.
+    - reocr_page: Re-OCRs a whole page with every alternative setting and returns the best result.
+    - reocr_lines: Re-OCRs the low-confidence lines of a page and returns the corrected page text.
+    - reocr_book: Runs the second pass over a complete book.
+"""
+
+import os
+import cv2
+from tqdm import tqdm
+
+import json_backend
+from binarize_images import grayscale, binarize_image, crop_image
+from ocr import ocr_page_data, text_from_lines, mean_confidence, find_low_lines, is_timeout, parallel_map
+
+
+def load_variants(page, path_to_images_directory, path_to_original_directory, thresholds, crop_fraction):
+	"""
+	Yields the image variants of a page: the binarized image used in the first pass, followed by the original
+	image binarized again with every alternative threshold.
+
+	Parameters:
+	page (dict): Page object from the OCR JSON file (must contain "filename").
+	path_to_images_directory (str): Directory with the binarized images of the first pass.
+	path_to_original_directory (str): Directory with the original images, or None to skip re-binarizing.
+	thresholds (list): Alternative binarization thresholds.
+	crop_fraction (float): Crop fraction that was used when binarizing, so boxes keep lining up.
+
+	Yields:
+	tuple: (threshold or None for the first-pass image, image as numpy.ndarray)
+	"""
+	filename = page["filename"]
+	image = cv2.imread(os.path.join(path_to_images_directory, filename), cv2.IMREAD_GRAYSCALE)
+	if image is not None:
+		yield None, image
+
+	if path_to_original_directory is None:
+		return
+
+	original_filename = filename[len("improved_"):] if filename.startswith("improved_") else filename
+	original = cv2.imread(os.path.join(path_to_original_directory, original_filename))
+	if original is None:
+		print(f"Warning: Unable to read {original_filename}")
+		return
+
+	gray_image = grayscale(original)
+	for threshold in thresholds:
+		yield threshold, crop_image(binarize_image(gray_image, threshold), crop_fraction)
+
+
+def _ocr_data(image, language, psm, timeout):
+	# The recognized lines, or None if Tesseract timed out (the setting is then skipped)
+	try:
+		return ocr_page_data(image, language, psm, timeout=timeout)
+	except RuntimeError as e:
+		if not is_timeout(e):
+			raise
+		print(f"Warning: Re-OCR with --psm {psm} timed out after {timeout}s, skipping it")
+		return None
+
+
+def reocr_page(page, variants, psm_list, language="nld", timeout=60):
+	"""
+	Re-OCRs a whole page with every combination of image variant and page segmentation mode.
+
+	Parameters:
+	page (dict): Page object from the OCR JSON file.
+	variants (list): Image variants as yielded by load_variants.
+	psm_list (list): Page segmentation modes to try.
+	language (str): Language code for OCR (default is Dutch "nld").
+	timeout (float): Maximum number of seconds per Tesseract call, 0 for no limit. A setting that times out
+		is skipped, so the first-pass text is kept if all of them do.
+
+	Returns:
+	dict: Best result with the keys "text", "confidence", "lines", "psm" and "threshold".
+		The original page text is kept if no setting scores better.
+	"""
+	best = {
+		"text": page["text"],
+		"confidence": page["confidence"],
+		"lines": None,
+		"psm": None,
+		"threshold": None
+	}
+
+	for threshold, image in variants:
+		for psm in psm_list:
+			lines = _ocr_data(image, language, psm, timeout)
+			if lines is None:
+				continue
+			confidence = mean_confidence(lines)
+			if confidence > best["confidence"]:
+				best = {
+					"text": text_from_lines(lines),
+					"confidence": confidence,
+					"lines": lines,
+					"psm": psm,
+					"threshold": threshold
+				}
+
+	return best
+
+
+def reocr_lines(page, variants, psm_list, language="nld", padding=4, timeout=60):
+	"""
+	Re-OCRs the low-confidence lines of a page as single text lines and splices the best result
+	for every line back into the page text.
+
+	Parameters:
+	page (dict): Page object from the OCR JSON file (must contain "low_lines").
+	variants (list): Image variants as yielded by load_variants.
+	psm_list (list): Single-line page segmentation modes to try, e.g. ["7", "13"].
+	language (str): Language code for OCR (default is Dutch "nld").
+	padding (int): Number of pixels added around every line box before cropping.
+	timeout (float): Maximum number of seconds per Tesseract call, 0 for no limit. A setting that times out
+		is skipped, so the first-pass text of the line is kept if all of them do.
+
+	Returns:
+	tuple: (new page text, list of low lines that are still below their original confidence)
+	"""
+	text_lines = page["text"].split('\n')
+	remaining = []
+
+	for low_line in page["low_lines"]:
+		left, top, width, height = low_line["box"]
+		best_text, best_confidence = None, low_line["confidence"]
+
+		for threshold, image in variants:
+			crop = image[max(top - padding, 0):top + height + padding, max(left - padding, 0):left + width + padding]
+			if crop.size == 0:
+				continue
+			for psm in psm_list:
+				lines = _ocr_data(crop, language, psm, timeout)
+				if lines is None:
+					continue
+				confidence = mean_confidence(lines)
+				if lines and confidence > best_confidence:
+					best_text = ' '.join(word for line in lines for word in line["words"])
+					best_confidence = confidence
+
+		if best_text is not None and low_line["line"] < len(text_lines):
+			text_lines[low_line["line"]] = best_text
+		else:
+			remaining.append(low_line)
+
+	return '\n'.join(text_lines), remaining
+
+
+def _reocr_task(page, path_to_images_directory, path_to_original_directory, page_threshold, line_threshold, psm_list, line_psm_list, thresholds, crop_fraction, language, timeout):
+	variants = list(load_variants(page, path_to_images_directory, path_to_original_directory, thresholds, crop_fraction))
+
+	if page["confidence"] < page_threshold:
+		best = reocr_page(page, variants, psm_list, language, timeout)
+		if best["lines"] is None:
+			return page
+		return dict(page, text=best["text"], confidence=best["confidence"],
+					low_lines=find_low_lines(best["lines"], line_threshold),
+					reocr={"psm": best["psm"], "threshold": best["threshold"]})
+
+	text, remaining = reocr_lines(page, variants, line_psm_list, language, timeout=timeout)
+	return dict(page, text=text, low_lines=remaining)
+
+
+def reocr_book(path_to_json, path_to_images_directory, path_to_original_directory=None, page_threshold=70, line_threshold=60,
+			   psm_list=("4", "6"), line_psm_list=("7", "13"), thresholds=(140, 175), crop_fraction=0.025,
+			   language="nld", max_workers=4, timeout=60):
+	"""
+	Runs a second OCR pass over the low-confidence pages and lines of a book and updates its JSON file.
+
+	Parameters:
+	path_to_json (str): Path to the OCR JSON file written by ocr_directory(..., record_confidence=True).
+	path_to_images_directory (str): Directory with the binarized images of the first pass.
+	path_to_original_directory (str): Directory with the original images, used to try other binarization
+		thresholds. If None, only the page segmentation mode is varied.
+	page_threshold (float): Pages with a mean confidence below this value are re-OCR'd as a whole.
+	line_threshold (float): Confidence below which a line of a re-OCR'd page is kept as a low-confidence line.
+	psm_list (list): Page segmentation modes to try for whole pages.
+	line_psm_list (list): Page segmentation modes to try for single lines.
+	thresholds (list): Alternative binarization thresholds.
+	crop_fraction (float): Crop fraction that was used when binarizing.
+	language (str): Language code for OCR (default is Dutch "nld").
+	max_workers (int): Number of pages that are re-OCR'd in parallel (see ocr.parallel_map).
+	timeout (float): Maximum number of seconds per Tesseract call, 0 for no limit. The low-confidence pages are
+		the ones most likely to stall Tesseract; a setting that times out is skipped.
+	"""
+	data = json_backend.load(path_to_json)
+
+	tasks = {}
+	for index, page in enumerate(data["content"]):
+		if "confidence" not in page or "filename" not in page:
+			print(f'Skipping page {page["page"]}: no confidence recorded, run ocr_directory with record_confidence=True')
+			continue
+		if page["confidence"] < page_threshold or page.get("low_lines"):
+			tasks[index] = page
+
+	print(f'Re-OCRing {len(tasks)} of {len(data["content"])} pages')
+
+	def reocr_task(index):
+		return index, _reocr_task(tasks[index], path_to_images_directory, path_to_original_directory, page_threshold, line_threshold,
+								  list(psm_list), list(line_psm_list), list(thresholds), crop_fraction, language, timeout)
+
+	results = parallel_map(reocr_task, list(tasks), max_workers)
+	for index, page in tqdm(results, total=len(tasks), ncols=100, desc="Re-OCRing Pages", unit="page"):
+		data["content"][index] = page
+
+	json_backend.dump(data, path_to_json)
+
+
+if __name__ == "__main__":
+	year = "1922"
+	path_to_json = f"data/{year}/text/{year}.json"
+	path_to_images_directory = f"data/{year}/images_improved"
+	path_to_original_directory = f"data/{year}/images"
+	reocr_book(path_to_json, path_to_images_directory, path_to_original_directory, page_threshold=70)
@@ -0,0 +1,191 @@
+"""
+Response Cache
+
+The same register entries come back on many pages and in consecutive yearbooks, and after a small change to an
+extractor the whole book is asked again. This module keeps the persons that the model extracted from every record
+in an SQLite file, so a record that was asked before is answered without a request to the server.
+
+- The key is the SHA-256 of the model name, the prompt version and the normalized record (whitespace collapsed).
+- The prompt version is a hash of the rendered prompts (see prompt_builder.py), the batch instructions when records
+  are batched and the output mode, so a change to any of them (or switching batching or structured output on or off)
+  starts with an empty cache for that setup instead of returning answers made under the old one.
+- The cache counts its hits and misses per run (new_stats), report prints the hit rate.
+- Only valid answers are stored. A record without a valid response (e.g. one that does not follow the schema after
+  all retries) is counted as a failure and asked again in the next run.
+
+Example:
+    register/
+        └── llm_cache.db
+
+    cache = open_cache()
+    stats = new_stats()
+    persons = await llm_client.extract_records(client, prompts, records, semaphore, parse_output, cache=cache, stats=stats)
+    report(stats)
+
+Modules:
+    - sqlite3: For storing the responses.
+    - hashlib: For the keys and prompt versions.
+
+Functions:
+    - open_cache: Opens the cache, creating it if it does not exist yet.
+    - prompt_version: Returns the version of a set of prompts.
+    - normalize_record: Normalizes a record before it is hashed.
+    - cache_key: Returns the key of a record.
+    - lookup: Returns the cached persons of a list of keys.
+    - store: Adds the persons of records to the cache.
+    - new_stats: Returns the counters of a run.
+    - report: Prints the hit rate of a run.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+
+CACHE_PATH = 'register/llm_cache.db'
+
+# Maximum number of keys per SELECT, below the limit of SQLite on the number of parameters
+LOOKUP_CHUNK_SIZE = 500
+
+
+def open_cache(path_to_cache=CACHE_PATH):
+	"""
+	Opens the cache, creating it if it does not exist yet.
+
+	Args:
+		path_to_cache (str): Path to the SQLite file.
+
+	Returns:
+		sqlite3.Connection: Connection to the cache.
+	"""
+	directory = os.path.dirname(path_to_cache)
+	if directory:
+		os.makedirs(directory, exist_ok=True)
+	connection = sqlite3.connect(path_to_cache)
+	connection.execute('''
+		CREATE TABLE IF NOT EXISTS responses (
+			key TEXT PRIMARY KEY,
+			model TEXT,
+			record TEXT,
+			persons TEXT,
+			created REAL
+		)
+	''')
+	return connection
+
+
+def prompt_version(prompts, batch_instructions=None, structured=False):
+	"""
+	Returns the version of a set of prompts: a hash of the system message, the user template, the batch
+	instructions and the output mode.
+
+	Args:
+		prompts (dict): The prompts as returned by prompt_builder.build_prompts.
+		batch_instructions (str): The batch instructions of the system and user message (see
+			llm_client.records_version) when records are asked in batches, None when they are asked one at a time.
+		structured (bool): Whether the responses are constrained to a JSON schema instead of free text.
+
+	Returns:
+		str: The version.
+	"""
+	mode = 'structured' if structured else 'text'
+	batching = 'batch:' + batch_instructions if batch_instructions is not None else 'single'
+	text = '\0'.join((prompts["system"], prompts["user_prefix"], prompts["user_suffix"], batching, mode))
+	return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def normalize_record(record):
+	"""
+	Normalizes a record before it is hashed: leading and trailing whitespace is removed and other whitespace is
+	collapsed into single spaces.
+
+	Args:
+		record (str): The record.
+
+	Returns:
+		str: The normalized record.
+	"""
+	return ' '.join(record.split())
+
+
+def cache_key(model, version, record):
+	"""
+	Returns the key of a record.
+
+	Args:
+		model (str): The model name.
+		version (str): The prompt version.
+		record (str): The record.
+
+	Returns:
+		str: The key.
+	"""
+	text = '\0'.join((model, version, normalize_record(record)))
+	return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def lookup(connection, keys):
+	"""
+	Returns the cached persons of a list of keys.
+
+	Args:
+		connection (sqlite3.Connection): Connection to the cache.
+		keys (list): The keys.
+
+	Returns:
+		dict: The list of persons for every key that is in the cache.
+	"""
+	found = {}
+	unique_keys = list(dict.fromkeys(keys))
+	for start in range(0, len(unique_keys), LOOKUP_CHUNK_SIZE):
+		chunk = unique_keys[start:start + LOOKUP_CHUNK_SIZE]
+		placeholders = ', '.join('?' * len(chunk))
+		for key, persons in connection.execute(f'SELECT key, persons FROM responses WHERE key IN ({placeholders})', chunk):
+			found[key] = json.loads(persons)
+	return found
+
+
+def store(connection, model, entries):
+	"""
+	Adds the persons of records to the cache.
+
+	Args:
+		connection (sqlite3.Connection): Connection to the cache.
+		model (str): The model name.
+		entries (list): (key, record, persons) tuples.
+	"""
+	now = time.time()
+	with connection:
+		connection.executemany('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)', [
+			(key, model, record, json.dumps(persons, ensure_ascii=False), now) for key, record, persons in entries
+		])
+
+
+def new_stats():
+	"""
+	Returns the counters of a run.
+
+	Returns:
+		dict: The number of "hits", "misses" and "failures" (records without a valid response, not cached).
+	"""
+	return {"hits": 0, "misses": 0, "failures": 0}
+
+
+def report(stats):
+	"""
+	Prints the hit rate of a run.
+
+	Args:
+		stats (dict): The counters as returned by new_stats.
+
+	Returns:
+		float: The hit rate (0 if no records were looked up).
+	"""
+	total = stats["hits"] + stats["misses"]
+	rate = stats["hits"] / total if total else 0.0
+	print(f'Response cache: {stats["hits"]} hits, {stats["misses"]} misses ({rate:.1%} hit rate)')
+	if stats["failures"]:
+		print(f'Response cache: {stats["failures"]} records without a valid response were not cached')
+	return rate
@@ -0,0 +1,179 @@
+"""
+Router
+
+Most register lines follow the fixed format '<surname> (<initials> <prefix>) <job>, <street> <house number>.' and
+are parsed by rules without any doubt, only the lines with OCR damage, several persons or an unusual layout need the
+model. This module parses every record with the rule based lexer first (register_lexer.py), scores how well it
+matched the expected structure, and sends only the records with a low score to the model:
+
+- parse_record parses a record into a person ({"name", "jobTitle", "address"}, like the model returns) and scores it.
+  A record that does not contain exactly one name (surname followed by a parenthesis group) scores 0. Otherwise the
+  score starts at 1 and every sign of trouble takes off a penalty: a surname that is not capitalized, no initials or
+  more than four of them, an 'initial' of more than one letter, no street, no house number, a comma between the
+  street words (usually a capitalized job, e.g. 'Schilder, Kerkstraat') and every word or number that does not fit
+  the structure.
+- route returns the person of every record that scores at least THRESHOLD, and None for the others.
+- extract_routed asks the model only for the records that route could not parse, and merges the answers back into
+  the order of the records.
+
+Example:
+    stats = new_stats()
+    persons = await extract_routed(records, ask, THRESHOLD, stats)   # ask(records) returns the persons per record
+    report(stats)
+
+Functions:
+    - parse_record: Parses a record by rules and scores how well it matched.
+    - route: Returns the persons of the records that are parsed by rules, and None for the others.
+    - extract_routed: Parses the records by rules and asks the model for the others.
+    - new_stats: Returns the counters of a run.
+    - report: Prints the share of the records that was parsed by rules.
+"""
+
+from register_lexer import tokenize, split_by_name, SURNAME, INITIALS, PREFIX, JOB, STREET, HOUSENUMBER
+
+
+# Minimum score of a record that is parsed by rules instead of by the model
+THRESHOLD = 0.8
+
+# Penalties of the score of a record
+PENALTY_SURNAME = 0.3
+PENALTY_INITIALS = 0.3
+PENALTY_STREET = 0.4
+PENALTY_HOUSENUMBER = 0.15
+PENALTY_STREET_COMMA = 0.3
+PENALTY_STRAY_TOKEN = 0.2
+
+MAX_INITIALS = 4
+
+
+def _span(record, tokens):
+	# The text of the record from the first to the last token, with the period of an abbreviation at the end
+	end = tokens[-1].end
+	if record.startswith('.', end):
+		end += 1
+	return record[tokens[0].start:end]
+
+
+def parse_record(record):
+	"""
+	Parses a record by rules and scores how well it matched the expected structure, e.g.
+	'Jansen (A. B.) bakker, Hoofdstraat 12a.' gives
+	({"name": "Jansen (A. B.)", "jobTitle": "bakker", "address": "Hoofdstraat 12a"}, 1.0).
+
+	Args:
+		record (str): A register record.
+
+	Returns:
+		tuple: The person (a dictionary with "name", "jobTitle" and "address") and the score, between 0 and 1.
+			The person is None if the record does not contain exactly one name.
+	"""
+	names, _ = split_by_name(record)
+	if len(names) != 1:
+		return None, 0.0
+
+	tokens = tokenize(record)
+	parts = {SURNAME: [], INITIALS: [], PREFIX: [], JOB: [], STREET: [], HOUSENUMBER: []}
+	stray_tokens = 0
+	street_comma = False
+	for token in tokens:
+		if token.kind in parts:
+			parts[token.kind].append(token)
+		elif token.text.isalnum():
+			stray_tokens += 1
+		elif token.text == ',' and parts[STREET] and not parts[HOUSENUMBER]:
+			street_comma = True
+
+	score = 1.0
+	if not parts[SURNAME] or not parts[SURNAME][-1].text[0].isupper():
+		score -= PENALTY_SURNAME
+	initials = parts[INITIALS]
+	if not 1 <= len(initials) <= MAX_INITIALS or any(len(initial.text) > 1 for initial in initials):
+		score -= PENALTY_INITIALS
+	if not parts[STREET]:
+		score -= PENALTY_STREET
+	if not parts[HOUSENUMBER]:
+		score -= PENALTY_HOUSENUMBER
+	if street_comma:
+		score -= PENALTY_STREET_COMMA
+	score -= PENALTY_STRAY_TOKEN * stray_tokens
+
+	address_tokens = parts[STREET] + parts[HOUSENUMBER]
+	person = {
+		"name": names[0],
+		"jobTitle": _span(record, parts[JOB]) if parts[JOB] else "",
+		"address": record[address_tokens[0].start:address_tokens[-1].end] if address_tokens else ""
+	}
+	return person, max(score, 0.0)
+
+
+def route(records, threshold=THRESHOLD, stats=None):
+	"""
+	Parses the records by rules and returns the persons of the records that score at least the threshold.
+
+	Args:
+		records (list): The records.
+		threshold (float): Minimum score of a record that is parsed by rules.
+		stats (dict): Counters as returned by new_stats, updated with the number of records per route (optional).
+
+	Returns:
+		list: For every record a list with its person, or None if the record has to be asked to the model.
+	"""
+	routed = []
+	for record in records:
+		person, score = parse_record(record)
+		routed.append([person] if person is not None and score >= threshold else None)
+
+	if stats is not None:
+		llm = sum(persons is None for persons in routed)
+		stats["rules"] += len(routed) - llm
+		stats["llm"] += llm
+	return routed
+
+
+async def extract_routed(records, ask, threshold=THRESHOLD, stats=None):
+	"""
+	Parses the records by rules and asks the model for the records that could not be parsed.
+
+	Args:
+		records (list): The records.
+		ask (function): Coroutine function that returns the persons of every record of a list of records,
+			e.g. a partial of llm_client.extract_records.
+		threshold (float): Minimum score of a record that is parsed by rules.
+		stats (dict): Counters as returned by new_stats (optional).
+
+	Returns:
+		list: For every record the list of persons, in the order of the records.
+	"""
+	persons = route(records, threshold, stats)
+	uncertain = [index for index, record_persons in enumerate(persons) if record_persons is None]
+	if uncertain:
+		answers = await ask([records[index] for index in uncertain])
+		for index, record_persons in zip(uncertain, answers):
+			persons[index] = record_persons
+	return persons
+
+
+def new_stats():
+	"""
+	Returns the counters of a run.
+
+	Returns:
+		dict: The number of records parsed by "rules" and asked to the "llm".
+	"""
+	return {"rules": 0, "llm": 0}
+
+
+def report(stats):
+	"""
+	Prints the share of the records that was parsed by rules.
+
+	Args:
+		stats (dict): The counters as returned by new_stats.
+
+	Returns:
+		float: The share of the records parsed by rules (0 if there were no records).
+	"""
+	total = stats["rules"] + stats["llm"]
+	share = stats["rules"] / total if total else 0.0
+	print(f'Router: {stats["rules"]} records parsed by rules, {stats["llm"]} asked to the model ({share:.1%} by rules)')
+	return share
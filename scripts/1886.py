@@ -1,47 +1,10 @@
 import json
+import os
 import re
+import sys
 
-
-def open_json(path_to_json):
-	"""
-	Opens a JSON file and returns its content as a dictionary.
-
-	Args:
-		path_to_json (str): The path to the JSON file.
-
-	Returns:
-		dict: Parsed JSON data.
-	"""
-	try:
-		with open(path_to_json, 'r') as f:
-			data = json.load(f)
-		return data
-	except (FileNotFoundError, json.JSONDecodeError) as e:
-		print(f"Error opening or parsing JSON file: {e}")
-		return None
-
-
-def get_text(data, first_page, last_page):
-	"""
-	Extracts text content from specified pages in the JSON data.
-
-	Args:
-		data (dict): JSON data containing the content.
-		first_page (int): Starting page number (inclusive).
-		last_page (int): Ending page number (inclusive).
-
-	Returns:
-		str: Concatenated text from the specified pages.
-    """
-	first_page_index = first_page -1
-	last_page_index = last_page
-	text_list = []
-
-	for page in data['content'][first_page_index:last_page_index]:
-		text = page['text']
-		text_list.append(text)
-
-	return ''.join(text_list)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pages import iter_text, RAW
 
 
 def strip_text(text):
@@ -177,11 +140,12 @@ def make_json_object(name, job, address):
 
 # Main execution
 path_to_json = 'data/1886/text/1886.json'
-data = open_json(path_to_json)
 json_list = []
 
-if data:
-	text = get_text(data, first_page=44, last_page=191)
+# Concatenated text from the specified pages
+text = ''.join(iter_text(path_to_json, first_page=44, last_page=191, normalizers=RAW))
+
+if text:
 	text = strip_text(text)
 	text = text.replace('\n\n', '\n')
 	text_list = text.split('\n')
@@ -0,0 +1,287 @@
+"""
+Full-Text Search Index
+
+This script indexes the OCR'd text of all books, so a surname or street can be looked up across years
+without grepping the JSON files by hand. Every line of every page is stored with its year, page and line number
+in an SQLite FTS5 table.
+
+- Building the index is incremental: only books whose JSON file changed since the last build are (re)indexed,
+  so re-OCR'ing a book and running the build again only updates that book.
+- A query returns every matching line with the lines around it as context.
+
+Usage:
+    python search_index.py build
+    python search_index.py query "Jansen"
+    python search_index.py query "Ebbingestr*" --year 1926 --context 2
+
+Words are matched case-insensitively, 'word*' matches a prefix and '"two words"' matches a phrase. Every other
+word is quoted before it is passed to FTS5 (see quote_query), so punctuation like 'v. d.' or 'Jansen-Smit' is
+searched for as text instead of being read as query syntax.
+
+Line numbers are those of the OCR text. A word that is hyphenated at the end of a line is indexed on that line
+as the joined word, so it is found as one word, and its second part is not indexed again on the next line.
+
+Modules:
+    - sqlite3: For the FTS5 index.
+    - argparse: For the command line interface.
+
+Functions:
+    - open_index: Opens (and if needed creates) the index.
+    - index_lines: Returns the numbered lines of a page, with hyphenated words joined.
+    - index_book: (Re)indexes the lines of one book.
+    - build_index: Indexes every book in a directory that changed since the last build.
+    - quote_query: Turns a user query into an FTS5 query.
+    - search: Returns the lines matching a query, with context.
+"""
+
+import argparse
+import glob
+import os
+import re
+import sqlite3
+import time
+
+from pages import iter_pages
+
+
+# Version of the layout of the indexed lines, a build reindexes every book of an index with an older version
+INDEX_VERSION = 3
+
+QUERY_TERM_PATTERN = re.compile(r'"[^"]*"\*?|\S+')
+QUERY_OPERATORS = {'AND', 'OR', 'NOT'}
+
+
+def open_index(path_to_index):
+	"""
+	Opens the index, creating its tables if they do not exist yet.
+
+	Args:
+		path_to_index (str): Path to the SQLite file of the index.
+
+	Returns:
+		sqlite3.Connection: Connection to the index.
+	"""
+	connection = sqlite3.connect(path_to_index)
+	connection.executescript('''
+		CREATE TABLE IF NOT EXISTS books (
+			year TEXT PRIMARY KEY,
+			source_mtime TEXT,
+			source_size TEXT
+		);
+		CREATE TABLE IF NOT EXISTS lines (
+			id INTEGER PRIMARY KEY,
+			year TEXT,
+			page INTEGER,
+			position INTEGER,
+			line INTEGER,
+			text TEXT
+		);
+		CREATE INDEX IF NOT EXISTS lines_location ON lines (year, position, line);
+		CREATE VIRTUAL TABLE IF NOT EXISTS lines_fts USING fts5(text, content='lines', content_rowid='id');
+		CREATE TRIGGER IF NOT EXISTS lines_insert AFTER INSERT ON lines BEGIN
+			INSERT INTO lines_fts (rowid, text) VALUES (new.id, new.text);
+		END;
+		CREATE TRIGGER IF NOT EXISTS lines_delete AFTER DELETE ON lines BEGIN
+			INSERT INTO lines_fts (lines_fts, rowid, text) VALUES ('delete', old.id, old.text);
+		END;
+	''')
+	return connection
+
+
+def index_lines(text):
+	"""
+	Returns the non-empty lines of a page with their line number in the text. A word that is hyphenated at the end
+	of a line is joined on that line, like pages.join_hyphenated does, and the rest of the word is left out of the
+	next line, so every word is indexed once. Every line keeps its own line number.
+
+	Args:
+		text (str): The text of a page, as OCR'd.
+
+	Returns:
+		list: (line number, text) tuples.
+	"""
+	lines = text.split('\n')
+	numbered = []
+	consumed = 0
+	for line_number, line in enumerate(lines, 1):
+		# Leave out the rest of a word that was joined with the previous line
+		line = line[consumed:].lstrip() if consumed else line
+		consumed = 0
+		if line.endswith('-') and line_number < len(lines):
+			next_line = lines[line_number]
+			stripped = next_line.lstrip()
+			rest_of_word = stripped.split(' ', 1)[0]
+			line = line[:-1] + rest_of_word
+			consumed = len(next_line) - len(stripped) + len(rest_of_word)
+		if line.strip():
+			numbered.append((line_number, line))
+	return numbered
+
+
+def index_book(connection, path_to_json, year):
+	"""
+	(Re)indexes the lines of one book. Existing lines of the same year are replaced.
+
+	Args:
+		connection (sqlite3.Connection): Connection to the index.
+		path_to_json (str): The path to the JSON file of the book.
+		year (str): Year of the book.
+
+	Returns:
+		int: Number of indexed lines.
+	"""
+	stat = os.stat(path_to_json)
+	count = 0
+
+	with connection:
+		connection.execute('DELETE FROM lines WHERE year = ?', (year,))
+		# The lines are numbered before normalizing, so they match the lines of the OCR text
+		for page in iter_pages(path_to_json, normalizers=()):
+			rows = [
+				(year, page["page"], page["position"], line_number, line)
+				for line_number, line in index_lines(page["text"])
+			]
+			connection.executemany('INSERT INTO lines (year, page, position, line, text) VALUES (?, ?, ?, ?, ?)', rows)
+			count += len(rows)
+		connection.execute('INSERT OR REPLACE INTO books VALUES (?, ?, ?)', (year, str(stat.st_mtime_ns), str(stat.st_size)))
+
+	return count
+
+
+def build_index(path_to_books='book_text', path_to_index='book_text/search.db', force=False):
+	"""
+	Indexes every book (<year>.json) in a directory that is new or changed since the last build.
+	Books whose JSON file was removed are removed from the index.
+
+	Args:
+		path_to_books (str): Directory with the OCR JSON files, one per year.
+		path_to_index (str): Path to the SQLite file of the index.
+		force (bool): Reindex every book, also the unchanged ones.
+	"""
+	connection = open_index(path_to_index)
+	if connection.execute('PRAGMA user_version').fetchone()[0] < INDEX_VERSION:
+		force = True
+	indexed = {year: (mtime, size) for year, mtime, size in connection.execute('SELECT year, source_mtime, source_size FROM books')}
+	found = set()
+
+	for path_to_json in sorted(glob.glob(os.path.join(path_to_books, '*.json'))):
+		year = os.path.splitext(os.path.basename(path_to_json))[0]
+		found.add(year)
+		stat = os.stat(path_to_json)
+		if not force and indexed.get(year) == (str(stat.st_mtime_ns), str(stat.st_size)):
+			continue
+		count = index_book(connection, path_to_json, year)
+		print(f'Indexed {year}: {count} lines')
+
+	for year in set(indexed) - found:
+		with connection:
+			connection.execute('DELETE FROM lines WHERE year = ?', (year,))
+			connection.execute('DELETE FROM books WHERE year = ?', (year,))
+		print(f'Removed {year}')
+
+	connection.execute(f'PRAGMA user_version = {INDEX_VERSION}')
+	connection.close()
+
+
+def quote_query(query):
+	"""
+	Turns a user query into an FTS5 query: phrases in double quotes and the operators AND, OR and NOT are kept,
+	every other word is quoted as an FTS5 string, with a trailing '*' kept as a prefix search.
+
+	Args:
+		query (str): The user query, e.g. 'Jansen-Smit "v. d. Meer" Ebbingestr*'.
+
+	Returns:
+		str: The FTS5 query.
+	"""
+	terms = []
+	for term in QUERY_TERM_PATTERN.findall(query):
+		if term in QUERY_OPERATORS or (len(term) > 1 and term.startswith('"') and term.rstrip('*').endswith('"')):
+			terms.append(term)
+			continue
+		word = term.rstrip('*')
+		if word:
+			terms.append('"' + word.replace('"', '""') + '"' + ('*' if word != term else ''))
+	return ' '.join(terms)
+
+
+def search(query, path_to_index='book_text/search.db', year=None, context=1, limit=50):
+	"""
+	Returns the lines matching a query, with the lines around them on the same page as context.
+
+	Args:
+		query (str): Query, e.g. 'Jansen', 'Ebbingestr*' or '"Jansen A"' (see quote_query).
+		path_to_index (str): Path to the SQLite file of the index.
+		year (str): Only search this year, None for all years.
+		context (int): Number of lines before and after every hit.
+		limit (int): Maximum number of hits.
+
+	Returns:
+		list: One dictionary per hit with the keys "year", "page", "line", "text" and "context"
+			(list of (line number, text) tuples, the hit included).
+
+	Raises:
+		ValueError: If the query is not valid, e.g. an operator without a word after it.
+	"""
+	connection = open_index(path_to_index)
+	sql = '''
+		SELECT lines.year, lines.page, lines.position, lines.line, lines.text
+		FROM lines_fts JOIN lines ON lines.id = lines_fts.rowid
+		WHERE lines_fts MATCH ?
+	'''
+	parameters = [quote_query(query)]
+	if year is not None:
+		sql += ' AND lines.year = ?'
+		parameters.append(str(year))
+	sql += ' ORDER BY lines.year, lines.position, lines.line LIMIT ?'
+	parameters.append(limit)
+
+	try:
+		rows = connection.execute(sql, parameters).fetchall()
+	except sqlite3.OperationalError as e:
+		connection.close()
+		raise ValueError(f'Invalid query {query!r}: {e}')
+
+	hits = []
+	for hit_year, page, position, line, text in rows:
+		context_lines = connection.execute(
+			'SELECT line, text FROM lines WHERE year = ? AND position = ? AND line BETWEEN ? AND ? ORDER BY line',
+			(hit_year, position, line - context, line + context)
+		).fetchall()
+		hits.append({"year": hit_year, "page": page, "line": line, "text": text, "context": context_lines})
+
+	connection.close()
+	return hits
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Full-text search over the OCR'd books.")
+	parser.add_argument('--books', default='book_text', help='directory with the <year>.json files')
+	parser.add_argument('--index', default='book_text/search.db', help='path to the index')
+	subparsers = parser.add_subparsers(dest='command', required=True)
+
+	build_parser = subparsers.add_parser('build', help='index new and changed books')
+	build_parser.add_argument('--force', action='store_true', help='reindex every book')
+
+	query_parser = subparsers.add_parser('query', help='search the index')
+	query_parser.add_argument('query', help="query, e.g. Jansen, 'Ebbingestr*', '\"v. d. Meer\"'")
+	query_parser.add_argument('--year', help='only search this year')
+	query_parser.add_argument('--context', type=int, default=1, help='lines of context around every hit')
+	query_parser.add_argument('--limit', type=int, default=50, help='maximum number of hits')
+
+	args = parser.parse_args()
+
+	if args.command == 'build':
+		build_index(args.books, args.index, args.force)
+	else:
+		start = time.perf_counter()
+		try:
+			hits = search(args.query, args.index, args.year, args.context, args.limit)
+		except ValueError as e:
+			parser.exit(2, f'{e}\n')
+		for hit in hits:
+			print(f'{hit["year"]}, page {hit["page"]}, line {hit["line"]}:')
+			for line_number, text in hit["context"]:
+				marker = '>' if line_number == hit["line"] else ' '
+				print(f'  {marker} {text}')
+		print(f'{len(hits)} hits in {(time.perf_counter() - start) * 1000:.1f} ms')
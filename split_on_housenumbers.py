@@ -3,9 +3,20 @@ import os
 import pandas as pd
 from tqdm import tqdm
 from openai import Client,OpenAI
-import json
 import re
 import logging
+import asyncio
+import functools
+import argparse
+import hashlib
+
+import json_backend
+import llm_client
+import prompt_builder
+import response_cache
+import router
+from line_normalizer import remove_phone_numbers, normalize_housenumber_line
+from pages import iter_pages, SINGLE_LINE
 
 
 def System_Message(jsonschema):
@@ -50,14 +61,15 @@ def System_Message(jsonschema):
     return evaluated_system_prompt
 
 
-def Human_Message(record):
-
-    template = """jsonschema,
-    Record: {record}
-
+# The record comes last, so everything before it is the same for every request (see prompt_builder.py)
+HUMAN_TEMPLATE = """jsonschema,
     Please extract the relavent information from the given record.
+    Record: {record}
     """
-    prompt = PromptTemplate(template)
+
+
+def Human_Message(record):
+    prompt = PromptTemplate(HUMAN_TEMPLATE)
     
     evaluated_human_prompt = prompt.format(
                         record = record
@@ -66,24 +78,27 @@ def Human_Message(record):
     return evaluated_human_prompt
 
 
-def ask_llama(system, user):
+def ask_llama(system, user, response_format=None):
 	"""
 	Sends a system and user message to a language model and returns the model's response.
 
 	Args:
 		system (str): The system message providing context or instructions for the model.
 		user (str): The user message containing the query or input for the model.
+		response_format (dict): Format the response has to follow, e.g. a JSON schema (optional).
 
 	Returns:
 		str: The response generated by the language model based on the provided system and user messages.
 	"""
 	messages = [{"role": "system", "content": system},
 				{"role":"user","content":user}]
+	options = {"response_format": response_format} if response_format is not None else {}
 
 
 	completion = client.chat.completions.create(
 		model=MODEL, 
-		messages=messages
+		messages=messages,
+		**options
 	)
 
 	return completion.choices[0].message.content
@@ -105,49 +120,7 @@ schema = """
     """
 
 
-def load_json(path_to_json):
-	"""
-	Opens a JSON file and returns its content as a dictionary.
-
-	Args:
-		path_to_json (str): The path to the JSON file.
-
-	Returns:
-		dict: Parsed JSON data.
-	"""
-	try:
-		with open(path_to_json, 'r') as f:
-			data = json.load(f)
-		return data
-	except (FileNotFoundError, json.JSONDecodeError) as e:
-		print(f"Error loading JSON file: {e}")
-		return None
-
-
-def get_text(data, first_page, last_page):
-	"""
-	Extracts text content from specified pages in the JSON data.
-
-	Args:
-		data (dict): JSON data containing the content.
-		first_page (int): Starting page number (inclusive).
-		last_page (int): Ending page number (inclusive).
-
-	Returns:
-		list: Text from the specified pages.
-    """
-	first_page_index = first_page -1
-	last_page_index = last_page
-	text_list = []
-
-	for page in data['content'][first_page_index:last_page_index]:
-		text = page['text'].replace('\n\n', '\n')
-		text = text.replace('-\n', '')
-		text = text.replace('\n', '')
-		text_list.append(text)
-		text = text.replace('{', '(')
-
-	return text_list
+STRIP_PATTERN = re.compile(r"[^a-zA-Z0-9\s,.\n'\-\(\)\{\}]")
 
 
 def strip_text(text):
@@ -160,8 +133,7 @@ def strip_text(text):
 	Returns:
 		str: Cleaned text.
 	"""
-	regex = re.compile(r"[^a-zA-Z0-9\s,.\n'\-\(\)\{\}]")
-	return regex.sub('', text)
+	return STRIP_PATTERN.sub('', text)
 
 
 def split_by_housenumbers(text):
@@ -213,189 +185,363 @@ def split_text_with_housenumbers_included(text):
 	return result
 
 
-def remove_phone_numbers(text):
+def fix_ocr_mistakes(text):
+	"""
+	Fixes OCR mistakes where the letter 'J' is mistaken for ')' or '}'.
+	The function assumes the mistakes are in between '()' parentheses.
+	"""
+	return re.sub(r'\(([^)]*)\)', lambda x: f'({x.group(1).replace(")", "J.").replace("}", "J.")})', text)
+
+
+def make_page_json(year, page_number, person_list):
+	"""
+    Creates a dictionary (representing a JSON object) for a page containing information about a specific year,
+    page number, and a list of people.
+
+    Args:
+        year (int): The year associated with the page.
+        page_number (int): The page number within the document or register.
+        person_list (list): A list of people (could be represented as dictionaries or any other structure) 
+                            associated with the page.
+
+    Returns:
+        dict: A dictionary representing the page, containing the year, page number, and the list of people.
+
+    Example:
+        year = 2024
+        page_number = 5
+        person_list = [{"name": "John Doe", "age": 30}, {"name": "Jane Smith", "age": 28}]
+        result = make_page_json(year, page_number, person_list)
+        print(result)
+        # Output: {'year': 2024, 'page': 5, 'register': [{'name': 'John Doe', 'age': 30}, {'name': 'Jane Smith', 'age': 28}]}
+    """
+	page_object = {
+			"year": year,
+			"page": page_number,
+			"register": person_list
+	}
+	return page_object
+
+
+def get_page_records(page):
 	"""
-	Removes phone numbers from the string. Phone numbers are formatted like 
-	'tel. 31033' (e.g., 'tel. ' followed by a number).
+	Splits the text of a page (joined into one line) into the records that are sent to the model: the segments
+	that end with a housenumber and contain a parenthesis, without phone numbers and normalized.
 
 	Args:
-		text (str): The input string from which to remove phone numbers.
+		page (str): The text of a page.
 
 	Returns:
-		str: The text with phone numbers removed.
+		list: The normalized records of the page.
 	"""
-    # Regex pattern to match phone numbers like 'tel. 31033'
-	pattern = r'\b(?:[Tt]el|[Tt]elef|[Tt]elefoon)\.\s*\d+\b'
-    
-    # Remove all occurrences of the pattern
-	return re.sub(pattern, '', text)
+	records = []
+	page = strip_text(page)
+	page_list = split_text_with_housenumbers_included(page)
+	with_parentheses = [line for line in page_list if '(' in line or ')' in line]
 
+	for i in with_parentheses:
+		i = i.strip()
+		line = remove_phone_numbers(i)
+		if len(line) > 15 and len(line) < 150:
+			records.append(normalize_housenumber_line(line))
 
-def add_spaces(sentence):
-    """
-    Adds spaces after periods if missing.
+	return records
 
-    Args:
-        sentence (str): The input sentence.
 
-    Returns:
-        str: Formatted sentence with proper spacing.
-    """
-    sentence = re.sub(r'(?<=[.])(?=[^\s])', r' ', sentence)
-    sentence = re.sub(r'\s+', ' ', sentence)
-    
-    return sentence
+def parse_output(output):
+	"""
+	Returns the JSON objects in the response of the model. Objects that are not valid JSON are skipped.
 
+	Args:
+		output (str): The response of the model.
 
-def dot_initials(string):
+	Returns:
+		list: The parsed objects.
 	"""
-    Converts a string with capitalized words into a format where each word is followed by a dot.
-    This function adds spaces between words and places dots after each initial capital letter.
+	return llm_client.parse_objects(output)
 
-    Args:
-        string (str): The input string that may contain one or more capitalized words.
 
-    Returns:
-        str: The input string transformed with added spaces between words and dots after each initial letter.
+def get_page_path(year, page_number):
+	"""
+	Returns the path of the output file of a page, e.g. 'register/1926/1926_121.json'.
 
-    Example:
-        input_string = "ThisIsAString"
-        result = dot_initials(input_string)
-        print(result)  # Output: "This. Is. A. String."
-    """
-	return re.sub(r'(?<=[A-Z])(?!\.)\b', '.', add_spaces(string))
+	Args:
+		year (str): The year of the book.
+		page_number (int): The page number.
+
+	Returns:
+		str: The path of the JSON file.
+	"""
+	return f'register/{year}/{year}_{page_number}.json'
 
 
-def fix_initials_dot(line):
+def run_fingerprint(prompts):
 	"""
-    Fixes initials by adding a period after the first capital letter.
+	Returns the fingerprint of the settings that decide the output of a page: the model, the prompts and the
+	extraction modes. A page that was written with another fingerprint is done again.
 
-    This function searches for pairs of an uppercase letter followed by a lowercase letter 
-    (e.g., "A" followed by "b") in a string and adds a period after the uppercase letter, 
-    effectively converting them into initials (e.g., "A." for "Ab").
+	Args:
+		prompts (dict): The prompts as returned by prompt_builder.build_prompts.
 
-    Args:
-        line (str): The input string, which may contain initials or names.
+	Returns:
+		str: The fingerprint.
+	"""
+	version = llm_client.records_version(prompts, batch_size if use_async else 1, structured_output)
+	settings = [MODEL, version, f'router={router_threshold if use_router else None}', f'batch_size={batch_size if use_async else 1}']
+	return hashlib.sha256('\0'.join(settings).encode('utf-8')).hexdigest()[:16]
 
-    Returns:
-        str: The string with corrected initials, where a period is added after the first capital letter.
-    """
-	pattern = r'\b([A-Z])([a-z])\b'
-	return re.sub(pattern, r'\1.', line)
 
+def page_fingerprint(fingerprint, page):
+	"""
+	Returns the fingerprint of a page: the fingerprint of the run and the text of the page, so a page is also done
+	again when its OCR text changed.
 
-def fix_ocr_mistakes(text):
+	Args:
+		fingerprint (str): The fingerprint as returned by run_fingerprint.
+		page (str): The text of the page.
+
+	Returns:
+		str: The fingerprint of the page.
 	"""
-	Fixes OCR mistakes where the letter 'J' is mistaken for ')' or '}'.
-	The function assumes the mistakes are in between '()' parentheses.
+	return hashlib.sha256(f'{fingerprint}\0{page}'.encode('utf-8')).hexdigest()[:16]
+
+
+def is_page_done(year, page_number, fingerprint):
 	"""
-	return re.sub(r'\(([^)]*)\)', lambda x: f'({x.group(1).replace(")", "J.").replace("}", "J.")})', text)
+	Checks whether a page was completed with the same fingerprint. The completion marker of a page
+	(<page file>.done) contains its fingerprint and is written after the page file.
 
+	Args:
+		year (str): The year of the book.
+		page_number (int): The page number.
+		fingerprint (str): The fingerprint as returned by page_fingerprint.
 
-def replace_digits_parentheses(text):
+	Returns:
+		bool: True if the page does not have to be done again.
 	"""
-    Replaces occurrences of specific digits inside parentheses with the letter 'J'.
-    Specifically, it replaces the digit '1' with 'J.', and '3' or '4' with 'J', within parentheses.
+	json_filename = get_page_path(year, page_number)
+	try:
+		with open(json_filename + '.done', encoding='utf-8') as f:
+			return f.read().strip() == fingerprint and os.path.exists(json_filename)
+	except FileNotFoundError:
+		return False
 
-    Args:
-        text (str): The input string containing text with parentheses and digits.
 
-    Returns:
-        str: The updated text where the specified digits inside parentheses are replaced with 'J'.
+def _write_atomic(path, write):
+	# Writes to a temporary file first, so a crash never leaves a half written file behind
+	temporary_path = path + '.tmp'
+	write(temporary_path)
+	os.replace(temporary_path, path)
 
-    Example:
-        input_text = "This is a test (H. 1) and another (value 3)."
-        result = replace_digits_parentheses(input_text)
-        print(result)  # Output: "This is a test (H. J.) and another (value J)."
-    """
-    # Replace (1) with J, handling cases like (H. 1)
-	updated_text = re.sub(r'\(.*[134].*\)', lambda match: match.group(0).replace('1', 'J.').replace('3', 'J').replace('4', 'J'), text)
-	return updated_text
 
+def write_page(year, page_number, person_list, fingerprint=None):
+	"""
+	Writes the persons of a page to register/<year>/<year>_<page_number>.json, and marks the page as completed
+	when a fingerprint is given.
 
-def make_page_json(year, page_number, person_list):
+	Args:
+		year (str): The year of the book.
+		page_number (int): The page number.
+		person_list (list): The persons found on the page.
+		fingerprint (str): The fingerprint of the page, as returned by page_fingerprint (optional).
 	"""
-    Creates a dictionary (representing a JSON object) for a page containing information about a specific year,
-    page number, and a list of people.
+	page_object = make_page_json(year, page_number, person_list)
+	json_filename = get_page_path(year, page_number)
+	os.makedirs(os.path.dirname(json_filename), exist_ok=True)
 
-    Args:
-        year (int): The year associated with the page.
-        page_number (int): The page number within the document or register.
-        person_list (list): A list of people (could be represented as dictionaries or any other structure) 
-                            associated with the page.
+	_write_atomic(json_filename, lambda path: json_backend.dump(page_object, path))
+	if fingerprint is not None:
+		def write_marker(path):
+			with open(path, 'w', encoding='utf-8') as f:
+				f.write(fingerprint + '\n')
+		_write_atomic(json_filename + '.done', write_marker)
 
-    Returns:
-        dict: A dictionary representing the page, containing the year, page number, and the list of people.
 
-    Example:
-        year = 2024
-        page_number = 5
-        person_list = [{"name": "John Doe", "age": 30}, {"name": "Jane Smith", "age": 28}]
-        result = make_page_json(year, page_number, person_list)
-        print(result)
-        # Output: {'year': 2024, 'page': 5, 'register': [{'name': 'John Doe', 'age': 30}, {'name': 'Jane Smith', 'age': 28}]}
-    """
-	page_object = {
-			"year": year,
-			"page": page_number,
-			"register": person_list
-	}
-	return page_object
+def pending_pages(year, pages, fingerprint, force=(), progress=None):
+	"""
+	Yields the pages that were not completed with the same fingerprint, or that are forced. Skipped pages are
+	counted on the progress bar. Pages are numbered by their "page" number in the book, which can differ from their
+	position when pages are missing from the JSON file; a page without a number gets its position.
+
+	Args:
+		year (str): The year of the book.
+		pages (iterable): The page objects, as yielded by pages.iter_pages.
+		fingerprint (str): The fingerprint as returned by run_fingerprint.
+		force (set): Page numbers that are done again anyway, or None to do all pages again.
+		progress (tqdm): Progress bar (optional).
+
+	Yields:
+		tuple: The page number, the text and the fingerprint of the page.
+	"""
+	for page in pages:
+		page_number = page["page"] if page["page"] is not None else page["position"]
+		fingerprint_of_page = page_fingerprint(fingerprint, page["text"])
+		if force is not None and page_number not in force and is_page_done(year, page_number, fingerprint_of_page):
+			if progress is not None:
+				progress.update()
+			continue
+		yield page_number, page["text"], fingerprint_of_page
+
+
+def parse_page_list(text):
+	"""
+	Parses a list of pages like '121,125-127' (or 'all').
+
+	Args:
+		text (str): The list of pages.
+
+	Returns:
+		set: The page numbers, or None for 'all'.
+	"""
+	if text.strip() == 'all':
+		return None
+	pages = set()
+	for part in text.split(','):
+		if not part.strip():
+			continue
+		first, _, last = part.partition('-')
+		pages.update(range(int(first), int(last or first) + 1))
+	return pages
+
+
+async def extract_pages_async(year, numbered_pages, prompts, cache=None, stats=None, progress=None):
+	"""
+	Asks the model for all records of the pages concurrently and writes the pages in order. The records of several
+	pages are in flight at the same time, bounded by llm_client.CONCURRENCY.
+
+	Args:
+		year (str): The year of the book.
+		numbered_pages (iterable): The page number, text (joined into one line) and fingerprint of every page,
+			as yielded by pending_pages.
+		prompts (dict): The prompts as returned by prompt_builder.build_prompts.
+		cache (sqlite3.Connection): Connection to the response cache (optional).
+		stats (dict): Counters of the cache and the router, as returned by response_cache.new_stats and
+			router.new_stats (optional).
+		progress (tqdm): Progress bar that is updated after every page (optional).
+	"""
+	# With several endpoints the requests are spread over them, and so many more can be in flight
+	async_client = llm_client.make_async_client(ENDPOINTS, APIKEY)
+	concurrency = llm_client.CONCURRENCY * len(ENDPOINTS)
+	if adaptive_concurrency:
+		semaphore = llm_client.AdaptiveLimiter(maximum=concurrency)
+	else:
+		semaphore = asyncio.Semaphore(concurrency)
+
+	async def extract_page(numbered_page):
+		page_number, page, fingerprint = numbered_page
+		records = get_page_records(page)
+		# Counters of this page, so a page with failed records is not marked as completed
+		page_stats = {**response_cache.new_stats(), **router.new_stats()}
+		ask = functools.partial(
+			llm_client.extract_records, async_client, prompts, semaphore=semaphore, parse=parse_output,
+			batch_size=batch_size, model=MODEL, cache=cache, stats=page_stats, structured=structured_output
+		)
+		if use_router:
+			# Only the records that the rules cannot parse are asked to the model
+			persons = await router.extract_routed(records, ask, router_threshold, page_stats)
+		else:
+			persons = await ask(records)
+		if stats is not None:
+			for key, value in page_stats.items():
+				stats[key] += value
+		if page_stats["failures"]:
+			fingerprint = None
+		return page_number, fingerprint, [person for record_persons in persons for person in record_persons]
+
+	async for page_number, fingerprint, person_list in llm_client.map_ordered(extract_page, numbered_pages, llm_client.PAGE_WINDOW):
+		# A page with records without a valid response is written, but done again in the next run
+		write_page(year, page_number, person_list, fingerprint)
+		if progress is not None:
+			progress.update()
+
+	if adaptive_concurrency:
+		semaphore.report()
+	if len(ENDPOINTS) > 1:
+		async_client.report()
+	await async_client.close()
 
 
 BASEURL = 'http://localhost:8000/v1/'
 APIKEY = 'EMPTY'
 MODEL = "meta-llama/Llama-3.1-8B-Instruct"
+# Servers (e.g. one vLLM replica per machine) that the async mode spreads its requests over
+ENDPOINTS = [BASEURL]
 
 client = OpenAI(base_url=BASEURL,api_key=APIKEY)
 
 year = "1926"
 path_to_json = f"book_text/{year}.json"
 
-# Load the JSON data from the specified path
-data = load_json(path_to_json)
 first_page, last_page = 121, 131
 
+# The modes below are off by default, so a plain run behaves like the original sync extractor and its output
+# can be compared with earlier runs. Switch them on one at a time and check the output against a run without them.
+# Send the records concurrently with the async client (False: one record at a time)
+use_async = False
+# Adjust the number of requests in flight to the load of the server (False: always llm_client.CONCURRENCY)
+adaptive_concurrency = False
+# Number of records per request in async mode (1: one record per request). Batching is a mode of its own,
+# set it to e.g. llm_client.BATCH_SIZE to switch it on
+batch_size = 1
+# Take the records that were asked before from the response cache (async mode)
+use_cache = False
+# Constrain the responses to the person schema (llm_client.RECORD_SCHEMA) instead of scraping JSON from free text
+structured_output = False
+# Parse the records by rules first and ask the model only for the uncertain ones (async mode)
+use_router = False
+router_threshold = router.THRESHOLD
+
 logging.basicConfig(level=logging.ERROR)
 
-# Proceed if data is loaded successfully
-if data:
-	# Get text from specified pages
-	text_list = get_text(data, first_page, last_page)
-
-	# Process each page
-	for index, page in tqdm(enumerate(text_list), total=len(text_list), desc='Processing Pages', unit='page', ncols=100):
-		person_list = []
-		page_number = index + first_page
-		page = strip_text(page)
-		page_list = split_text_with_housenumbers_included(page)
-		with_parentheses = [line for line in page_list if '(' in line or ')' in line]
-
-		for i in with_parentheses:
-			i = i.strip()
-			line = remove_phone_numbers(i)
-			if len(line) > 15 and len(line) < 150:
-				line_dotted = dot_initials(line)
-				line_starts_with_letter = re.sub(r'^[^a-zA-Z]+', '', line_dotted)
-				line_fixed_parentheses = replace_digits_parentheses(line_starts_with_letter)
-
-				user = Human_Message(line_fixed_parentheses)
-				system = System_Message(jsonschema=schema)
-				output = ask_llama(system, user)
-
-				json_objects = re.findall(r'\{.*?\}', output, re.DOTALL)
-				for obj in json_objects:
-					try:
-						person_list.append(json.loads(obj))
-					except json.JSONDecodeError as e:
-						pass
-
-		page_object = json.dumps(make_page_json(year, page_number, person_list), indent=4)
-		output_directory = f"register/{year}"
-		os.makedirs(output_directory, exist_ok=True)
-		json_filename = f'{output_directory}/{year}_{page_number}.json'
-
-		with open(json_filename, 'w+') as output_file:
-			output_file.write(page_object)
-
-		output_file.close()
\ No newline at end of file
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='Extracts the persons of a range of pages with the model. Pages that '
+									 'were completed with the same model and prompts are skipped.')
+	parser.add_argument('--force', type=parse_page_list, default=set(), metavar='PAGES',
+						help="pages to do again even if they are completed, e.g. '121,125-127', or 'all'")
+	args = parser.parse_args()
+
+	# Stream the specified pages with their page numbers, the text of every page joined into one line
+	book_pages = iter_pages(path_to_json, first_page, last_page, normalizers=SINGLE_LINE)
+
+	# Render the prompts once, every request starts with the same system message and user prefix
+	prompts = prompt_builder.build_prompts(System_Message(jsonschema=schema), HUMAN_TEMPLATE)
+	prompt_builder.report_static_tokens(prompts, ENDPOINTS[0], MODEL)
+	fingerprint = run_fingerprint(prompts)
+
+	if use_async:
+		cache = response_cache.open_cache() if use_cache else None
+		stats = {**response_cache.new_stats(), **router.new_stats()}
+		with tqdm(total=last_page - first_page + 1, desc='Processing Pages', unit='page', ncols=100) as progress:
+			numbered_pages = pending_pages(year, book_pages, fingerprint, args.force, progress)
+			asyncio.run(extract_pages_async(year, numbered_pages, prompts, cache, stats, progress))
+		if use_router:
+			router.report(stats)
+		if cache is not None:
+			response_cache.report(stats)
+			cache.close()
+	else:
+		# Process each page that is not completed yet
+		with tqdm(total=last_page - first_page + 1, desc='Processing Pages', unit='page', ncols=100) as progress:
+			for page_number, page, fingerprint_of_page in pending_pages(year, book_pages, fingerprint, args.force, progress):
+				person_list = []
+				failed = False
+
+				for line_fixed_parentheses in get_page_records(page):
+					user = prompt_builder.user_message(prompts, line_fixed_parentheses)
+					if not structured_output:
+						person_list.extend(parse_output(ask_llama(prompts["system"], user)))
+						continue
+
+					# Ask again if the response does not follow the schema
+					record_format = llm_client.json_schema_format(llm_client.RECORD_SCHEMA, "record")
+					for _ in range(llm_client.STRUCTURED_RETRIES + 1):
+						persons = llm_client.parse_structured(ask_llama(prompts["system"], user, record_format))
+						if persons is not None:
+							person_list.extend(persons)
+							break
+					else:
+						failed = True
+
+				# A page with records without a valid response is not marked as completed, so it is done again
+				write_page(year, page_number, person_list, None if failed else fingerprint_of_page)
+				progress.update()
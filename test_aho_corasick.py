@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+from aho_corasick import build_automaton, find_longest
+
+
+def reference(patterns, line):
+	found = [pattern for pattern in patterns if pattern in line]
+	return max(found, key=len) if found else None
+
+
+def random_word(rng, alphabet, longest):
+	return ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, longest)))
+
+
+def test_examples():
+	patterns = ['bakker', 'banketbakker', 'kapper', 'koopman', 'bak', 'man']
+	automaton = build_automaton(patterns)
+	assert find_longest(automaton, 'Jansen (A.) banketbakker, Kerkstraat 12') == 'banketbakker'
+	assert find_longest(automaton, 'Vries (J.) koopman') == 'koopman'
+	assert find_longest(automaton, 'Smit (K.) arts') is None
+	assert find_longest(build_automaton([]), 'bakker') is None
+
+
+def test_ties_go_to_the_first_pattern():
+	patterns = ['abc', 'bcd', 'ab']
+	assert find_longest(build_automaton(patterns), 'xabcdx') == 'abc'
+	assert find_longest(build_automaton(patterns[::-1]), 'xabcdx') == 'bcd'
+
+
+def test_empty_pattern_matches_every_line():
+	patterns = ['', 'ab']
+	automaton = build_automaton(patterns)
+	assert find_longest(automaton, 'xyz') == ''
+	assert find_longest(automaton, 'xaby') == 'ab'
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_find_longest_matches_reference(seed):
+	rng = random.Random(seed)
+	# A small alphabet, so patterns overlap and share prefixes and suffixes
+	alphabet = 'abc '
+	patterns = [random_word(rng, alphabet, 6) for _ in range(rng.randint(1, 40))]
+	if seed % 3 == 0:
+		patterns.append('')
+	automaton = build_automaton(patterns)
+	for _ in range(500):
+		line = random_word(rng, alphabet, 30)
+		assert find_longest(automaton, line) == reference(patterns, line), (patterns, line)
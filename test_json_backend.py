@@ -0,0 +1,52 @@
+import json
+import random
+
+import pytest
+
+from json_backend import iter_items
+
+
+def random_value(rng, depth=0):
+	kind = rng.choice(['int', 'float', 'exponent', 'string', 'literal', 'list', 'dict'] if depth < 3 else
+		['int', 'float', 'exponent', 'string', 'literal'])
+	if kind == 'int':
+		return rng.randint(-10**6, 10**6)
+	if kind == 'float':
+		return round(rng.uniform(-1000, 1000), rng.randint(1, 6))
+	if kind == 'exponent':
+		return rng.uniform(-1, 1) * 10 ** rng.randint(-30, 30)
+	if kind == 'string':
+		return ''.join(rng.choice('ab -"\\\në.e1') for _ in range(rng.randint(0, 8)))
+	if kind == 'literal':
+		return rng.choice([True, False, None])
+	if kind == 'list':
+		return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+	return {f'k{i}': random_value(rng, depth + 1) for i in range(rng.randint(0, 4))}
+
+
+@pytest.mark.parametrize('chunk_size', range(1, 8))
+@pytest.mark.parametrize('seed', range(20))
+def test_iter_items_matches_json_load(tmp_path, chunk_size, seed):
+	rng = random.Random(seed)
+	book = {
+		'year': rng.choice([1926, 1.5e3, '1926']),
+		'content': [random_value(rng) for _ in range(rng.randint(0, 12))],
+		'last': rng.choice([0.5, 1e-05, -2.25E+10, 7]),
+	}
+	path = tmp_path / 'book.json'
+	path.write_text(json.dumps(book, indent=rng.choice([None, 4])), encoding='utf-8')
+
+	header = {}
+	items = list(iter_items(path, 'content', header=header, chunk_size=chunk_size))
+
+	expected = json.loads(path.read_text(encoding='utf-8'))
+	assert items == expected['content']
+	assert header == {key: value for key, value in expected.items() if key != 'content'}
+
+
+@pytest.mark.parametrize('chunk_size', range(1, 8))
+def test_number_split_after_dot_or_exponent(tmp_path, chunk_size):
+	path = tmp_path / 'book.json'
+	path.write_text('{"content": [1.5, 12.25, 3e5, 4E-7, -0.125, 6.0e+2, 10]}', encoding='utf-8')
+
+	assert list(iter_items(path, chunk_size=chunk_size)) == [1.5, 12.25, 3e5, 4E-7, -0.125, 6.0e+2, 10]
@@ -0,0 +1,47 @@
+import random
+
+import pytest
+
+from benchmark_normalize import register_chain, housenumber_chain
+from line_normalizer import remove_phone_numbers, normalize_register_line, normalize_housenumber_line
+
+
+EXAMPLES = [
+	'Jansen (A.) bakker, Kerkstraat 12',
+	'Vries (de), J.H. koopman, Hoofdstr.3',
+	'Bakker ( Ab Cd ) timmerman,Wal 4',
+	'Smit (J. ) ) kapper  Molenweg\t7',
+	'( ) Pietersen (P.  J.K.) arts Tel. 31033',
+	'Berg (1. 3.) v. d., winkelier, Markt 4a',
+	'...12 Willems (H) Hz. melkslijter',
+	'',
+	'   ',
+]
+
+# Characters the cleanup steps react to, with some letters and digits
+ALPHABET = 'ABJKabjk134.() \t)(.'
+
+
+def random_lines(seed, count=2000):
+	rng = random.Random(seed)
+	for _ in range(count):
+		yield ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 24)))
+
+
+@pytest.mark.parametrize('line', EXAMPLES)
+def test_examples(line):
+	assert normalize_register_line(line) == register_chain(line)
+	line = remove_phone_numbers(line.strip())
+	assert normalize_housenumber_line(line) == housenumber_chain(line)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_register_line_matches_original_chain(seed):
+	for line in random_lines(seed):
+		assert normalize_register_line(line) == register_chain(line), line
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_housenumber_line_matches_original_chain(seed):
+	for line in random_lines(seed):
+		assert normalize_housenumber_line(line) == housenumber_chain(line), line
@@ -0,0 +1,67 @@
+import random
+import re
+
+import pytest
+
+from register_lexer import split_by_name, split_by_initials_with_context
+
+
+# The regexes that register_lexer.py replaces, as they were in extract_with_llm.py and extract_good_lines.py
+def original_split_by_name(text):
+	pattern = r'([A-Za-zÀ-ÿ]+(?:\s?\([^\)]*\)))\s*(.*?)(?=[A-Za-zÀ-ÿ]+\s?\([^\)]*\)|$)'
+	matches = re.findall(pattern, text)
+	return [match[0].strip() for match in matches], [match[1].strip() for match in matches]
+
+
+def original_split_by_initials_with_context(text):
+	pattern = r'([A-Za-zÀ-ÿ]+(?:\s?\([^\)]*\)))[^A-Za-zÀ-ÿ]*'
+	spans = [(match.start(), match.end()) for match in re.finditer(pattern, text)]
+	segments = []
+	for i, (start, end) in enumerate(spans):
+		next_start = spans[i + 1][0] if i + 1 < len(spans) else len(text)
+		segments.append(text[start:next_start].strip())
+	return segments
+
+
+EXAMPLES = [
+	'Jansen (A.) bakker, Kerkstraat 12',
+	'Jansen (A.) bakker, Kerkstraat 12 Vries (de), J.H. koopman, Hoofdstr. 3',
+	'Berg(P. v. d.)winkelier Markt 4a Bos  (K.) arts',
+	'Müller (É.) kapper ((( Wal 4 ) Smit (',
+	'no names here 12',
+	'(A.) Jansen',
+	'',
+]
+
+# Letters, accented letters, whitespace, parentheses and other characters of register lines
+ALPHABET = 'AbéÀ ÿ( ) (\t).,12-'
+
+
+def random_lines(seed, count=2000):
+	rng = random.Random(seed)
+	for _ in range(count):
+		yield ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 24)))
+
+
+@pytest.mark.parametrize('line', EXAMPLES)
+def test_examples(line):
+	assert split_by_name(line) == original_split_by_name(line)
+	assert split_by_initials_with_context(line) == original_split_by_initials_with_context(line)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_split_by_name_matches_original_regex(seed):
+	for line in random_lines(seed):
+		assert split_by_name(line) == original_split_by_name(line), line
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_split_by_initials_with_context_matches_original_regex(seed):
+	for line in random_lines(seed):
+		assert split_by_initials_with_context(line) == original_split_by_initials_with_context(line), line
+
+
+def test_long_garbage_line():
+	line = 'a' * 20000 + '(' * 20000
+	assert split_by_name(line) == ([], [])
+	assert split_by_initials_with_context(line) == []
@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+pytest.importorskip('llama_index.core')
+pytest.importorskip('pandas')
+
+import split_on_housenumbers
+from pages import iter_pages, SINGLE_LINE
+
+
+@pytest.fixture
+def book(tmp_path, monkeypatch):
+	# Page 123 is missing from the book, and the last page has no page number
+	content = [
+		{"page": 121, "text": "Jansen (A.) bakker, Kerkstraat 12"},
+		{"page": 122, "text": "Vries (J.) koopman, Hoofdstraat 3"},
+		{"page": 124, "text": "Smit (K.) kapper, Wal 4"},
+		{"text": "Bos (P.) arts, Markt 1"},
+	]
+	path = tmp_path / '1926.json'
+	path.write_text(json.dumps({"year": 1926, "content": content}), encoding='utf-8')
+	# The output files are written relative to the working directory
+	monkeypatch.chdir(tmp_path)
+	return str(path)
+
+
+def page_numbers(book, force=()):
+	pages = iter_pages(book, normalizers=SINGLE_LINE)
+	return [page_number for page_number, _, _ in split_on_housenumbers.pending_pages('1926', pages, 'run', force)]
+
+
+def test_pages_are_numbered_by_their_page_number(book):
+	assert page_numbers(book) == [121, 122, 124, 4]
+
+
+def test_completed_page_is_skipped_by_its_page_number(book):
+	for page_number, text, fingerprint in split_on_housenumbers.pending_pages('1926', iter_pages(book, normalizers=SINGLE_LINE), 'run'):
+		if page_number == 124:
+			split_on_housenumbers.write_page('1926', page_number, [], fingerprint)
+
+	assert page_numbers(book) == [121, 122, 4]
+	assert page_numbers(book, force={124}) == [121, 122, 124, 4]
+	assert page_numbers(book, force=None) == [121, 122, 124, 4]